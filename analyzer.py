@@ -1,56 +1,82 @@
 from collections import Counter
-from log_parser import extract_path
 from security import SecurityAnalyzer
-import re
-import datetime
+from sketches import SpaceSaving, HyperLogLog
+from rollups import RollupStore
+from geoip import get_database
+from latency import LatencyStats
 
 class LogAnalyzer:
-    def __init__(self, filter_bots=False, start_date=None, end_date=None):
+    def __init__(self, filter_bots=False, start_date=None, end_date=None, sketch_capacity=None, security_rules=None,
+                 geoip_database=None, security_analyzer=None):
         self.total_requests = 0
-        self.ips = Counter()
         self.status_codes = Counter()
-        self.paths = Counter()
         self.total_bytes = 0
         self.hours = Counter()
-        self.user_agents = Counter()
-        self.referers = Counter()
         self.filter_bots = filter_bots
+
+        # Per-minute/hour/day buckets for the time series and date-range queries
+        self.rollups = RollupStore()
+
+        # Sketch mode: bounded-memory top-K summaries instead of exact Counters.
+        # sketch_capacity is the number of keys tracked per dimension (None = exact).
+        self.sketch_capacity = sketch_capacity
+        if sketch_capacity:
+            self.ips = SpaceSaving(sketch_capacity)
+            self.paths = SpaceSaving(sketch_capacity)
+            self.user_agents = SpaceSaving(sketch_capacity)
+            self.referers = SpaceSaving(sketch_capacity)
+            self.unique_ips = HyperLogLog()
+        else:
+            self.ips = Counter()
+            self.paths = Counter()
+            self.user_agents = Counter()
+            self.referers = Counter()
+            self.unique_ips = None
         
         # Date Filter (datetime objects)
         self.start_date = start_date
         self.end_date = end_date
+        # Compared against record.timestamp so no datetime has to be built per line
+        self.start_ts = start_date.timestamp() if start_date else None
+        self.end_ts = end_date.timestamp() if end_date else None
         
-        # Security
-        self.security_analyzer = SecurityAnalyzer()
+        # Security; an existing SecurityAnalyzer (built with the same rules) may be shared between
+        # short-lived analyzers, so its signatures and user agent cache are set up only once
+        self.security_analyzer = security_analyzer or SecurityAnalyzer(rules_file=security_rules)
+        self.shared_security = security_analyzer is not None
         self.threats = [] # List of threat details
         self.security_stats = Counter()
 
-        self.bot_keywords = [
-            'bot', 'crawl', 'spider', 'slurp', 'mediapartners', 'python-requests', 
-            'curl', 'wget', 'ahrefs', 'semrush', 'mj12bot', 'check.9tb.org'
-        ]
+        # Optional offline GeoIP database file (see geoip.py); countries are derived
+        # from the per-IP counts when statistics are requested, not per line
+        self.geoip_database = geoip_database
+
+        # Bot status, scanner signatures and device family, computed once per distinct user agent
+        self.ua_classifier = self.security_analyzer.ua_classifier
+        self.bot_keywords = self.ua_classifier.bot_keywords
+
+        # Response time percentiles, only for log formats with $request_time / $upstream_response_time
+        self.latency = LatencyStats()
 
     def is_bot(self, user_agent):
-        ua_lower = user_agent.lower()
-        if ua_lower == '-': return False
-        return any(keyword in ua_lower for keyword in self.bot_keywords)
+        return self.ua_classifier.classify(user_agent).is_bot
 
     def process_record(self, record):
         """
         Process a single parsed log record and update statistics.
         """
+        # Rates are measured over all traffic, filters only decide which lines are reported
+        rate_threats = self.security_analyzer.check_rates(record)
+
         # Date Filter
-        if self.start_date or self.end_date:
-            ts = record.get('datetime_obj')
+        if self.start_ts is not None or self.end_ts is not None:
+            ts = record.timestamp
             if not ts: return # Skip invalid dates if filter is on
-            # Assuming timestamps are timezone aware, we should compare carefully.
-            # But simpler is to compare timestamps if timezone matches or convert.
-            # Here we assume user filters are naive or compatible.
-            # Let's perform simple comparison
-            if self.start_date and ts < self.start_date: return
-            if self.end_date and ts > self.end_date: return
-
-        is_bot_req = self.is_bot(record['user_agent'])
+            if self.start_ts is not None and ts < self.start_ts: return
+            if self.end_ts is not None and ts > self.end_ts: return
+
+        ua_info = self.ua_classifier.classify(record.user_agent)
+        is_bot_req = ua_info.is_bot
         
         # If filtering is enabled and it is a bot, skip counting
         # BUT: Security analysis might still be interesting for bots?
@@ -64,53 +90,98 @@ class LogAnalyzer:
             return
 
         # Security Check
-        found_threats = self.security_analyzer.check_request(record)
+        found_threats = self.security_analyzer.check_request(record, ua_info)
+        if rate_threats:
+            found_threats = found_threats + rate_threats if found_threats else rate_threats
         if found_threats:
             for threat in found_threats:
                 self.security_stats[threat['type']] += 1
                 self.threats.append({
-                    'time': record.get('time'),
-                    'ip': record.get('ip'),
+                    'time': record.time,
+                    'ip': record.ip,
                     'type': threat['type'],
                     'evidence': threat['evidence'],
                     'risk': threat['risk']
                 })
 
         self.total_requests += 1
-        self.ips[record['ip']] += 1
-        self.status_codes[record['status']] += 1
-        self.total_bytes += record['bytes']
-        self.user_agents[record['user_agent']] += 1
-        self.referers[record['referer']] += 1
-        
-        path = extract_path(record['request'])
-        self.paths[path] += 1
+        self.status_codes[record.status] += 1
+        self.total_bytes += record.bytes
+        path = record.path
+
+        if self.sketch_capacity:
+            self.ips.add(record.ip)
+            self.unique_ips.add(record.ip)
+            self.user_agents.add(record.user_agent)
+            self.referers.add(record.referer)
+            self.paths.add(path)
+        else:
+            self.ips[record.ip] += 1
+            self.user_agents[record.user_agent] += 1
+            self.referers[record.referer] += 1
+            self.paths[path] += 1
 
-        # Extract hour from timestamp
+        # Hour is decoded once by the parser
         # Format: 21/Jan/2026:13:14:04 +0900 -> 13
-        try:
-            time_str = record['time']
-            time_match = re.search(r':(\d{2}):', time_str)
-            if time_match:
-                hour = time_match.group(1)
-                self.hours[hour] += 1
-        except Exception:
-            pass
-
-    def get_statistics(self):
+        hour = record.hour
+        if hour:
+            self.hours[hour] += 1
+
+        if record.request_time is not None or record.upstream_time is not None:
+            self.latency.add(record, path)
+
+        ts = record.timestamp
+        if ts:
+            self.rollups.add(ts, record.utc_offset, record.status, record.bytes, record.ip, path)
+
+    def merge(self, other):
+        """
+        Folds the statistics of another LogAnalyzer into this one.
+        `other` must cover the part of the log that comes after this one: threats are
+        concatenated and counter keys keep their first-seen order, so merging chunks in
+        file order gives exactly the same result as one sequential pass.
+        Rate detection continues from the state of `other`, which saw the later lines, unless
+        either analyzer uses a shared SecurityAnalyzer, whose detector belongs to its owner.
+        """
+        self.total_requests += other.total_requests
+        self.total_bytes += other.total_bytes
+        self.status_codes.update(other.status_codes)
+        self.hours.update(other.hours)
+        if self.sketch_capacity:
+            self.ips.merge(other.ips)
+            self.paths.merge(other.paths)
+            self.user_agents.merge(other.user_agents)
+            self.referers.merge(other.referers)
+            self.unique_ips.merge(other.unique_ips)
+        else:
+            self.ips.update(other.ips)
+            self.paths.update(other.paths)
+            self.user_agents.update(other.user_agents)
+            self.referers.update(other.referers)
+        self.security_stats.update(other.security_stats)
+        self.threats.extend(other.threats)
+        self.rollups.merge(other.rollups)
+        self.latency.merge(other.latency)
+        if not (self.shared_security or other.shared_security):
+            self.security_analyzer.rate_detector = other.security_analyzer.rate_detector
+        return self
+
+    def get_statistics(self, resolution=None):
         """
         Returns a dictionary containing the calculated statistics.
+        `resolution` ('minute', 'hour', 'day' or None for automatic) selects the time series bucket size.
         """
         sorted_hours = dict(sorted(self.hours.items()))
         
-        return {
+        stats = {
             'total_requests': self.total_requests,
-            'unique_users': len(self.ips),
+            'unique_users': self.unique_ips.count() if self.sketch_capacity else len(self.ips),
             'total_bytes': self.total_bytes,
             'status_codes': dict(self.status_codes),
             'top_paths': self.paths.most_common(20),
             'top_ips': self.ips.most_common(50),
             'hourly_stats': sorted_hours,
+            'time_series': self.rollups.series(resolution),
             'top_user_agents': self.user_agents.most_common(20),
             'top_referers': self.referers.most_common(20),
             'security': {
@@ -120,3 +191,28 @@ class LogAnalyzer:
                 # Actually threats list grows linearly. We should limit return size.
             }
         }
+
+        # Bot/human and device/browser/OS split, from the per-user-agent counts
+        stats.update(self.ua_classifier.breakdown(self.user_agents.most_common() if self.sketch_capacity else self.user_agents.items()))
+
+        latency = self.latency.summary()
+        if latency:
+            stats['latency'] = latency
+
+        if self.geoip_database:
+            db = get_database(self.geoip_database)
+            stats['ip_countries'] = db.lookup_many(ip for ip, _ in stats['top_ips'])
+            stats['top_countries'] = db.country_counts(self.ips.most_common() if self.sketch_capacity else self.ips.items())[:20]
+
+        if self.sketch_capacity:
+            # Counts in the top lists may be overestimated by at most these amounts
+            stats['sketch'] = {
+                'capacity': self.sketch_capacity,
+                'unique_users_relative_error': round(self.unique_ips.relative_error(), 4),
+                'top_ips_max_error': self.ips.error_bound(),
+                'top_paths_max_error': self.paths.error_bound(),
+                'top_user_agents_max_error': self.user_agents.error_bound(),
+                'top_referers_max_error': self.referers.error_bound()
+            }
+
+        return stats
@@ -1,23 +1,134 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import os
-import socket
-from log_parser import parse_log_line
-from analyzer import LogAnalyzer
+import json
+import threading
+from log_parser import parse_lines, parse_log_line
+from sessions import AnalysisSessionCache
+from ip_index import IPIndexStore
+from log_sources import expand_sources, plan_sources
+from live_tail import LiveTailHub, line_entry
+from log_reader import file_identity, complete_lines_end, last_lines_start, head_fingerprint, same_head
+from reverse_dns import ReverseDNSCache
+from jobs import JobManager
+from sampling import SampledAnalysis
+from result_cache import ResultCache, ENCODINGS, MIN_COMPRESS_SIZE, compress, source_fingerprint, last_modified
+import columnar
+import geoip
+import metrics
 
 app = Flask(__name__)
 
 # Config
 DEFAULT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Optional JSON file with extra threat signatures (see security.load_rules)
+SECURITY_RULES_FILE = os.environ.get('SECURITY_RULES_FILE')
+
+# Access log format: the LOG_FORMAT environment variable, read by log_parser, is a name
+# in log_parser.LOG_FORMATS ('combined', 'timed') or an nginx log_format string.
+# Formats with $request_time add response time percentiles per endpoint.
+
+# Optional offline IP range -> country database (.csv, .csv.gz or geoip.GeoIPDatabase.save() output)
+GEOIP_DATABASE = os.environ.get('GEOIP_DATABASE')
+GEOIP_BATCH_LIMIT = 1000
+
+# Incremental analysis state, so Live Monitor refreshes only parse appended bytes.
+# One session per file, so a rotated set (access.log, .1, .2.gz ... .14.gz) fits.
+analysis_sessions = AnalysisSessionCache(max_sessions=32)
+
+# Per-IP line offsets so /api/ip_history can seek instead of rescanning the log
+IP_INDEX_DIR = os.path.join(DEFAULT_DIR, '.cache', 'ip_index')
+ip_indexes = IPIndexStore(IP_INDEX_DIR)
+# Default and maximum lines per /api/ip_history page
+IP_HISTORY_PAGE_SIZE = 500
+
+# Parse-once columnar cache for single-file analyses (needs numpy, disable with COLUMNAR_CACHE=0)
+COLUMNAR_CACHE_ENABLED = columnar.available() and os.environ.get('COLUMNAR_CACHE', '1') != '0'
+COLUMNAR_CACHE_DIR = os.path.join(DEFAULT_DIR, '.cache', 'columns')
+columnar_caches = columnar.ColumnarCacheStore(COLUMNAR_CACHE_DIR, security_rules=SECURITY_RULES_FILE,
+                                               geoip_database=GEOIP_DATABASE)
+
+# Live Monitor push: one watcher thread per file, shared by every connected dashboard.
+# New lines are batched for LIVE_BATCH_WINDOW seconds; slow clients drop their oldest lines.
+# Lines carry the threats they trigger (signatures, floods, brute force).
+# A batch reads at most LIVE_BATCH_LINES / LIVE_BATCH_BYTES; a larger backlog (e.g. after
+# rotation) is spread over the following batches.
+LIVE_BATCH_WINDOW = float(os.environ.get('LIVE_BATCH_WINDOW', '0.5'))
+LIVE_BATCH_LINES = 5000
+LIVE_BATCH_BYTES = 1024 * 1024
+LIVE_QUEUE_SIZE = 1000
+LIVE_KEEPALIVE_SECONDS = 15
+live_tail = LiveTailHub(batch_window=LIVE_BATCH_WINDOW, queue_size=LIVE_QUEUE_SIZE, security_rules=SECURITY_RULES_FILE,
+                        max_lines=LIVE_BATCH_LINES, max_bytes=LIVE_BATCH_BYTES)
+
+# /api/tail (polling fallback of /api/live): a first poll gets the last TAIL_INITIAL_LINES lines,
+# later polls the lines appended since, at most TAIL_MAX_LINES / TAIL_MAX_BYTES of the newest
+TAIL_INITIAL_LINES = 100
+TAIL_MAX_LINES = 500
+TAIL_MAX_BYTES = 256 * 1024
+
+# Reverse DNS for the Top IPs table: concurrent lookups, cached (also failures) across restarts
+DNS_CACHE_FILE = os.path.join(DEFAULT_DIR, '.cache', 'dns_cache.json')
+DNS_BATCH_LIMIT = 200
+reverse_dns = ReverseDNSCache(DNS_CACHE_FILE)
+
+# Analyses run as background jobs: at most ANALYSIS_WORKERS at once (each may still use
+# `workers` processes for a first scan), and identical concurrent requests share one job
+ANALYSIS_WORKERS = max(1, int(os.environ.get('ANALYSIS_WORKERS', '2')))
+JOB_PROGRESS_INTERVAL = 0.5
+analysis_jobs = JobManager(max_workers=ANALYSIS_WORKERS)
+
+# Per-stage timings, line counts and peak RSS of every analysis, served at /api/metrics.
+# Off by default (PIPELINE_METRICS=1 to enable); when off the pipeline isn't wrapped at all.
+if os.environ.get('PIPELINE_METRICS') == '1':
+    metrics.install()
+
+# Preview mode ("preview": true): before the exact pass, random blocks of logs larger than
+# PREVIEW_MIN_BYTES are sampled for PREVIEW_SECONDS and the job publishes estimated
+# statistics with confidence intervals, refined every PREVIEW_INTERVAL seconds. Sampling then
+# goes on in the background, taking PREVIEW_REFINE_DUTY of the time, until the exact result is in.
+PREVIEW_SECONDS = float(os.environ.get('PREVIEW_SECONDS', '1.0'))
+PREVIEW_INTERVAL = 0.25
+PREVIEW_REFINE_DUTY = 0.25
+PREVIEW_MIN_BYTES = 16 * 1024 * 1024
+
+# Finished analysis results, serialized, keyed by the request options and the size, mtime,
+# inode and device of every source file: repeat requests for unchanged logs cost no analysis
+# and carry an ETag, so unchanged dashboards revalidating with If-None-Match get a 304.
+# JSON responses are gzip (or brotli, if installed) compressed when the client accepts it.
+RESULT_CACHE_ENTRIES = int(os.environ.get('RESULT_CACHE_ENTRIES', '64'))
+RESULT_CACHE_BYTES = int(os.environ.get('RESULT_CACHE_MB', '64')) * 1024 * 1024
+analysis_results = ResultCache(max_entries=RESULT_CACHE_ENTRIES, max_bytes=RESULT_CACHE_BYTES)
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/api/analyze', methods=['POST'])
-def analyze():
-    data = request.json
+def prepare_analysis(data):
+    """
+    Reads the options of an /api/analyze or /api/jobs request.
+    Returns (key, run) where run(progress) computes the statistics and `key` identifies
+    requests that would produce the same result, or None if no log file matches.
+    With "preview", run() first publishes sampled estimates to `progress` (see sampling.py).
+    Results are stored in `analysis_results` under `key`.
+    """
+    # A single path, a glob ("/var/log/nginx/access.log*") or a list of them
     logfile_path = data.get('filepath')
     filter_bots = data.get('filter_bots', False)
+    sketch_capacity = data.get('sketch_capacity')
+    try:
+        # Bounded-memory top-K mode: number of keys tracked per dimension (None = exact counts)
+        sketch_capacity = int(sketch_capacity) if sketch_capacity else None
+    except (TypeError, ValueError):
+        sketch_capacity = None
+    try:
+        # Processes used for the initial full scan, capped at the machine's core count
+        workers = max(1, min(int(data.get('workers') or 1), os.cpu_count() or 1))
+    except (TypeError, ValueError):
+        workers = 1
+    # Time series bucket size: 'minute', 'hour', 'day' or None/'auto'
+    resolution = data.get('resolution')
+    preview = bool(data.get('preview'))
     
     # Date Filtering
     import datetime
@@ -55,29 +166,271 @@ def analyze():
         except Exception:
             pass
 
-    if not logfile_path or not os.path.exists(logfile_path):
+    logfile_paths = expand_sources(logfile_path)
+    if not logfile_paths:
+        return None
+
+    def run(progress):
+        # Oldest first, skipping rotated files that lie outside the date range
+        paths = plan_sources(
+            logfile_paths,
+            start_date.timestamp() if start_date else None,
+            end_date.timestamp() if end_date else None
+        )
+        refining = None
+        with metrics.measure(', '.join(paths)):
+            if preview and SampledAnalysis.supported(paths) and sum(os.path.getsize(p) for p in paths) >= PREVIEW_MIN_BYTES:
+                sampler = SampledAnalysis(
+                    paths, filter_bots=filter_bots, start_date=start_date, end_date=end_date,
+                    sketch_capacity=sketch_capacity, security_rules=SECURITY_RULES_FILE, geoip_database=GEOIP_DATABASE
+                )
+                sampler.run(PREVIEW_SECONDS, progress, progress.publish, PREVIEW_INTERVAL, resolution)
+                stop = threading.Event()
+                refining = threading.Thread(
+                    target=sampler.refine, args=(stop, progress.publish, PREVIEW_INTERVAL, resolution, PREVIEW_REFINE_DUTY),
+                    name='preview', daemon=True
+                )
+                refining.start()
+            try:
+                if COLUMNAR_CACHE_ENABLED and len(paths) == 1 and not sketch_capacity:
+                    result = columnar_caches.analyze(paths[0], filter_bots, start_date, end_date, resolution, progress)
+                else:
+                    result = analysis_sessions.analyze_many(
+                        paths, workers=workers, resolution=resolution, progress=progress, filter_bots=filter_bots,
+                        start_date=start_date, end_date=end_date, sketch_capacity=sketch_capacity,
+                        security_rules=SECURITY_RULES_FILE, geoip_database=GEOIP_DATABASE
+                    )
+            finally:
+                if refining is not None:
+                    # No estimate may be published once the job holds the exact result
+                    stop.set()
+                    refining.join()
+        cache_result(key, result)
+        return result
+
+    # `workers` and `preview` only change how fast a result is available, not the result.
+    # The rules and GeoIP files change results too, so they are fingerprinted with the logs.
+    sources = logfile_paths + [path for path in (SECURITY_RULES_FILE, GEOIP_DATABASE) if path]
+    key = (tuple(logfile_paths), bool(filter_bots), start_date, end_date, sketch_capacity, resolution,
+           source_fingerprint(sources))
+    return key, run
+
+def cache_result(key, result):
+    """
+    Serializes a result into `analysis_results` and returns its CachedResult.
+    """
+    body = app.json.dumps(result).encode('utf-8')
+    return analysis_results.put(key, body, last_modified(key[-1]))
+
+def response_encoding():
+    """
+    The best of ENCODINGS the client accepts, or None.
+    """
+    return request.accept_encodings.best_match(ENCODINGS)
+
+def result_response(entry):
+    """
+    A CachedResult as a JSON response: 304 if the client's copy (If-None-Match) is current,
+    otherwise the body, compressed if the client accepts it.
+    Last-Modified is informational only: HTTP dates have whole-second precision, and a log
+    can change twice within a second, so If-Modified-Since is never trusted.
+    """
+    not_modified = bool(request.if_none_match) and request.if_none_match.contains(entry.etag)
+
+    response = Response(status=304 if not_modified else 200, mimetype='application/json')
+    response.set_etag(entry.etag)
+    if entry.last_modified is not None:
+        response.last_modified = entry.last_modified
+    # Always revalidate: the same request answers differently once the log grows
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    if not_modified:
+        return response
+    encoding = response_encoding() if len(entry.body) >= MIN_COMPRESS_SIZE else None
+    if encoding:
+        response.set_data(analysis_results.encode(entry, encoding))
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response.set_data(entry.body)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """
+    Compresses JSON responses that result_response() didn't, when the client accepts it.
+    """
+    if (response.mimetype != 'application/json' or response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    encoding = response_encoding() if len(body) >= MIN_COMPRESS_SIZE else None
+    if encoding:
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze():
+    """
+    Runs an analysis and waits for it. Joins an identical analysis that is already running,
+    and answers from `analysis_results` (or with a 304) if the logs haven't changed.
+    With "preview": true, answers with the first estimate (which has a "preview" entry and
+    the running "job") as soon as there is one; follow /api/jobs/<id> for the exact result.
+    """
+    prepared = prepare_analysis(request.json)
+    if prepared is None:
         return jsonify({'error': 'File not found'}), 404
 
-    analyzer = LogAnalyzer(filter_bots=filter_bots, start_date=start_date, end_date=end_date)
-    
+    key = prepared[0]
+    cached = analysis_results.get(key)
+    if cached is not None:
+        return result_response(cached)
+
+    job, _ = analysis_jobs.submit(*prepared)
+    if request.json.get('preview'):
+        job.wait_preview()
+        info = job.snapshot(include_preview=True)
+        if 'preview' in info:
+            preview = info.pop('preview')
+            return jsonify(dict(preview, job=info))
+    job.wait()
+    if job.state == 'cancelled':
+        return jsonify({'error': 'Analysis was cancelled'}), 409
+    if job.state == 'failed':
+        return jsonify({'error': job.error}), 500
+    # Normally stored by the job itself, unless it was evicted again already
+    return result_response(analysis_results.get(key) or cache_result(key, job.result))
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Starts an analysis in the background (same body as /api/analyze) and returns its job.
+    "joined" is true if an identical analysis was already running and is shared instead.
+    Poll /api/jobs/<id> or stream /api/jobs/<id>/events for progress and the result.
+    If the result is cached no job is started: the answer is 200 with state "done" and the result.
+    """
+    prepared = prepare_analysis(request.json)
+    if prepared is None:
+        return jsonify({'error': 'File not found'}), 404
+
+    cached = analysis_results.get(prepared[0])
+    if cached is not None:
+        # Spliced in as is, so the cached body isn't parsed and serialized again
+        body = b'{"cached": true, "state": "done", "result": ' + cached.body + b'}'
+        return Response(body, mimetype='application/json')
+
+    job, joined = analysis_jobs.submit(*prepared)
+    info = job.snapshot()
+    info['joined_existing'] = joined
+    return jsonify(info), 202
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """
+    Progress of a job, plus its latest "preview" while running and its "result" once it is done.
+    """
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.snapshot(include_result=True, include_preview=True))
+
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    Server-Sent Events stream of a job's progress every JOB_PROGRESS_INTERVAL seconds.
+    The last event has a finished state (done, failed or cancelled) and, if done, the result.
+    """
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+
+    def stream():
+        yield 'retry: 3000\n\n'
+        # Previews are only sent when a newer one was published
+        sent = None
+        while not job.wait(JOB_PROGRESS_INTERVAL):
+            info = job.snapshot(include_preview=job.preview_version != sent)
+            if 'preview' in info:
+                sent = info['preview_version']
+            yield f"data: {json.dumps(info)}\n\n"
+        yield f"data: {json.dumps(job.snapshot(include_result=True))}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """
+    Cancels a job, also for the other requests that joined it.
+    """
+    job = analysis_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.snapshot())
+
+@app.route('/api/metrics')
+def pipeline_metrics():
+    """
+    Pipeline instrumentation (see metrics.py): cumulative time and calls per stage, lines,
+    unmatched lines, bytes read, and the most recent analyses with their lines/sec and peak RSS.
+    JSON by default, Prometheus text format with ?format=prometheus.
+    """
+    if request.args.get('format') == 'prometheus':
+        return Response(metrics.registry.prometheus(), mimetype='text/plain; version=0.0.4')
+    return jsonify(dict(metrics.registry.snapshot(), result_cache=analysis_results.stats()))
+
+def parse_ui_date(value):
+    """
+    Parses a datetime-local value ("2026-01-21T14:30") as JST epoch seconds, or None.
+    """
+    import datetime
+    if not value:
+        return None
     try:
-        with open(logfile_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if not line.strip():
-                    continue
-                record = parse_log_line(line)
-                if record:
-                    analyzer.process_record(record)
+        jst = datetime.timezone(datetime.timedelta(hours=9))
+        return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M').replace(tzinfo=jst).timestamp()
+    except ValueError:
+        return None
+
+@app.route('/api/rollup', methods=['POST'])
+def rollup():
+    """
+    Traffic summary for a date range answered from the per-minute/hour/day rollups
+    of the cached (undated) session, without rescanning the log.
+    """
+    data = request.json
+    logfile_paths = expand_sources(data.get('filepath'))
+    if not logfile_paths:
+        return jsonify({'error': 'File not found'}), 404
+
+    start_ts = parse_ui_date(data.get('start_date'))
+    end_ts = parse_ui_date(data.get('end_date'))
+    resolution = data.get('resolution')
+    try:
+        summary = analysis_sessions.view(
+            plan_sources(logfile_paths, start_ts, end_ts),
+            lambda analyzer: analyzer.rollups.query(start_ts, end_ts, resolution),
+            filter_bots=data.get('filter_bots', False), start_date=None, end_date=None,
+            sketch_capacity=None, security_rules=SECURITY_RULES_FILE, geoip_database=GEOIP_DATABASE
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-    return jsonify(analyzer.get_statistics())
+    return jsonify(summary)
 
 @app.route('/api/ip_history', methods=['POST'])
 def ip_history():
     data = request.json
     logfile_path = data.get('filepath')
     target_ip = data.get('ip')
+    try:
+        offset = max(0, int(data.get('offset', 0)))
+        limit = min(max(1, int(data.get('limit', IP_HISTORY_PAGE_SIZE))), IP_HISTORY_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid offset or limit'}), 400
     
     if not logfile_path or not os.path.exists(logfile_path):
         return jsonify({'error': 'File not found'}), 404
@@ -85,54 +438,109 @@ def ip_history():
     history = []
     
     try:
-        with open(logfile_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                record = parse_log_line(line)
-                if record and record['ip'] == target_ip:
-                     history.append({
-                         'time': record['time'],
-                         'request': record['request'],
-                         'status': record['status'],
-                         'user_agent': record['user_agent'],
-                         'referer': record['referer']
-                     })
+        total, lines = ip_indexes.read_lines(logfile_path, target_ip, offset, limit)
+        for record in parse_lines(lines):
+            if record.ip == target_ip:
+                 history.append({
+                     'time': record.time,
+                     'request': record.request,
+                     'status': record.status,
+                     'user_agent': record.user_agent,
+                     'referer': record.referer
+                 })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
         
-    return jsonify({'ip': target_ip, 'history': history})
+    return jsonify({'ip': target_ip, 'history': history, 'total': total, 'offset': offset, 'limit': limit})
 
 @app.route('/api/tail', methods=['POST'])
 def tail():
+    """
+    Lines appended to the log since `last_pos`, as {"line", "ip", "status", "class"} entries.
+    Without `last_pos`, the last `lines` lines (TAIL_INITIAL_LINES by default) instead.
+    The answer's `inode`, `device` and `head` are sent back with `last_pos`: a different file
+    there (rotation), a file shorter than `last_pos` or one whose first bytes changed
+    (copytruncate, even if it has grown back past `last_pos`) is read from its start.
+    A backlog beyond TAIL_MAX_LINES or TAIL_MAX_BYTES is skipped up to the newest lines,
+    and `skipped` says how many bytes were.
+    """
     data = request.json
     logfile_path = data.get('filepath')
-    last_pos = data.get('last_pos', 0)
+    last_pos = data.get('last_pos')
     
     if not logfile_path or not os.path.exists(logfile_path):
         return jsonify({'error': 'File not found'}), 404
 
-    new_lines = []
-    current_size = os.path.getsize(logfile_path)
-
-    # Log rotation check: if file is smaller than last read position, reset to 0
-    if current_size < last_pos:
-        last_pos = 0
-
     try:
-        with open(logfile_path, 'r', encoding='utf-8') as f:
-            f.seek(last_pos)
-            # Read new lines
-            lines = f.readlines()
-            last_pos = f.tell()
-            
-            # Filter empty lines
-            new_lines = [line.strip() for line in lines if line.strip()]
+        inode, device, size = file_identity(logfile_path)
+        # Only complete lines: nginx may be halfway through writing the last one
+        end = complete_lines_end(logfile_path, size)
+        rotated = False
+        if last_pos is None:
+            count = max(1, min(int(data.get('lines') or TAIL_INITIAL_LINES), TAIL_MAX_LINES))
+            start = last_lines_start(logfile_path, count, end, max(0, end - TAIL_MAX_BYTES))
+            skipped = 0
+        else:
+            last_pos = max(0, int(last_pos))
+            same_file = data.get('inode') in (None, inode) and data.get('device') in (None, device)
+            head = data.get('head')
+            if not same_file or size < last_pos or (head and not same_head(logfile_path, head)):
+                rotated = True
+                last_pos = 0
+            start = last_lines_start(logfile_path, TAIL_MAX_LINES, end, max(last_pos, end - TAIL_MAX_BYTES))
+            skipped = start - last_pos
 
-    except Exception as e:
+        with open(logfile_path, 'rb') as f:
+            f.seek(start)
+            block = f.read(end - start)
+        head = head_fingerprint(logfile_path, min(end, 256))
+    except (OSError, TypeError, ValueError) as e:
         return jsonify({'error': str(e)}), 500
 
+    new_lines = []
+    for line in block.decode('utf-8', 'replace').split('\n'):
+        line = line.strip()
+        if line:
+            new_lines.append(line_entry(line, parse_log_line(line)))
+
     return jsonify({
         'new_lines': new_lines,
-        'last_pos': last_pos
+        'last_pos': end,
+        'inode': inode,
+        'device': device,
+        'head': head,
+        'rotated': rotated,
+        'skipped': skipped
+    })
+
+@app.route('/api/live')
+def live():
+    """
+    Server-Sent Events stream of the lines appended to the log from now on.
+    Each event carries {"lines": [{"line", "ip", "status", "class"}, ...], "dropped": n}.
+    """
+    logfile_path = request.args.get('filepath')
+    if not logfile_path or not os.path.exists(logfile_path):
+        return jsonify({'error': 'File not found'}), 404
+
+    subscription = live_tail.subscribe(logfile_path)
+
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                lines, dropped = subscription.get(timeout=LIVE_KEEPALIVE_SECONDS)
+                if lines or dropped:
+                    yield f"data: {json.dumps({'lines': lines, 'dropped': dropped})}\n\n"
+                else:
+                    # Comment line, keeps proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+        finally:
+            live_tail.unsubscribe(subscription)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
 
 @app.route('/api/browse', methods=['POST'])
@@ -186,13 +594,50 @@ def dns_lookup():
         return jsonify({'error': 'No IP provided'}), 400
 
     try:
-        socket.setdefaulttimeout(2)
-        hostname, _, _ = socket.gethostbyaddr(ip)
-        return jsonify({'ip': ip, 'hostname': hostname})
-    except socket.herror:
-        return jsonify({'ip': ip, 'hostname': 'Unknown (Lookup Failed)'})
+        hostname = reverse_dns.lookup(ip)
     except Exception as e:
         return jsonify({'ip': ip, 'hostname': f'Error: {str(e)}'})
+    return jsonify({'ip': ip, 'hostname': hostname or 'Unknown (Lookup Failed)'})
+
+@app.route('/api/dns_lookup_batch', methods=['POST'])
+def dns_lookup_batch():
+    """
+    Resolves a list of IPs at once: {"ips": [...]} -> {"results": {ip: hostname}}.
+    """
+    data = request.json
+    ips = data.get('ips')
+    
+    if not isinstance(ips, list) or not ips:
+        return jsonify({'error': 'No IPs provided'}), 400
+    if len(ips) > DNS_BATCH_LIMIT:
+        return jsonify({'error': f'At most {DNS_BATCH_LIMIT} IPs per request'}), 400
+
+    try:
+        results = reverse_dns.lookup_many([str(ip) for ip in ips])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'results': {ip: hostname or 'Unknown (Lookup Failed)' for ip, hostname in results.items()}})
+
+@app.route('/api/geoip_batch', methods=['POST'])
+def geoip_batch():
+    """
+    Country codes from the local GeoIP database: {"ips": [...]} -> {"results": {ip: "JP" or null}}.
+    """
+    if not GEOIP_DATABASE:
+        return jsonify({'error': 'No GeoIP database configured (set GEOIP_DATABASE)'}), 404
+
+    data = request.json
+    ips = data.get('ips')
+    if not isinstance(ips, list) or not ips:
+        return jsonify({'error': 'No IPs provided'}), 400
+    if len(ips) > GEOIP_BATCH_LIMIT:
+        return jsonify({'error': f'At most {GEOIP_BATCH_LIMIT} IPs per request'}), 400
+
+    try:
+        results = geoip.get_database(GEOIP_DATABASE).lookup_many([str(ip) for ip in ips])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'results': results})
 
 @app.route('/api/choose_file', methods=['POST'])
 def choose_file():
@@ -0,0 +1,267 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+from itertools import islice
+from metrics import process_peak_rss
+from loggen import LogGenerator
+
+BENCHMARKS = ('parse_log_line', 'iter_records', 'process_record', 'check_request', 'api_analyze')
+DEFAULT_SIZES = (100000, 1000000, 10000000)
+
+# Share of attack requests in the corpus by default, as in loggen.py
+DEFAULT_ATTACK_FRACTION = 0.01
+
+# Generated logs are kept here and reused by later runs with the same seed and size
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'bench')
+
+# Records are parsed this many at a time so the timed loops don't include parsing
+# and memory stays flat at any corpus size
+BATCH_SIZE = 100000
+
+def corpus(lines, seed=0, attack_fraction=DEFAULT_ATTACK_FRACTION):
+    """
+    Path of the synthetic log with `lines` lines for `seed` and `attack_fraction`
+    (share of requests matching a security signature), generated on first use.
+    """
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    name = f'synthetic-{seed}-{lines}.log' if attack_fraction == DEFAULT_ATTACK_FRACTION \
+        else f'synthetic-{seed}-{lines}-attack{attack_fraction:g}.log'
+    path = os.path.join(CORPUS_DIR, name)
+    if not os.path.exists(path):
+        print(f"Generating {lines:,} lines -> {path}", file=sys.stderr)
+        tmp_path = path + '.tmp'
+        LogGenerator(seed=seed, attack_fraction=attack_fraction).write(tmp_path, lines)
+        os.replace(tmp_path, path)
+    return path
+
+def batches(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def bench_parse_log_line(path):
+    from log_parser import parse_log_line
+    lines = seconds = 0
+    with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+        for batch in batches(f):
+            start = time.perf_counter()
+            for line in batch:
+                parse_log_line(line)
+            seconds += time.perf_counter() - start
+            lines += len(batch)
+    return lines, seconds
+
+def bench_iter_records(path):
+    from log_reader import iter_records
+    records = 0
+    start = time.perf_counter()
+    for _ in iter_records(path):
+        records += 1
+    return records, time.perf_counter() - start
+
+def bench_process_record(path):
+    from log_reader import iter_records
+    from analyzer import LogAnalyzer
+    analyzer = LogAnalyzer()
+    records = seconds = 0
+    for batch in batches(iter_records(path)):
+        start = time.perf_counter()
+        for record in batch:
+            analyzer.process_record(record)
+        seconds += time.perf_counter() - start
+        records += len(batch)
+    return records, seconds
+
+def bench_check_request(path):
+    from log_reader import iter_records
+    from security import SecurityAnalyzer
+    security = SecurityAnalyzer()
+    records = seconds = 0
+    for batch in batches(iter_records(path)):
+        start = time.perf_counter()
+        for record in batch:
+            security.check_request(record)
+        seconds += time.perf_counter() - start
+        records += len(batch)
+    return records, seconds
+
+def bench_api_analyze(path):
+    """
+    One cold POST /api/analyze through Flask's test client, with empty caches.
+    """
+    import app as server
+    import columnar
+    from sessions import AnalysisSessionCache
+    with tempfile.TemporaryDirectory() as cache_dir:
+        server.analysis_sessions = AnalysisSessionCache()
+        server.columnar_caches = columnar.ColumnarCacheStore(cache_dir)
+        client = server.app.test_client()
+        start = time.perf_counter()
+        response = client.post('/api/analyze', json={'filepath': path})
+        seconds = time.perf_counter() - start
+    if response.status_code != 200:
+        raise RuntimeError(f"/api/analyze answered {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    with open(path, 'rb') as f:
+        lines = sum(block.count(b'\n') for block in iter(lambda: f.read(1024 * 1024), b''))
+    return lines, seconds
+
+def run_single(name, path):
+    """
+    Runs one benchmark in this process and returns its measurements.
+    """
+    func = globals()[f'bench_{name}']
+    before = process_peak_rss()
+    lines, seconds = func(path)
+    after = process_peak_rss()
+    return {
+        'lines': lines,
+        'seconds': round(seconds, 4),
+        'lines_per_sec': round(lines / seconds) if seconds > 0 else 0,
+        'peak_rss': after,
+        'peak_rss_growth': after - before if after is not None else None
+    }
+
+def run(name, path, repeat=1):
+    """
+    Runs a benchmark `repeat` times, each in a fresh interpreter so peak RSS is its own,
+    and keeps the fastest run.
+    """
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--single', name, path],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if output.returncode != 0:
+            raise RuntimeError(f"{name} failed:\n{output.stderr}")
+        result = json.loads(output.stdout)
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+def git_commit():
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return output.stdout.strip() or None
+
+def compare(results, baseline, tolerance):
+    """
+    Matches results with the baseline's by (benchmark, size, attack fraction). Returns a list
+    of (result, baseline result or None, throughput change, regressed).
+    """
+    def key(r):
+        return r['benchmark'], r['size'], r.get('attack_fraction', DEFAULT_ATTACK_FRACTION)
+
+    previous = {key(r): r for r in baseline.get('results', [])}
+    rows = []
+    for result in results:
+        old = previous.get(key(result))
+        if old is None or not old['lines_per_sec']:
+            rows.append((result, None, None, False))
+            continue
+        change = result['lines_per_sec'] / old['lines_per_sec'] - 1
+        rows.append((result, old, change, change < -tolerance))
+    return rows
+
+def print_report(rows):
+    from rich.console import Console
+    from rich.table import Table
+    from rich import box
+
+    table = Table(title="Benchmark Results", box=box.SIMPLE)
+    table.add_column("Benchmark", style="cyan")
+    table.add_column("Attacks", justify="right")
+    table.add_column("Lines", justify="right")
+    table.add_column("Seconds", justify="right")
+    table.add_column("Lines/sec", justify="right", style="magenta")
+    table.add_column("Peak RSS", justify="right")
+    table.add_column("vs Baseline", justify="right")
+    for result, old, change, regressed in rows:
+        rss = f"{result['peak_rss'] / (1024**2):.0f} MB" if result['peak_rss'] is not None else "-"
+        if change is None:
+            versus = "-"
+        else:
+            versus = f"[{'red' if regressed else 'green'}]{change * 100:+.1f}%[/]"
+        table.add_row(result['benchmark'], f"{result['attack_fraction']:.0%}", f"{result['lines']:,}", f"{result['seconds']:.2f}",
+                      f"{result['lines_per_sec']:,}", rss, versus)
+    Console().print(table)
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and memory benchmarks on synthetic nginx logs")
+    parser.add_argument("--sizes", default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma-separated corpus sizes in lines (default: 100000,1000000,10000000)")
+    parser.add_argument("--benchmarks", default=','.join(BENCHMARKS),
+                        help=f"Comma-separated benchmarks (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus random seed (default: 0)")
+    parser.add_argument("--attack-fraction", default=str(DEFAULT_ATTACK_FRACTION),
+                        help="Comma-separated shares of attack requests, one corpus each; e.g. 0,0.3 "
+                             f"compares a clean and an attack-heavy log (default: {DEFAULT_ATTACK_FRACTION})")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per benchmark, the fastest is kept (default: 1)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Throughput drop vs the baseline that counts as a regression (default: 0.1)")
+    parser.add_argument("--single", nargs=2, metavar=("BENCHMARK", "LOG"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(*args.single)))
+        return
+
+    names = [name.strip() for name in args.benchmarks.split(',') if name.strip()]
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"Error: Unknown benchmark {', '.join(unknown)}")
+        sys.exit(2)
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    fractions = [float(fraction) for fraction in args.attack_fraction.split(',') if fraction.strip()]
+    if any(not 0 <= fraction <= 1 for fraction in fractions):
+        print("Error: --attack-fraction values must be between 0 and 1")
+        sys.exit(2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = []
+    for size in sizes:
+        for fraction in fractions:
+            path = corpus(size, args.seed, fraction)
+            for name in names:
+                print(f"Running {name} on {size:,} lines ({fraction:.0%} attacks)...", file=sys.stderr)
+                result = run(name, path, args.repeat)
+                results.append(dict(result, benchmark=name, size=size, attack_fraction=fraction))
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': args.seed,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    rows = compare(results, baseline or {}, args.tolerance)
+    print_report(rows)
+    if any(regressed for _, _, _, regressed in rows):
+        print(f"Throughput regressed by more than {args.tolerance * 100:.0f}% against {args.baseline}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
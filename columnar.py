@@ -0,0 +1,578 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from log_parser import active_log_format
+from user_agents import UAClassifier
+from security import SecurityAnalyzer
+from parallel import warm_up_rates
+from log_reader import iter_records, read_head, file_identity, complete_lines_end, is_compressed
+from rollups import RESOLUTIONS, STATUS_CLASSES, choose_resolution, status_class, build_series
+from geoip import get_database, UNKNOWN_COUNTRY
+from sketches import QuantileSketch
+from latency import MAX_KEYS, QUANTILES, endpoint, last_upstream, summarize, build_summary, most_requested
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CACHE_VERSION = 4
+
+# Fixed-width columns, one value per parsed line
+COLUMNS = {
+    'timestamp': 'float64',
+    'utc_offset': 'int32',   # Seconds, for local-time aligned series buckets
+    'bytes': 'int64',
+    'hour': 'int8',          # -1 when the hour is unknown
+    'status': 'int32',       # Dictionary codes from here on
+    'ip': 'int32',
+    'path': 'int32',
+    'user_agent': 'int32',
+    'referer': 'int32',
+    'upstream': 'int32',
+    'request_time': 'float64',      # NaN when the log format has no timing or the value is "-"
+    'upstream_time': 'float64'
+}
+DICTIONARIES = ('status', 'ip', 'path', 'user_agent', 'referer', 'upstream')
+
+# Records buffered by ColumnarLog.append() before they are written to the cache files,
+# so building the cache of a large log doesn't hold its columns as Python objects
+FLUSH_RECORDS = 65536
+
+def available():
+    return np is not None
+
+def _first_seen_counts(codes, size):
+    """
+    Returns (counts, first index) per dictionary code of a code array.
+    """
+    counts = np.bincount(codes, minlength=size)
+    first = np.full(size, len(codes), dtype=np.int64)
+    np.minimum.at(first, codes, np.arange(len(codes)))
+    return counts, first
+
+def _in_first_seen_order(codes, keys):
+    """
+    Equivalent of dict(Counter(...)) over the coded values: insertion (first-seen) order.
+    """
+    counts, first = _first_seen_counts(codes, len(keys))
+    present = np.nonzero(counts)[0]
+    order = present[np.argsort(first[present], kind='stable')]
+    return {keys[i]: int(counts[i]) for i in order}
+
+def _most_common(codes, keys, n):
+    """
+    Equivalent of Counter.most_common(n): by count, ties in first-seen order.
+    """
+    counts, first = _first_seen_counts(codes, len(keys))
+    present = np.nonzero(counts)[0]
+    if len(present) > n:
+        threshold = np.partition(counts[present], len(present) - n)[len(present) - n]
+        present = present[counts[present] >= threshold]
+    order = present[np.lexsort((first[present], -counts[present]))][:n]
+    return [(keys[i], int(counts[i])) for i in order]
+
+class ColumnarLog:
+    """
+    Parse-once columnar cache of one log file.
+    Each field is an append-only binary column (memory-mapped for reading); strings are
+    stored as codes into append-only dictionaries. Threats are detected once at build time
+    and kept with their line number, so any bot/date filter can be applied afterwards.
+    """
+    def __init__(self, path, cache_dir, security_rules=None, geoip_database=None):
+        self.path = os.path.abspath(path)
+        self.cache_dir = cache_dir
+        self.security_rules = security_rules
+        self.geoip_database = geoip_database
+        self.ua_classifier = UAClassifier()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.meta = {
+            'version': CACHE_VERSION,
+            'path': self.path,
+            'rules': self.rules_signature(),
+            'format': active_log_format().source,
+            'inode': None,
+            'device': None,
+            'end': 0,
+            'head': '',
+            'count': 0,
+            'dictionaries': {name: 0 for name in DICTIONARIES},
+            'threats': 0,
+            'sizes': {}             # Committed byte size of each cache file
+        }
+        self.keys = {name: [] for name in DICTIONARIES}
+        self.codes = {name: {} for name in DICTIONARIES}
+        self.threats = []
+        self.threat_lines = np.empty(0, dtype=np.int64)
+        self.columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.bot_flags = None
+        self.geoip = None               # Database the country codes below were computed with
+        self.ip_countries = np.empty(0, dtype=np.int32)
+        self.country_keys = []
+        self.security = None            # Kept between appends so rate windows span them, see append()
+        self.groupings = {}             # Dictionary name -> (group code per key, group keys)
+
+    def rules_signature(self):
+        if not self.security_rules:
+            return None
+        return [os.path.abspath(self.security_rules), os.path.getmtime(self.security_rules)]
+
+    def file(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def load(self):
+        """
+        Loads the cache from disk. Leaves an empty cache if it is missing or unusable.
+        """
+        try:
+            with open(self.file('meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (meta.get('version') != CACHE_VERSION or meta.get('path') != self.path or meta.get('rules') != self.rules_signature()
+                or meta.get('format') != active_log_format().source):
+            return
+        # Files may have been cleared for a rebuild that didn't finish
+        try:
+            if any(os.path.getsize(self.file(name)) < size for name, size in meta['sizes'].items()):
+                return
+        except OSError:
+            return
+
+        # Files may hold more than meta records if a write was interrupted; meta is authoritative
+        for name in DICTIONARIES:
+            with open(self.file(f'{name}.keys'), 'rb') as f:
+                keys = f.read().decode('utf-8', 'surrogateescape').split('\n')[:meta['dictionaries'][name]]
+            if name == 'status':
+                keys = [int(k) for k in keys]
+            self.keys[name] = keys
+            self.codes[name] = {key: code for code, key in enumerate(keys)}
+        with open(self.file('threats.jsonl'), 'r', encoding='utf-8', errors='surrogateescape') as f:
+            self.threats = [json.loads(line) for _, line in zip(range(meta['threats']), f)]
+        self.threat_lines = np.array([t.pop('line') for t in self.threats], dtype=np.int64)
+        self.meta = meta
+        self.map_columns()
+
+    def map_columns(self):
+        count = self.meta['count']
+        for name, dtype in COLUMNS.items():
+            if count:
+                self.columns[name] = np.memmap(self.file(f'{name}.bin'), dtype=dtype, mode='r', shape=(count,))
+            else:
+                self.columns[name] = np.empty(0, dtype=dtype)
+        self.bot_flags = None
+
+    def clear_files(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # meta.json goes first: it must never describe files that are being rebuilt
+        try:
+            os.remove(self.file('meta.json'))
+        except FileNotFoundError:
+            pass
+        for name in COLUMNS:
+            open(self.file(f'{name}.bin'), 'wb').close()
+        for name in DICTIONARIES:
+            open(self.file(f'{name}.keys'), 'wb').close()
+        open(self.file('threats.jsonl'), 'wb').close()
+
+    def refresh(self, progress=None):
+        """
+        Brings the cache up to date with the log: appends new complete lines, or rebuilds
+        from scratch if the file was rotated, truncated or rewritten.
+        `progress` (see jobs.Job) is told how much there is to read and advanced as it is read.
+        """
+        inode, device, size = file_identity(self.path)
+        meta = self.meta
+        head = read_head(self.path, len(meta['head'].encode('latin-1'))).decode('latin-1')
+        if (meta['inode'] != inode or meta['device'] != device or size < meta['end'] or head != meta['head']
+                or (is_compressed(self.path) and size != meta['end'])):
+            self.reset()
+            self.clear_files()
+            self.meta['inode'], self.meta['device'] = inode, device
+
+        if size == self.meta['end']:
+            return
+
+        if is_compressed(self.path):
+            if progress is not None:
+                progress.expect(size)
+            self.append(iter_records(self.path, progress=progress), size)
+        else:
+            end = complete_lines_end(self.path, size)
+            if end > self.meta['end']:
+                if progress is not None:
+                    progress.expect(end - self.meta['end'])
+                self.append(iter_records(self.path, self.meta['end'], end, progress), end)
+
+    def append(self, records, end):
+        """
+        Appends parsed records to the columns; `end` is the byte offset they were read up to.
+        Records are written to the cache files every FLUSH_RECORDS; meta.json is only
+        updated once all of them are, so an interrupted append leaves the old cache.
+        """
+        values = {name: [] for name in COLUMNS}
+        new_keys = {name: [] for name in DICTIONARIES}
+        new_threats = []
+        if self.security is None:
+            self.security = SecurityAnalyzer(rules_file=self.security_rules)
+            if self.meta['end']:
+                # Cache loaded from disk: rate windows continue from the lines it holds
+                warm_up_rates(self.security.rate_detector, [(self.path, self.meta['end'])])
+        security = self.security
+        line_no = self.meta['count']
+        nan = float('nan')
+
+        for record in records:
+            for name in DICTIONARIES:
+                key = getattr(record, name)
+                codes = self.codes[name]
+                code = codes.get(key)
+                if code is None:
+                    code = codes[key] = len(codes)
+                    self.keys[name].append(key)
+                    new_keys[name].append(key)
+                values[name].append(code)
+            values['timestamp'].append(record.timestamp)
+            values['utc_offset'].append(record.utc_offset)
+            values['bytes'].append(record.bytes)
+            values['hour'].append(int(record.hour) if record.hour else -1)
+            request_time = record.request_time
+            values['request_time'].append(nan if request_time is None else request_time)
+            upstream_time = record.upstream_time
+            values['upstream_time'].append(nan if upstream_time is None else upstream_time)
+
+            found_threats = security.check_request(record)
+            rate_threats = security.check_rates(record)
+            if rate_threats:
+                found_threats = found_threats + rate_threats if found_threats else rate_threats
+            if found_threats:
+                for threat in found_threats:
+                    new_threats.append({
+                        'line': line_no,
+                        'time': record.time,
+                        'ip': record.ip,
+                        'type': threat['type'],
+                        'evidence': threat['evidence'],
+                        'risk': threat['risk']
+                    })
+            line_no += 1
+            if len(values['timestamp']) >= FLUSH_RECORDS:
+                self.flush(values, new_keys, new_threats)
+
+        self.flush(values, new_keys, new_threats)
+
+        # Data first, meta last: a crash in between leaves meta pointing at the old sizes,
+        # and whatever was written past them is cut off by the next append
+        self.meta['count'] = line_no
+        self.meta['end'] = end
+        if len(self.meta['head']) < 256:
+            self.meta['head'] = read_head(self.path, min(end, 256)).decode('latin-1')
+        tmp_file = self.file('meta.json.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_file, self.file('meta.json'))
+        self.map_columns()
+
+    def flush(self, values, new_keys, new_threats):
+        """
+        Writes the buffered records of append() to the cache files and empties the buffers.
+        The in-memory meta counts follow, meta.json is left to append().
+        """
+        for name, dtype in COLUMNS.items():
+            self.append_bytes(f'{name}.bin', np.asarray(values[name], dtype=dtype).tobytes())
+            values[name].clear()
+        for name in DICTIONARIES:
+            if new_keys[name]:
+                prefix = '\n' if self.meta['dictionaries'][name] else ''
+                self.append_bytes(f'{name}.keys', (prefix + '\n'.join(str(k) for k in new_keys[name])).encode('utf-8', 'surrogateescape'))
+                self.meta['dictionaries'][name] += len(new_keys[name])
+                new_keys[name].clear()
+        if new_threats:
+            data = ''.join(json.dumps(threat) + '\n' for threat in new_threats)
+            self.append_bytes('threats.jsonl', data.encode('utf-8', 'surrogateescape'))
+            self.meta['threats'] += len(new_threats)
+            self.threat_lines = np.concatenate([self.threat_lines, np.array([t['line'] for t in new_threats], dtype=np.int64)])
+            for threat in new_threats:
+                del threat['line']
+            self.threats.extend(new_threats)
+            new_threats.clear()
+
+    def append_bytes(self, name, data):
+        size = self.meta['sizes'].get(name, 0)
+        with open(self.file(name), 'r+b') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > size:
+                f.truncate(size)
+            f.seek(size)
+            f.write(data)
+        self.meta['sizes'][name] = size + len(data)
+
+    def get_bot_flags(self):
+        """
+        Bot classification per distinct user agent, indexed by user_agent code.
+        """
+        if self.bot_flags is None or len(self.bot_flags) != len(self.keys['user_agent']):
+            classify = self.ua_classifier.classify
+            self.bot_flags = np.array([classify(ua).is_bot for ua in self.keys['user_agent']], dtype=bool)
+        return self.bot_flags
+
+    def time_series(self, mask, resolution=None):
+        """
+        Same series as RollupStore.series() for the selected lines.
+        """
+        ts = self.columns['timestamp'] if mask is None else self.columns['timestamp'][mask]
+        valid = ts != 0
+        ts = ts[valid]
+        if not len(ts):
+            return build_series(choose_resolution(0, resolution), [])
+        resolution = choose_resolution(float(ts.max() - ts.min()), resolution)
+        size = RESOLUTIONS[resolution]
+
+        def select(name):
+            values = self.columns[name] if mask is None else self.columns[name][mask]
+            return values[valid]
+
+        offsets = select('utc_offset').astype(np.int64)
+        local = (ts.astype(np.int64) + offsets) // size
+        if offsets.min() == offsets.max():
+            # Single UTC offset (the usual case): bucket indexes are a dense range, no sort needed
+            base = int(local.min())
+            inverse = local - base
+            occupied = np.nonzero(np.bincount(inverse))[0]
+            remap = np.zeros(int(inverse.max()) + 1, dtype=np.int64)
+            remap[occupied] = np.arange(len(occupied))
+            inverse = remap[inverse]
+            keys = (occupied + base) * size - int(offsets[0])
+        else:
+            keys, inverse = np.unique(local * size - offsets, return_inverse=True)
+        requests = np.bincount(inverse, minlength=len(keys))
+        nbytes = np.bincount(inverse, weights=select('bytes'), minlength=len(keys))
+        code_classes = np.array([status_class(code) for code in self.keys['status']], dtype=np.int64)
+        classes = code_classes[select('status')]
+        class_counts = np.bincount(
+            inverse * len(STATUS_CLASSES) + classes, minlength=len(keys) * len(STATUS_CLASSES)
+        ).reshape(len(keys), len(STATUS_CLASSES))
+        points = [
+            (int(t), [int(requests[i]), int(nbytes[i]), [int(c) for c in class_counts[i]]])
+            for i, t in enumerate(keys)
+        ]
+        return build_series(resolution, points)
+
+    def get_ip_countries(self):
+        """
+        Country code index (into self.country_keys) of every IP key, extended as keys are added.
+        """
+        db = get_database(self.geoip_database)
+        if db is not self.geoip:
+            self.geoip = db
+            self.ip_countries = np.empty(0, dtype=np.int32)
+            self.country_keys = []
+        new_ips = self.keys['ip'][len(self.ip_countries):]
+        if new_ips:
+            codes = {key: i for i, key in enumerate(self.country_keys)}
+            new_codes = []
+            for ip in new_ips:
+                country = db.lookup(ip) or UNKNOWN_COUNTRY
+                code = codes.get(country)
+                if code is None:
+                    code = codes[country] = len(self.country_keys)
+                    self.country_keys.append(country)
+                new_codes.append(code)
+            self.ip_countries = np.concatenate([self.ip_countries, np.array(new_codes, dtype=np.int32)])
+        return self.ip_countries
+
+    def get_grouping(self, name, func):
+        """
+        Groups the keys of a dictionary by func(key), e.g. paths by endpoint.
+        Returns (group code of every key, group keys), extended as keys are added.
+        """
+        group_codes, group_keys = self.groupings.get(name, (np.empty(0, dtype=np.int32), []))
+        new_keys = self.keys[name][len(group_codes):]
+        if new_keys:
+            codes = {key: i for i, key in enumerate(group_keys)}
+            new_codes = []
+            for key in new_keys:
+                group = func(key)
+                code = codes.get(group)
+                if code is None:
+                    code = codes[group] = len(group_keys)
+                    group_keys.append(group)
+                new_codes.append(code)
+            group_codes = np.concatenate([group_codes, np.array(new_codes, dtype=np.int32)])
+            self.groupings[name] = (group_codes, group_keys)
+        return group_codes, group_keys
+
+    def get_latency(self, select):
+        """
+        Same result as LatencyStats.summary() for the selected lines: exact order statistics
+        per group, reported as the sketch bucket they fall in.
+        """
+        request_time = select('request_time')
+        upstream_time = select('upstream_time')
+        timed = ~np.isnan(request_time)
+        upstream_timed = ~np.isnan(upstream_time)
+        if not timed.any() and not upstream_timed.any():
+            return None
+        request_time = request_time[timed]
+        upstream_time = upstream_time[upstream_timed]
+        hours = select('hour')[timed]
+
+        sketch = QuantileSketch()
+        def bucket(value):
+            return 0.0 if value <= 0 else sketch.value(sketch.index(value))
+
+        def summaries(codes, values, keys, max_keys=MAX_KEYS):
+            # Like latency.KeyedSketches: the max_keys most requested keys, in first-seen order
+            counts, first = _first_seen_counts(codes, len(keys))
+            present = np.nonzero(counts)[0]
+            keep = most_requested({keys[code]: int(counts[code]) for code in present}, max_keys)
+            kept = [code for code in present[np.argsort(first[present], kind='stable')] if keys[code] in keep]
+            # Sequential per-key sums, as the sketches add them
+            sums = np.bincount(codes, weights=values, minlength=len(keys))
+            ordered = values[np.lexsort((values, codes))]
+            starts = np.cumsum(counts) - counts
+            result = {}
+            for code in kept:
+                start, count = int(starts[code]), int(counts[code])
+                result[keys[code]] = summarize(
+                    count, float(sums[code]), float(ordered[start + count - 1]),
+                    lambda q: bucket(float(ordered[start + int(q * (count - 1))]))
+                )
+            return result
+
+        def overall(values):
+            if not len(values):
+                return None
+            return summaries(np.zeros(len(values), dtype=np.int64), values, [None])[None]
+
+        path_groups, endpoint_keys = self.get_grouping('path', endpoint)
+        upstream_groups, upstream_keys = self.get_grouping('upstream', last_upstream)
+        known = hours >= 0
+        return build_summary(
+            overall(request_time),
+            overall(upstream_time),
+            summaries(path_groups[select('path')[timed]], request_time, endpoint_keys),
+            summaries(upstream_groups[select('upstream')[upstream_timed]], upstream_time, upstream_keys),
+            summaries(hours[known].astype(np.int64), request_time[known], [f"{h:02d}" for h in range(24)])
+        )
+
+    def get_statistics(self, filter_bots=False, start_date=None, end_date=None, resolution=None):
+        """
+        Same result as LogAnalyzer.get_statistics() over this file, computed with
+        vectorized operations over the columns.
+        """
+        columns = self.columns
+        mask = None
+        if start_date or end_date:
+            ts = columns['timestamp']
+            mask = ts != 0
+            if start_date:
+                mask &= ts >= start_date.timestamp()
+            if end_date:
+                mask &= ts <= end_date.timestamp()
+        if filter_bots:
+            humans = ~self.get_bot_flags()[columns['user_agent']]
+            mask = humans if mask is None else mask & humans
+
+        def select(name):
+            return columns[name] if mask is None else columns[name][mask]
+
+        ips = select('ip')
+        hours = select('hour')
+        hour_counts = np.bincount(hours[hours >= 0], minlength=24)
+
+        threat_mask = np.ones(len(self.threats), dtype=bool) if mask is None else mask[self.threat_lines]
+        selected_threats = np.nonzero(threat_mask)[0]
+        threat_types = [self.threats[i]['type'] for i in selected_threats]
+        security_stats = {}
+        for threat_type in threat_types:
+            security_stats[threat_type] = security_stats.get(threat_type, 0) + 1
+
+        stats = {
+            'total_requests': int(len(ips)),
+            'unique_users': int(np.count_nonzero(np.bincount(ips, minlength=len(self.keys['ip'])))),
+            'total_bytes': int(select('bytes').sum()),
+            'status_codes': _in_first_seen_order(select('status'), self.keys['status']),
+            'top_paths': _most_common(select('path'), self.keys['path'], 20),
+            'top_ips': _most_common(ips, self.keys['ip'], 50),
+            'hourly_stats': {f"{h:02d}": int(c) for h, c in enumerate(hour_counts) if c},
+            'time_series': self.time_series(mask, resolution),
+            'top_user_agents': _most_common(select('user_agent'), self.keys['user_agent'], 20),
+            'top_referers': _most_common(select('referer'), self.keys['referer'], 20),
+            'security': {
+                'total_threats': len(threat_types),
+                'stats': security_stats,
+                'top_threats': [self.threats[i] for i in selected_threats[:50]]
+            }
+        }
+
+        user_agent_counts = np.bincount(select('user_agent'), minlength=len(self.keys['user_agent']))
+        stats.update(self.ua_classifier.breakdown(
+            (self.keys['user_agent'][i], int(user_agent_counts[i])) for i in np.nonzero(user_agent_counts)[0]
+        ))
+
+        latency = self.get_latency(select)
+        if latency:
+            stats['latency'] = latency
+
+        if self.geoip_database:
+            ip_countries = self.get_ip_countries()
+            countries = {}
+            for ip, _ in stats['top_ips']:
+                country = self.country_keys[ip_countries[self.codes['ip'][ip]]]
+                countries[ip] = None if country == UNKNOWN_COUNTRY else country
+            stats['ip_countries'] = countries
+            stats['top_countries'] = _most_common(ip_countries[ips], self.country_keys, 20)
+
+        return stats
+
+class ColumnarCacheStore:
+    """
+    LRU of ColumnarLog objects, one cache directory per log file under `cache_dir`.
+    """
+    def __init__(self, cache_dir, max_logs=4, security_rules=None, geoip_database=None):
+        self.cache_dir = cache_dir
+        self.max_logs = max_logs
+        self.security_rules = security_rules
+        self.geoip_database = geoip_database
+        self.logs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        key = os.path.abspath(path)
+        with self.lock:
+            log = self.logs.get(key)
+            if log is None:
+                name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+                log = ColumnarLog(path, os.path.join(self.cache_dir, name), self.security_rules, self.geoip_database)
+                log.load()
+                self.logs[key] = log
+            self.logs.move_to_end(key)
+            while len(self.logs) > self.max_logs:
+                self.logs.popitem(last=False)
+        return log
+
+    def analyze(self, path, filter_bots=False, start_date=None, end_date=None, resolution=None, progress=None):
+        """
+        Updates the cache for the file and returns its statistics for the given filters.
+        """
+        log = self.get(path)
+        with log.lock:
+            try:
+                log.refresh(progress)
+            except Exception:
+                # Never serve statistics from a half-written cache: go back to what meta.json
+                # committed last (load() leaves the cache empty if the files no longer match it),
+                # so a cancelled or failed update doesn't cost the next one a full parse
+                log.reset()
+                try:
+                    log.load()
+                except (OSError, ValueError):
+                    log.reset()
+                raise
+            return log.get_statistics(filter_bots, start_date, end_date, resolution)
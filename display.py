@@ -4,6 +4,12 @@ from rich.panel import Panel
 from rich.layout import Layout
 from rich import box
 
+def printable(text):
+    """
+    Replaces bytes that weren't valid UTF-8 in the log (kept as surrogate escapes) with U+FFFD.
+    """
+    return text.encode('utf-8', 'surrogateescape').decode('utf-8', 'replace')
+
 def display_report(stats):
     console = Console()
     
@@ -50,6 +56,73 @@ def display_report(stats):
     path_table.add_column("Requests", justify="right")
 
     for i, (path, count) in enumerate(stats['top_paths'], 1):
-        path_table.add_row(str(i), path, str(count))
+        path_table.add_row(str(i), printable(path), str(count))
 
     console.print(path_table)
+
+    if 'top_countries' in stats:
+        console.print()
+        country_table = Table(title="Top Countries", box=box.SIMPLE)
+        country_table.add_column("Rank", style="dim")
+        country_table.add_column("Country", style="cyan")
+        country_table.add_column("Requests", justify="right")
+
+        for i, (country, count) in enumerate(stats['top_countries'], 1):
+            country_table.add_row(str(i), country, str(count))
+
+        console.print(country_table)
+
+    if 'latency' in stats:
+        console.print()
+        latency = stats['latency']
+        latency_table = Table(title="Slowest Endpoints (request time, seconds)", box=box.SIMPLE)
+        latency_table.add_column("Path", style="yellow")
+        latency_table.add_column("Requests", justify="right")
+        latency_table.add_column("p50", justify="right")
+        latency_table.add_column("p95", justify="right", style="red")
+        latency_table.add_column("p99", justify="right")
+
+        overall = latency['request_time']
+        if overall:
+            latency_table.add_row("[bold](all)[/bold]", str(overall['count']), f"{overall['p50']:.3f}",
+                                  f"{overall['p95']:.3f}", f"{overall['p99']:.3f}")
+        for entry in latency['slowest_paths']:
+            latency_table.add_row(printable(entry['path']), str(entry['count']), f"{entry['p50']:.3f}",
+                                  f"{entry['p95']:.3f}", f"{entry['p99']:.3f}")
+
+        console.print(latency_table)
+
+def display_profile(profile):
+    """
+    Prints a metrics.Recorder snapshot: time per pipeline stage and throughput.
+    """
+    console = Console()
+    console.print()
+
+    elapsed = profile['elapsed']
+    stage_table = Table(title=f"Pipeline Profile ({elapsed:.2f}s)", box=box.SIMPLE)
+    stage_table.add_column("Stage", style="cyan")
+    stage_table.add_column("Calls", justify="right")
+    stage_table.add_column("Seconds", justify="right")
+    stage_table.add_column("Share", justify="right")
+    stage_table.add_column("µs/call", justify="right")
+
+    for stage, entry in profile['stages'].items():
+        seconds = entry['seconds']
+        share = seconds / elapsed * 100 if elapsed else 0
+        per_call = seconds / entry['calls'] * 1e6 if entry['calls'] else 0
+        stage_table.add_row(stage, f"{entry['calls']:,}", f"{seconds:.3f}", f"{share:.1f}%", f"{per_call:.2f}")
+
+    console.print(stage_table)
+
+    summary_table = Table(box=box.SIMPLE)
+    summary_table.add_column("Metric", style="cyan")
+    summary_table.add_column("Value", style="magenta")
+    summary_table.add_row("Lines", f"{profile['lines']:,}")
+    summary_table.add_row("Unmatched Lines", f"{profile['unmatched_lines']:,}")
+    summary_table.add_row("Bytes Read", f"{profile['bytes_read'] / (1024**2):.2f} MB")
+    summary_table.add_row("Lines/sec", f"{profile['lines_per_sec']:,}")
+    if profile['peak_rss'] is not None:
+        summary_table.add_row("Peak RSS", f"{profile['peak_rss'] / (1024**2):.1f} MB")
+
+    console.print(summary_table)
@@ -0,0 +1,205 @@
+import os
+import csv
+import gzip
+import pickle
+import bisect
+import ipaddress
+import warnings
+import threading
+from array import array
+
+DATABASE_VERSION = 1
+
+# Country code used for addresses that are in no range of the database
+UNKNOWN_COUNTRY = '-'
+
+# IPv4-mapped IPv6 addresses (::ffff:0:0/96), which IPv6 databases use for their IPv4 ranges
+IPV4_MAPPED_START = 0xFFFF00000000
+IPV4_MAPPED_END = 0xFFFFFFFFFFFF
+
+def parse_address(ip):
+    """
+    Returns (version, integer) for an IPv4/IPv6 address string, or None if it isn't one.
+    """
+    parts = ip.split('.')
+    if len(parts) == 4:
+        # Fast path for dotted IPv4, the common case in access logs
+        try:
+            a, b, c, d = [int(p) for p in parts]
+        except ValueError:
+            a = -1  # e.g. "::ffff:10.1.0.1", let ipaddress decide
+        if 0 <= a <= 255 and 0 <= b <= 255 and 0 <= c <= 255 and 0 <= d <= 255:
+            return 4, (a << 24) | (b << 16) | (c << 8) | d
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped:
+        return 4, int(address.ipv4_mapped)
+    return address.version, int(address)
+
+def parse_range(fields):
+    """
+    Reads the address range at the start of a CSV row, either "start,end,CC" (addresses
+    or integers) or "network/prefix,CC". Returns (version, start, end, rest) or None.
+    Integers above the IPv4 range are IPv6 (ip2location's IPv6 databases); ranges inside
+    ::ffff:0:0/96 are IPv4 ranges, since lookups map such addresses to IPv4.
+    """
+    if '/' in fields[0]:
+        try:
+            network = ipaddress.ip_network(fields[0].strip(), strict=False)
+        except ValueError:
+            return None
+        start, end = int(network.network_address), int(network.broadcast_address)
+        return network.version, start, end, fields[1:]
+    if len(fields) < 3:
+        return None
+    first, last = fields[0].strip(), fields[1].strip()
+    if first.isdigit() and last.isdigit():
+        start, end = int(first), int(last)
+        if end <= 0xFFFFFFFF:
+            return 4, start, end, fields[2:]
+        if IPV4_MAPPED_START <= start and end <= IPV4_MAPPED_END:
+            return 4, start - IPV4_MAPPED_START, end - IPV4_MAPPED_START, fields[2:]
+        if end >= 1 << 128:
+            return None
+        return 6, start, end, fields[2:]
+    start, end = parse_address(first), parse_address(last)
+    if not start or not end or start[0] != end[0]:
+        return None
+    return start[0], start[1], end[1], fields[2:]
+
+class GeoIPDatabase:
+    """
+    IP range -> country table, kept as sorted integer arrays and searched with bisect.
+    Load a CSV with from_csv() (db-ip / ip2location "start,end,CC" or "network/prefix,CC")
+    or a file written by save().
+    """
+    def __init__(self):
+        self.countries = []          # Country codes, indexed by the code arrays
+        self.v4_starts = array('L')
+        self.v4_ends = array('L')
+        self.v4_codes = array('H')
+        self.v6_starts = []          # 128-bit values don't fit an array
+        self.v6_ends = []
+        self.v6_codes = array('H')
+
+    @classmethod
+    def from_csv(cls, path):
+        opener = gzip.open if path.lower().endswith('.gz') else open
+        ranges = {4: [], 6: []}
+        skipped = 0
+        with opener(path, 'rt', encoding='utf-8', newline='') as f:
+            for fields in csv.reader(f):
+                if not fields:
+                    continue
+                parsed = parse_range(fields)
+                if parsed is None:
+                    skipped += 1
+                    continue
+                version, start, end, rest = parsed
+                country = rest[0].strip().upper() if rest and rest[0].strip() else UNKNOWN_COUNTRY
+                ranges[version].append((start, end, country))
+        # A header line is expected; more than that means rows of a layout we don't read
+        if skipped > 1:
+            warnings.warn(f"{path}: skipped {skipped} rows that are not IP ranges")
+
+        db = cls()
+        codes = {}
+        for version, rows in ranges.items():
+            rows.sort()
+            starts = db.v4_starts if version == 4 else db.v6_starts
+            ends = db.v4_ends if version == 4 else db.v6_ends
+            code_array = db.v4_codes if version == 4 else db.v6_codes
+            for start, end, country in rows:
+                code = codes.get(country)
+                if code is None:
+                    code = codes[country] = len(db.countries)
+                    db.countries.append(country)
+                starts.append(start)
+                ends.append(end)
+                code_array.append(code)
+        return db
+
+    def save(self, path):
+        tmp_file = path + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({
+                'version': DATABASE_VERSION,
+                'countries': self.countries,
+                'v4': (self.v4_starts.tobytes(), self.v4_ends.tobytes(), self.v4_codes.tobytes()),
+                'v6': (self.v6_starts, self.v6_ends, self.v6_codes.tobytes())
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        if data.get('version') != DATABASE_VERSION:
+            raise ValueError(f"Unsupported GeoIP database version in {path}")
+        db = cls()
+        db.countries = data['countries']
+        db.v4_starts.frombytes(data['v4'][0])
+        db.v4_ends.frombytes(data['v4'][1])
+        db.v4_codes.frombytes(data['v4'][2])
+        db.v6_starts, db.v6_ends = data['v6'][0], data['v6'][1]
+        db.v6_codes.frombytes(data['v6'][2])
+        return db
+
+    def __len__(self):
+        return len(self.v4_starts) + len(self.v6_starts)
+
+    def lookup(self, ip):
+        """
+        Returns the country code of `ip`, or None if it isn't in the database.
+        """
+        parsed = parse_address(ip)
+        if parsed is None:
+            return None
+        version, value = parsed
+        if version == 4:
+            starts, ends, codes = self.v4_starts, self.v4_ends, self.v4_codes
+        else:
+            starts, ends, codes = self.v6_starts, self.v6_ends, self.v6_codes
+        i = bisect.bisect_right(starts, value) - 1
+        if i >= 0 and value <= ends[i]:
+            return self.countries[codes[i]]
+        return None
+
+    def lookup_many(self, ips):
+        """
+        Returns {ip: country code or None}.
+        """
+        return {ip: self.lookup(ip) for ip in ips}
+
+    def country_counts(self, ip_counts):
+        """
+        Sums (ip, count) pairs per country, most common first.
+        """
+        totals = {}
+        for ip, count in ip_counts:
+            country = self.lookup(ip) or UNKNOWN_COUNTRY
+            totals[country] = totals.get(country, 0) + count
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+def get_database(path):
+    """
+    Loads the database at `path` (a .csv / .csv.gz file or one written by save()) once per
+    process, and again when the file changes.
+    """
+    mtime = os.path.getmtime(path)
+    with _databases_lock:
+        cached = _databases.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        lower = path.lower()
+        if lower.endswith('.csv') or lower.endswith('.csv.gz'):
+            db = GeoIPDatabase.from_csv(path)
+        else:
+            db = GeoIPDatabase.load(path)
+        _databases[path] = (mtime, db)
+        return db
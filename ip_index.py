@@ -0,0 +1,275 @@
+import os
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from log_reader import read_head, file_identity, complete_lines_end
+from log_parser import active_log_format
+
+# Index files are a header followed by segments, one per extend(), each appended on its own
+INDEX_VERSION = 2
+
+def encode_varint(buf, value):
+    """
+    Appends an unsigned LEB128 varint to a bytearray.
+    """
+    while value >= 0x80:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+def ip_reader(log_format):
+    """
+    Returns a function that takes a raw log line (bytes) and returns its client IP, or None
+    if the line doesn't match `log_format` (a log_parser.LogFormat).
+    """
+    if log_format.source.startswith('$remote_addr '):
+        # The IP is the first field, as in the combined format: no need to match the whole line
+        return lambda raw: raw.split(b' ', 1)[0].decode('ascii', 'replace')
+    pattern = log_format.pattern_bytes
+    group = log_format.indexes[0] + 1
+
+    def read_ip(raw):
+        match = pattern.match(raw)
+        return match.group(group).decode('ascii', 'replace') if match else None
+    return read_ip
+
+def decode_offsets(data):
+    """
+    Decodes a delta-encoded varint stream back into absolute byte offsets.
+    """
+    offsets = []
+    pos = 0
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        pos += value
+        offsets.append(pos)
+        value = 0
+        shift = 0
+    return offsets
+
+class IPIndex:
+    """
+    Byte offset of every line of one log file, grouped by client IP.
+    Offsets are stored per IP as delta-encoded varints, usually 1-3 bytes per line.
+    The IPs are read with `log_format` (the active format by default); an index saved with
+    another format isn't loaded.
+    """
+    def __init__(self, path, log_format=None):
+        self.path = os.path.abspath(path)
+        self.log_format = log_format or active_log_format()
+        self.reset()
+
+    def reset(self, inode=None, device=None):
+        self.inode = inode
+        self.device = device
+        self.end = 0          # Bytes of the log covered by the index
+        self.head = b''       # First bytes of the log, to detect copytruncate rotation
+        self.offsets = {}     # ip -> bytearray of varint deltas
+        self.last = {}        # ip -> last offset, the base for the next delta
+        self.saved = None     # Valid bytes of the index file, None if it must be rewritten
+
+    def is_valid_for(self, inode, device, size):
+        if self.inode != inode or self.device != device or size < self.end:
+            return False
+        return read_head(self.path, len(self.head)) == self.head
+
+    def extend(self):
+        """
+        Indexes the complete lines appended since the last call.
+        Returns the added offsets as {ip: varint deltas}, or None if there were no new lines.
+        """
+        inode, device, size = file_identity(self.path)
+        if not self.is_valid_for(inode, device, size):
+            self.reset(inode, device)
+
+        end = complete_lines_end(self.path, size)
+        if end <= self.end:
+            return None
+
+        # Deltas continue from each IP's last offset, so the new ones can be appended as they are
+        offsets = {}
+        last = self.last
+        read_ip = ip_reader(self.log_format)
+        with open(self.path, 'rb') as f:
+            f.seek(self.end)
+            pos = self.end
+            while pos < end:
+                raw = f.readline()
+                if not raw:
+                    break
+                ip = read_ip(raw)
+                if ip is None:
+                    pos += len(raw)
+                    continue
+                buf = offsets.get(ip)
+                if buf is None:
+                    buf = offsets[ip] = bytearray()
+                encode_varint(buf, pos - last.get(ip, 0))
+                last[ip] = pos
+                pos += len(raw)
+
+        for ip, buf in offsets.items():
+            existing = self.offsets.get(ip)
+            if existing is None:
+                self.offsets[ip] = bytearray(buf)
+            else:
+                existing += buf
+        self.end = end
+        if len(self.head) < 256:
+            self.head = read_head(self.path, min(end, 256))
+        return offsets
+
+    def lookup(self, ip):
+        """
+        Returns the byte offsets of all lines from `ip`, in file order.
+        """
+        return decode_offsets(self.offsets.get(ip, b''))
+
+    def save(self, index_file, added=None):
+        """
+        Appends the offsets an extend() `added` to the index file, or rewrites the file
+        (header plus the whole index as one segment) if it doesn't match this index.
+        """
+        if self.saved is None or added is None:
+            tmp_file = index_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                pickle.dump({
+                    'version': INDEX_VERSION,
+                    'path': self.path,
+                    'format': self.log_format.source,
+                    'inode': self.inode,
+                    'device': self.device
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+                self.write_segment(f, self.offsets, self.last)
+                self.saved = f.tell()
+            os.replace(tmp_file, index_file)
+            return
+        with open(index_file, 'r+b') as f:
+            # Drop whatever a crash may have left after the last complete segment
+            f.seek(self.saved)
+            f.truncate()
+            self.write_segment(f, added, {ip: self.last[ip] for ip in added})
+            self.saved = f.tell()
+
+    def write_segment(self, f, offsets, last):
+        pickle.dump({
+            'end': self.end,
+            'head': self.head,
+            'offsets': {ip: bytes(buf) for ip, buf in offsets.items()},
+            'last': last
+        }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path, index_file, log_format=None):
+        """
+        Loads a saved index for `path`, or returns a fresh one if the file is missing, stale
+        or was built with another log format.
+        A segment cut short by a crash is ignored and overwritten by the next save.
+        """
+        index = cls(path, log_format)
+        try:
+            f = open(index_file, 'rb')
+        except OSError:
+            return index
+        with f:
+            try:
+                header = pickle.load(f)
+            except (pickle.UnpicklingError, EOFError, ValueError):
+                return index
+            if (not isinstance(header, dict) or header.get('version') != INDEX_VERSION or header.get('path') != index.path
+                    or header.get('format') != index.log_format.source):
+                return index
+            index.inode = header['inode']
+            index.device = header['device']
+            saved = f.tell()
+            while True:
+                try:
+                    segment = pickle.load(f)
+                except (pickle.UnpicklingError, EOFError, ValueError):
+                    break
+                for ip, buf in segment['offsets'].items():
+                    existing = index.offsets.get(ip)
+                    if existing is None:
+                        index.offsets[ip] = bytearray(buf)
+                    else:
+                        existing += buf
+                index.last.update(segment['last'])
+                index.end = segment['end']
+                index.head = segment['head']
+                saved = f.tell()
+            index.saved = saved
+        return index
+
+class IPIndexStore:
+    """
+    Keeps per-file IP indexes in memory (LRU) and persists them under `index_dir`.
+    Indexes are built lazily on first lookup and extended when the log grows, and rebuilt
+    if the active log format changes.
+    """
+    def __init__(self, index_dir, max_indexes=4):
+        self.index_dir = index_dir
+        self.max_indexes = max_indexes
+        self.indexes = OrderedDict()
+        self.locks = {}             # path -> lock of its index (see path_lock)
+        self.lock = threading.Lock()
+
+    def index_file(self, path):
+        name = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.index_dir, name + '.ipidx')
+
+    def path_lock(self, path):
+        """
+        The lock that serializes building and reading the index of one file, so a build
+        doesn't hold up lookups in other files.
+        """
+        key = os.path.abspath(path)
+        with self.lock:
+            lock = self.locks.get(key)
+            if lock is None:
+                lock = self.locks[key] = threading.Lock()
+            return lock
+
+    def get(self, path):
+        """
+        Returns an up-to-date IPIndex for the log file. Call with path_lock(path) held.
+        """
+        key = os.path.abspath(path)
+        log_format = active_log_format()
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is not None:
+                self.indexes.move_to_end(key)
+        if index is None or index.log_format.source != log_format.source:
+            index = IPIndex.load(path, self.index_file(path), log_format)
+            with self.lock:
+                self.indexes[key] = index
+                while len(self.indexes) > self.max_indexes:
+                    self.indexes.popitem(last=False)
+
+        added = index.extend()
+        if added is not None:
+            os.makedirs(self.index_dir, exist_ok=True)
+            index.save(self.index_file(path), added)
+        return index
+
+    def read_lines(self, path, ip, offset=0, limit=None):
+        """
+        Returns (total, lines) where lines are the raw log lines of `ip`,
+        paginated by `offset` and `limit` in file order.
+        """
+        with self.path_lock(path):
+            positions = self.get(path).lookup(ip)
+        total = len(positions)
+        stop = total if limit is None else offset + limit
+        lines = []
+        with open(path, 'rb') as f:
+            for pos in positions[offset:stop]:
+                f.seek(pos)
+                lines.append(f.readline().decode('utf-8', 'surrogateescape'))
+        return total, lines
@@ -0,0 +1,205 @@
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    """
+    One background analysis: its state, progress and result.
+    The job is also the progress sink passed down to the scanning code (see log_reader.iter_records):
+    expect(nbytes) announces bytes that will be read, advance(nbytes, nlines) reports bytes read.
+    advance() raises JobCancelled once the job has been cancelled, which unwinds the scan.
+    A job may publish() estimated results (see sampling.py) while it works towards the exact one.
+    """
+    def __init__(self, key, func):
+        self.id = secrets.token_hex(8)
+        self.key = key
+        self.func = func
+        self.state = 'queued'           # queued, running, done, failed or cancelled
+        self.total_bytes = 0
+        self.done_bytes = 0
+        self.lines = 0
+        self.joined = 0                 # Identical requests that were attached to this job
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.preview = None
+        self.preview_version = 0        # Incremented by every publish()
+        self.cancel_requested = False
+        self.lock = threading.Lock()
+        self.finished_event = threading.Event()
+        self.preview_event = threading.Event()     # Set by the first preview, or when the job finishes
+
+    def expect(self, nbytes):
+        with self.lock:
+            self.total_bytes += nbytes
+
+    def advance(self, nbytes, nlines=0):
+        if self.cancel_requested:
+            raise JobCancelled()
+        with self.lock:
+            self.done_bytes += nbytes
+            self.lines += nlines
+
+    def publish(self, preview):
+        with self.lock:
+            self.preview = preview
+            self.preview_version += 1
+        self.preview_event.set()
+
+    def cancel(self):
+        """
+        Asks the job to stop. A queued job never starts, a running one stops at its next block.
+        """
+        self.cancel_requested = True
+        with self.lock:
+            if self.state == 'queued':
+                self.finish('cancelled')
+
+    def run(self):
+        with self.lock:
+            if self.state != 'queued':
+                return
+            self.state = 'running'
+            self.started = time.time()
+        try:
+            result = self.func(self)
+        except JobCancelled:
+            with self.lock:
+                self.finish('cancelled')
+        except Exception as e:
+            with self.lock:
+                self.error = str(e)
+                self.finish('failed')
+        else:
+            with self.lock:
+                # Finished before a late cancel took effect: the result is still good
+                self.result = result
+                self.finish('done')
+
+    def finish(self, state):
+        # Called with self.lock held
+        self.state = state
+        self.finished = time.time()
+        self.func = None
+        self.preview = None
+        self.finished_event.set()
+        self.preview_event.set()
+
+    @property
+    def is_finished(self):
+        return self.finished_event.is_set()
+
+    def wait(self, timeout=None):
+        return self.finished_event.wait(timeout)
+
+    def wait_preview(self, timeout=None):
+        """
+        Waits for the first preview or the end of the job.
+        """
+        return self.preview_event.wait(timeout)
+
+    def snapshot(self, include_result=False, include_preview=False):
+        """
+        JSON-ready progress report: bytes, lines/sec and an ETA extrapolated from the byte rate.
+        The latest preview is included on request until the job is finished.
+        """
+        with self.lock:
+            elapsed = ((self.finished or time.time()) - self.started) if self.started else 0
+            total = max(self.total_bytes, self.done_bytes)
+            info = {
+                'id': self.id,
+                'state': self.state,
+                'total_bytes': total,
+                'done_bytes': self.done_bytes,
+                'percent': 100.0 if self.state == 'done' else (round(self.done_bytes * 100.0 / total, 1) if total else 0.0),
+                'lines': self.lines,
+                'lines_per_sec': round(self.lines / elapsed) if elapsed > 0 else 0,
+                'elapsed': round(elapsed, 2),
+                'eta': None,
+                'joined': self.joined,
+                'preview_version': self.preview_version
+            }
+            if self.state == 'running' and elapsed > 0 and self.done_bytes > 0:
+                info['eta'] = round((total - self.done_bytes) * elapsed / self.done_bytes, 1)
+            if self.error is not None:
+                info['error'] = self.error
+            if include_result and self.state == 'done':
+                info['result'] = self.result
+            if include_preview and self.preview is not None:
+                info['preview'] = self.preview
+        return info
+
+class JobManager:
+    """
+    Runs jobs on a bounded thread pool, so only `max_workers` analyses use the CPU at once.
+    Submitting a key that matches a queued or running job joins that job instead of starting
+    another one. Finished jobs are kept for `keep_seconds` so clients can fetch the result,
+    and at most `max_finished` of them.
+    """
+    def __init__(self, max_workers=2, keep_seconds=600, max_finished=100):
+        self.max_workers = max_workers
+        self.keep_seconds = keep_seconds
+        self.max_finished = max_finished
+        self.jobs = OrderedDict()       # id -> Job, oldest first
+        self.active = {}                # key -> unfinished Job
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+
+    def submit(self, key, func):
+        """
+        Starts func(job) in the background, or returns the unfinished job with the same key.
+        Returns (job, joined).
+        """
+        with self.lock:
+            self.prune()
+            job = self.active.get(key)
+            if job is not None and not job.is_finished and not job.cancel_requested:
+                job.joined += 1
+                return job, True
+            job = Job(key, func)
+            self.jobs[job.id] = job
+            self.active[key] = job
+        self.pool.submit(self.run, job)
+        return job, False
+
+    def run(self, job):
+        try:
+            job.run()
+        finally:
+            with self.lock:
+                if self.active.get(job.key) is job:
+                    del self.active[job.key]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancels a job for everyone waiting on it. Returns the job, or None if it is unknown.
+        """
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+            with self.lock:
+                # A cancelled job can't be joined any more; the next identical request starts over
+                if self.active.get(job.key) is job:
+                    del self.active[job.key]
+        return job
+
+    def prune(self):
+        # Called with self.lock held
+        now = time.time()
+        finished = [job for job in self.jobs.values() if job.is_finished]
+        excess = len(finished) - self.max_finished
+        for job in finished:
+            if excess > 0 or now - job.finished > self.keep_seconds:
+                del self.jobs[job.id]
+                excess -= 1
@@ -0,0 +1,155 @@
+from sketches import QuantileSketch
+
+QUANTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+
+# Only the MAX_KEYS most requested paths and upstreams are reported. Up to MAX_TRACKED_KEYS
+# of them are kept exactly; past that, the least requested are folded together under OTHER_KEY
+MAX_KEYS = 500
+MAX_TRACKED_KEYS = 5000
+OTHER_KEY = '(other)'
+
+# Paths with fewer timed requests are left out of the slowest endpoints ranking
+MIN_SAMPLES = 5
+
+def endpoint(path):
+    """
+    The path without its query string, which is what latency is grouped by.
+    """
+    return path.split('?', 1)[0]
+
+def last_upstream(upstream):
+    """
+    The upstream that answered: the last of "a, b" (retries) or "a : b" (internal redirects).
+    """
+    return upstream.rpartition(' ')[2]
+
+def summarize(count, total, maximum, quantile):
+    """
+    Summary dict of one distribution; `quantile(q)` returns the value at rank floor(q * (count - 1)).
+    """
+    summary = {'count': count, 'mean': round(total / count, 4), 'max': round(maximum, 4)}
+    for name, q in QUANTILES:
+        summary[name] = round(quantile(q), 4)
+    return summary
+
+def most_requested(counts, n):
+    """
+    The `n` keys of {key: count} with the highest counts, ties broken by key, so the choice
+    doesn't depend on the order keys were seen or merged in.
+    """
+    if len(counts) <= n:
+        return set(counts)
+    return set(sorted(counts, key=lambda key: (-counts[key], key))[:n])
+
+class KeyedSketches:
+    """
+    One QuantileSketch per key (in first-seen order); summaries() reports the `max_keys`
+    most requested. Past `max_tracked` keys, the least requested are folded into OTHER_KEY
+    down to 3/4 of it, so results are exact (and the same however the input was split)
+    as long as there are at most `max_tracked` distinct keys.
+    """
+    def __init__(self, max_keys=MAX_KEYS, max_tracked=MAX_TRACKED_KEYS):
+        self.max_keys = max_keys
+        self.max_tracked = max_tracked
+        self.sketches = {}
+
+    def add(self, key, value):
+        sketch = self.sketches.get(key)
+        if sketch is None:
+            sketch = self.sketches[key] = QuantileSketch()
+            if len(self.sketches) > self.max_tracked:
+                self.fold()
+                sketch = self.sketches.get(key) or self.sketches[OTHER_KEY]
+        sketch.add(value)
+
+    def merge(self, other):
+        for key, sketch in other.sketches.items():
+            if key in self.sketches:
+                self.sketches[key].merge(sketch)
+            else:
+                self.sketches[key] = QuantileSketch().merge(sketch)
+        if len(self.sketches) > self.max_tracked:
+            self.fold()
+
+    def fold(self):
+        """
+        Folds the least requested keys into OTHER_KEY, down to 3/4 of max_tracked.
+        """
+        counts = {key: sketch.count for key, sketch in self.sketches.items() if key != OTHER_KEY}
+        keep = most_requested(counts, self.max_tracked * 3 // 4)
+        other = self.sketches.get(OTHER_KEY) or QuantileSketch()
+        for key in counts:
+            if key not in keep:
+                other.merge(self.sketches.pop(key))
+        self.sketches[OTHER_KEY] = other
+
+    def summaries(self):
+        counts = {key: sketch.count for key, sketch in self.sketches.items() if key != OTHER_KEY}
+        keep = most_requested(counts, self.max_keys)
+        return {
+            key: summarize(sketch.count, sketch.sum, sketch.max, sketch.quantile)
+            for key, sketch in self.sketches.items() if key in keep
+        }
+
+class LatencyStats:
+    """
+    Streaming $request_time / $upstream_response_time percentiles, overall and per endpoint,
+    upstream and hour, in bounded memory (see QuantileSketch and MAX_TRACKED_KEYS).
+    Only fed by records of log formats that have timing fields.
+    """
+    def __init__(self):
+        self.request_time = QuantileSketch()
+        self.upstream_time = QuantileSketch()
+        self.paths = KeyedSketches()
+        self.upstreams = KeyedSketches()
+        self.hours = KeyedSketches(24)
+
+    def add(self, record, path):
+        request_time = record.request_time
+        if request_time is not None:
+            self.request_time.add(request_time)
+            self.paths.add(endpoint(path), request_time)
+            if record.hour:
+                self.hours.add(record.hour, request_time)
+        upstream_time = record.upstream_time
+        if upstream_time is not None:
+            self.upstream_time.add(upstream_time)
+            self.upstreams.add(last_upstream(record.upstream), upstream_time)
+
+    def merge(self, other):
+        self.request_time.merge(other.request_time)
+        self.upstream_time.merge(other.upstream_time)
+        self.paths.merge(other.paths)
+        self.upstreams.merge(other.upstreams)
+        self.hours.merge(other.hours)
+
+    def summary(self, n=10):
+        """
+        Statistics for get_statistics(), or None if no record had timing fields.
+        """
+        if not self.request_time.count and not self.upstream_time.count:
+            return None
+        return build_summary(
+            self.request_time.count and summarize(self.request_time.count, self.request_time.sum,
+                                                  self.request_time.max, self.request_time.quantile),
+            self.upstream_time.count and summarize(self.upstream_time.count, self.upstream_time.sum,
+                                                   self.upstream_time.max, self.upstream_time.quantile),
+            self.paths.summaries(), self.upstreams.summaries(), self.hours.summaries(), n
+        )
+
+def build_summary(request_time, upstream_time, paths, upstreams, hours, n=10):
+    """
+    Assembles the 'latency' statistics from per-key summaries (shared with the columnar cache).
+    """
+    slowest = [(path, s) for path, s in paths.items() if path != OTHER_KEY and s['count'] >= MIN_SAMPLES]
+    slowest.sort(key=lambda item: (-item[1]['p95'], -item[1]['count'], item[0]))
+    return {
+        'request_time': request_time or None,
+        'upstream_time': upstream_time or None,
+        'slowest_paths': [dict(s, path=path) for path, s in slowest[:n]],
+        'upstreams': [
+            dict(s, upstream=key)
+            for key, s in sorted(upstreams.items(), key=lambda item: -item[1]['count']) if key != OTHER_KEY
+        ][:n],
+        'hourly': dict(sorted(hours.items()))
+    }
@@ -0,0 +1,189 @@
+import os
+import time
+import threading
+from collections import deque
+from log_parser import parse_log_line
+from log_reader import iter_lines_from, file_identity, complete_lines_end, read_head
+from security import SecurityAnalyzer
+
+def status_class(status):
+    """
+    '2xx', '3xx', '4xx' or '5xx' for an HTTP status (None for an unparsed line).
+    """
+    return f'{status // 100}xx' if status else None
+
+def line_entry(line, record):
+    """
+    What live clients get for a log line: the line, and the IP, status and status class
+    of its parsed `record` (None if the line didn't parse).
+    """
+    status = record.status if record else None
+    return {
+        'line': line,
+        'ip': record.ip if record else None,
+        'status': status,
+        'class': status_class(status)
+    }
+
+class TailSubscription:
+    """
+    One client's view of a FileWatcher: a bounded queue of live lines.
+    When the client falls behind, the oldest lines are dropped and counted.
+    """
+    def __init__(self, watcher, max_lines):
+        self.watcher = watcher
+        self.lines = deque(maxlen=max_lines)
+        self.dropped = 0
+        self.condition = threading.Condition()
+
+    def publish(self, batch):
+        with self.condition:
+            overflow = len(self.lines) + len(batch) - self.lines.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+            self.lines.extend(batch)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Waits up to `timeout` seconds for lines and returns (lines, dropped) since the last call.
+        """
+        with self.condition:
+            if not self.lines:
+                self.condition.wait(timeout)
+            lines = list(self.lines)
+            self.lines.clear()
+            dropped = self.dropped
+            self.dropped = 0
+        return lines, dropped
+
+class FileWatcher:
+    """
+    Background thread that follows one log file for all of its subscribers.
+    New bytes are read and parsed once per batch window and fanned out to every subscription.
+    A batch holds at most `max_lines` lines and `max_bytes` bytes; the rest of a larger
+    backlog (e.g. a rotated-in file read from its start) is left for the following windows.
+    The watcher starts at the end of the file and follows it across rotation.
+    Every line is also checked for threats, including floods and brute force across lines.
+    """
+    def __init__(self, path, batch_window=0.5, queue_size=1000, security_rules=None,
+                 max_lines=5000, max_bytes=1024 * 1024):
+        self.path = os.path.abspath(path)
+        self.batch_window = batch_window
+        self.queue_size = queue_size
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.security = SecurityAnalyzer(rules_file=security_rules)
+        self.subscriptions = []
+        self.lock = threading.Lock()
+        self.thread = None
+        self.inode = None
+        self.device = None
+        self.offset = 0
+        self.head = b''       # First bytes of the file, to detect copytruncate rotation
+
+    def subscribe(self):
+        subscription = TailSubscription(self, self.queue_size)
+        with self.lock:
+            self.subscriptions.append(subscription)
+            if self.thread is None:
+                self.inode, self.device, size = file_identity(self.path)
+                self.offset = complete_lines_end(self.path, size)
+                self.head = read_head(self.path, min(self.offset, 256))
+                self.thread = threading.Thread(target=self.run, name=f'tail:{self.path}', daemon=True)
+                self.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Removes a subscription. Returns True if the watcher has no subscribers left.
+        """
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+            return not self.subscriptions
+
+    def run(self):
+        while True:
+            time.sleep(self.batch_window)
+            with self.lock:
+                if not self.subscriptions:
+                    # Last client left; a later subscribe() starts a new thread
+                    self.thread = None
+                    return
+                subscriptions = list(self.subscriptions)
+            try:
+                batch = self.read_new_lines()
+            except (OSError, ValueError):
+                # The file may be missing for a moment while it is being rotated
+                continue
+            if batch:
+                for subscription in subscriptions:
+                    subscription.publish(batch)
+
+    def read_new_lines(self):
+        """
+        Reads and parses the complete lines appended since the last call, up to
+        `max_lines` lines or `max_bytes` bytes; the next call continues from there.
+        """
+        inode, device, size = file_identity(self.path)
+        if (inode != self.inode or device != self.device or size < self.offset
+                or read_head(self.path, len(self.head)) != self.head):
+            # Rotated (new inode) or truncated (copytruncate, even if the new file has already
+            # grown past the offset): follow the new file from its start
+            self.inode, self.device, self.offset = inode, device, 0
+            self.head = b''
+        if size == self.offset:
+            return []
+
+        batch = []
+        start = self.offset
+        lines = 0
+        for line, end_offset in iter_lines_from(self.path, self.offset):
+            if lines == self.max_lines or self.offset - start >= self.max_bytes:
+                # Left for the next call, self.offset still points at this line
+                break
+            self.offset = end_offset
+            lines += 1
+            line = line.strip()
+            if not line:
+                continue
+            record = parse_log_line(line)
+            entry = line_entry(line, record)
+            if record:
+                threats = self.security.check_request(record) or []
+                threats += self.security.check_rates(record) or []
+                if threats:
+                    entry['threats'] = [threat['type'] for threat in threats]
+            batch.append(entry)
+        if len(self.head) < 256:
+            self.head = read_head(self.path, min(self.offset, 256))
+        return batch
+
+class LiveTailHub:
+    """
+    Shares one FileWatcher per log file between all live clients.
+    """
+    def __init__(self, batch_window=0.5, queue_size=1000, security_rules=None, max_lines=5000, max_bytes=1024 * 1024):
+        self.batch_window = batch_window
+        self.queue_size = queue_size
+        self.security_rules = security_rules
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.watchers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, path):
+        key = os.path.abspath(path)
+        with self.lock:
+            watcher = self.watchers.get(key)
+            if watcher is None:
+                watcher = self.watchers[key] = FileWatcher(key, self.batch_window, self.queue_size, self.security_rules,
+                                                           self.max_lines, self.max_bytes)
+            return watcher.subscribe()
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            watcher = subscription.watcher
+            if watcher.unsubscribe(subscription) and self.watchers.get(watcher.path) is watcher:
+                del self.watchers[watcher.path]
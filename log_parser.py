@@ -1,3 +1,4 @@
+import os
 import re
 import datetime
 
@@ -7,33 +8,549 @@ LOG_PATTERN = re.compile(
     r'(?P<ip>[\d\.]+) - - \[(?P<time>.*?)\] "(?P<request>.*?)" (?P<status>\d+) (?P<bytes>\d+) "(?P<referer>.*?)" "(?P<user_agent>.*?)"'
 )
 
-def parse_log_line(line):
+# The same pattern over raw bytes, anchored at line starts so finditer() on a whole block
+# matches exactly the lines that LOG_PATTERN.match() would match one by one
+LOG_PATTERN_BYTES = re.compile(b'(?m)^' + LOG_PATTERN.pattern.encode('ascii'))
+
+HOUR_PATTERN = re.compile(r':(\d{2}):')
+
+_MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+}
+
+_MONTH_NAMES = {number: name for name, number in _MONTHS.items()}
+
+# "+0900" -> timezone object, shared by every line with the same offset
+_TZ_CACHE = {}
+# "+0900" -> 32400
+_OFFSET_CACHE = {}
+# "+0900" -> the one "+0900" str records keep instead of their $time_local (see time_key)
+_TZ_STRINGS = {}
+
+# $time_local values that format_time() rebuilds exactly from their epoch seconds and offset
+CANONICAL_TIME = re.compile(r'\d\d/[A-Z][a-z]{2}/\d{4}:\d\d:\d\d:[0-5]\d [+-]\d\d[0-5]\d', re.ASCII)
+
+# "21/Jan/2026:13:14 +0900" -> epoch seconds of that minute
+# Nginx logs are written in time order, so a small memo covers thousands of lines per entry.
+_MINUTE_CACHE = {}
+_MINUTE_CACHE_SIZE = 4096
+
+# "00".."23", so records share the hour strings instead of each slicing its own
+_HOURS = {f"{hour:02d}": f"{hour:02d}" for hour in range(24)}
+
+def _get_tz(tz_str):
+    tz = _TZ_CACHE.get(tz_str)
+    if tz is None:
+        if len(tz_str) != 5 or tz_str[0] not in '+-' or not tz_str[1:].isdigit():
+            raise ValueError(f"Invalid UTC offset: {tz_str}")
+        offset = datetime.timedelta(hours=int(tz_str[1:3]), minutes=int(tz_str[3:5]))
+        tz = datetime.timezone(-offset if tz_str[0] == '-' else offset)
+        _TZ_CACHE[tz_str] = tz
+    return tz
+
+def _decode_minute(time_str):
+    """
+    Returns the epoch seconds of the minute in a fixed-width timestamp, or None.
+    Layout: 21/Jan/2026:13:14:04 +0900
+            0  3   7    12 15 18 21
+    """
+    if (time_str[2] != '/' or time_str[6] != '/' or time_str[11] != ':'
+            or time_str[14] != ':' or time_str[20] != ' '):
+        return None
+    try:
+        month = _MONTHS[time_str[3:6]]
+        dt = datetime.datetime(
+            int(time_str[7:11]), month, int(time_str[0:2]),
+            int(time_str[12:14]), int(time_str[15:17]),
+            tzinfo=_get_tz(time_str[21:26])
+        )
+    except (KeyError, ValueError):
+        return None
+    return dt.timestamp()
+
+def parse_timestamp(time_str):
+    """
+    Decodes an nginx $time_local value (e.g. "21/Jan/2026:13:14:04 +0900").
+    Returns (epoch_seconds, hour) where hour is a two-digit string like "13".
+    Returns (0, hour or None) if the timestamp can't be parsed.
+    """
+    if len(time_str) == 26 and time_str[17] == ':':
+        key = time_str[:17] + time_str[20:]
+        base = _MINUTE_CACHE.get(key)
+        if base is None:
+            base = _decode_minute(time_str)
+            if base is not None:
+                if len(_MINUTE_CACHE) >= _MINUTE_CACHE_SIZE:
+                    _MINUTE_CACHE.clear()
+                _MINUTE_CACHE[key] = base
+        seconds = time_str[18:20]
+        if base is not None and seconds.isdigit() and seconds < '60':
+            hour = time_str[12:14]
+            return base + int(seconds), _HOURS.get(hour, hour)
+
+    # Slow path for anything that isn't the standard fixed-width layout
+    try:
+        dt = datetime.datetime.strptime(time_str, '%d/%b/%Y:%H:%M:%S %z')
+        return dt.timestamp(), f"{dt.hour:02d}"
+    except ValueError:
+        match = HOUR_PATTERN.search(time_str)
+        return 0, match.group(1) if match else None
+
+def time_key(time_str, timestamp):
+    """
+    What a record keeps of its $time_local value: just the shared UTC offset string ("+0900")
+    if format_time() gives the value back from the timestamp, else the value itself.
+    """
+    if timestamp and CANONICAL_TIME.fullmatch(time_str):
+        tz_str = time_str[21:26]
+        return _TZ_STRINGS.setdefault(tz_str, tz_str)
+    return time_str
+
+def format_time(timestamp, tz_str):
+    """
+    The $time_local value (e.g. "21/Jan/2026:13:14:04 +0900") of epoch seconds at a UTC offset.
+    """
+    dt = datetime.datetime.fromtimestamp(timestamp, _get_tz(tz_str))
+    return f"{dt.day:02d}/{_MONTH_NAMES[dt.month]}/{dt.year:04d}:{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d} {tz_str}"
+
+def utc_offset(time_str):
+    """
+    Returns the UTC offset in seconds of an nginx $time_local value (0 if it has none).
+    """
+    return offset_seconds(time_str[21:26])
+
+def offset_seconds(tz_str):
     """
-    Parses a single line of Nginx access log.
-    Returns a dictionary with fields: ip, time, request, status, bytes, referer, user_agent.
-    Returns None if the line does not match.
+    Returns the UTC offset in seconds of "+0900" (0 if it isn't an offset).
     """
-    match = LOG_PATTERN.match(line)
-    if match:
-        data = match.groupdict()
-        data['status'] = int(data['status'])
-        data['bytes'] = int(data['bytes'])
-        
-        # Parse timestamp
-        # Format: 21/Jan/2026:13:14:04 +0900
+    offset = _OFFSET_CACHE.get(tz_str)
+    if offset is None:
         try:
-            # Removing the brackets first if they are captured in the group, 
-            # but regex group 'time' is inside brackets: \[(?P<time>.*?)\]
-            # So data['time'] is like "21/Jan/2026:13:14:04 +0900"
-            dt = datetime.datetime.strptime(data['time'], '%d/%b/%Y:%H:%M:%S %z')
-            data['datetime_obj'] = dt
-            data['timestamp'] = dt.timestamp()
+            offset = int(_get_tz(tz_str).utcoffset(None).total_seconds())
         except ValueError:
-            data['datetime_obj'] = None
-            data['timestamp'] = 0
-            
-        return data
-    return None
+            return 0
+        _OFFSET_CACHE[tz_str] = offset
+    return offset
+
+# nginx variable -> (record field or None, regex for its value when it isn't quoted or bracketed)
+NGINX_VARIABLES = {
+    'remote_addr': ('ip', r'[0-9A-Fa-f:.]+'),
+    'time_local': ('time', r'[^\]\n]*'),
+    'request': ('request', r'[^"\n]*'),
+    'status': ('status', r'\d{3}'),
+    'body_bytes_sent': ('bytes', r'\d+'),
+    'bytes_sent': ('bytes', r'\d+'),
+    'http_referer': ('referer', r'[^"\n]*'),
+    'http_user_agent': ('user_agent', r'[^"\n]*'),
+    'request_time': ('request_time', r'\d+(?:\.\d+)?|-'),
+    # Several upstreams are listed as "a, b" (retries) or "a : b" (internal redirects)
+    'upstream_response_time': ('upstream_time', r'[^ \n,]+(?:(?:, | : )[^ \n,]+)*'),
+    'upstream_addr': ('upstream', r'[^ \n,]+(?:(?:, | : )[^ \n,]+)*')
+}
+
+# Fields every format must capture; the others default to "-", 0 or None
+REQUIRED_FIELDS = ('ip', 'time', 'request', 'status')
+FIELDS = ('ip', 'time', 'request', 'status', 'bytes', 'referer', 'user_agent', 'request_time', 'upstream_time', 'upstream')
+TIMING_FIELDS = ('request_time', 'upstream_time', 'upstream')
+
+# Named log_format strings accepted by get_log_format()
+LOG_FORMATS = {
+    'combined': '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent "$http_referer" "$http_user_agent"',
+    'timed': '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent "$http_referer" '
+             '"$http_user_agent" $request_time $upstream_response_time $upstream_addr'
+}
+
+_VARIABLE_PATTERN = re.compile(r'\$(?:\{(\w+)\}|(\w+))')
+
+class LogFormat:
+    """
+    A compiled access log format: a regex with one named group per record field
+    (see FIELDS), for text lines and for raw byte blocks.
+    Build one from an nginx log_format string with from_nginx().
+    """
+    def __init__(self, pattern, source=None):
+        self.source = source or pattern     # Identifies the format, e.g. for cache invalidation
+        self.pattern = re.compile(pattern)
+        self.pattern_bytes = re.compile(b'(?m)^' + pattern.encode('ascii'))
+        groups = self.pattern.groupindex
+        missing = [name for name in REQUIRED_FIELDS if name not in groups]
+        if missing:
+            raise ValueError(f"Log format has no {', '.join(missing)} field")
+        # 0-based position of each field in match.groups(), None if the format doesn't have it
+        self.indexes = tuple(groups[name] - 1 if name in groups else None for name in FIELDS)
+        self.timed = any(name in groups for name in TIMING_FIELDS)
+
+    @classmethod
+    def from_nginx(cls, log_format):
+        """
+        Compiles an nginx log_format string, e.g.
+        '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent $request_time'.
+        Variables that aren't record fields are matched but not captured.
+        """
+        parts = []
+        seen = set()
+        position = 0
+        for match in _VARIABLE_PATTERN.finditer(log_format):
+            parts.append(re.escape(log_format[position:match.start()]))
+            position = match.end()
+            name = match.group(1) or match.group(2)
+            field, value = NGINX_VARIABLES.get(name, (None, r'[^ \n]*'))
+            following = log_format[position:position + 1]
+            if following == '"' and field not in ('status', 'bytes', 'request_time'):
+                value = r'[^"\n]*'
+            elif following == ']':
+                value = r'[^\]\n]*'
+            if field is None or field in seen:
+                parts.append(f'(?:{value})')
+            else:
+                seen.add(field)
+                parts.append(f'(?P<{field}>{value})')
+        parts.append(re.escape(log_format[position:]))
+        return cls(''.join(parts), log_format)
+
+# The built-in default keeps the original combined regex
+COMBINED_FORMAT = LogFormat(LOG_PATTERN.pattern, LOG_FORMATS['combined'])
+
+def get_log_format(spec=None):
+    """
+    Returns the LogFormat for a name in LOG_FORMATS or an nginx log_format string
+    (combined if `spec` is empty).
+    """
+    if not spec or spec == 'combined':
+        return COMBINED_FORMAT
+    return LogFormat.from_nginx(LOG_FORMATS.get(spec, spec))
+
+# Format used when a parse function isn't given one. Set with the LOG_FORMAT environment
+# variable, which worker processes inherit, or set_log_format().
+_active_format = get_log_format(os.environ.get('LOG_FORMAT'))
+
+def set_log_format(spec):
+    global _active_format
+    _active_format = spec if isinstance(spec, LogFormat) else get_log_format(spec)
+    return _active_format
+
+def active_log_format():
+    return _active_format
+
+def parse_upstream_time(value):
+    """
+    Total of an $upstream_response_time value ("0.012", "0.010, 0.020", "-"), or None.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = None
+    for part in re.split(r'[,:]', value):
+        part = part.strip()
+        if part and part != '-':
+            try:
+                total = (total or 0.0) + float(part)
+            except ValueError:
+                pass
+    return total
+
+# Upper bound on the values shared by one parse_lines()/iter_records() call
+INTERN_TABLE_SIZE = 100000
+
+# "GET", "POST", ... shared by every record
+_METHODS = {}
+
+class LogRecord:
+    """
+    One parsed access log line.
+    Fields: ip, time, request, status, bytes, referer, user_agent, plus timestamp
+    (epoch seconds, 0 if invalid) and hour ("00"-"23" or None).
+    Records don't keep their own time and request strings: time is rebuilt from the
+    timestamp and a shared offset string (see time_key, which gives the `time` argument),
+    and a plain "METHOD path PROTOCOL" request is kept as its three parts, shared through
+    `strings` (see parse_lines), and joined again when read. Other requests are kept as is.
+    record['ip'] and record.get('ip') also work, as with the old dict records.
+    Formats with timing fields produce TimedLogRecord; here they are always None / "-".
+    """
+    __slots__ = ('ip', '_time', '_method', '_path', '_protocol', 'status', 'bytes', 'referer', 'user_agent',
+                 'timestamp', 'hour')
+
+    request_time = None     # $request_time in seconds
+    upstream_time = None    # $upstream_response_time in seconds, summed over all upstreams tried
+    upstream = '-'          # $upstream_addr
+
+    def __init__(self, ip, time, request, status, bytes, referer, user_agent, timestamp, hour, strings=None):
+        self.ip = ip
+        self._time = time
+        # Exactly "METHOD path PROTOCOL": two spaces and no other whitespace (which isn't printable),
+        # so split() finds the same three parts and joining them gives the request back
+        parts = request.split(' ') if request.count(' ') == 2 and request.isprintable() else None
+        if parts and parts[0] and parts[1] and parts[2]:
+            method, path, protocol = parts
+            if strings is not None:
+                method = strings.setdefault(method, method)
+                path = strings.setdefault(path, path)
+                protocol = strings.setdefault(protocol, protocol)
+            self._method = method
+            self._path = path
+            self._protocol = protocol
+        else:
+            self._method = None
+            self._path = request
+            self._protocol = None
+        self.status = status
+        self.bytes = bytes
+        self.referer = referer
+        self.user_agent = user_agent
+        self.timestamp = timestamp
+        self.hour = hour
+
+    @property
+    def time(self):
+        time = self._time
+        if self.timestamp and len(time) == 5:
+            return format_time(self.timestamp, time)
+        return time
+
+    @property
+    def utc_offset(self):
+        """
+        UTC offset of the record's time in seconds, see utc_offset().
+        """
+        time = self._time
+        return offset_seconds(time if self.timestamp and len(time) == 5 else time[21:26])
+
+    @property
+    def request(self):
+        if self._method is None:
+            return self._path
+        return f"{self._method} {self._path} {self._protocol}"
+
+    @property
+    def path(self):
+        if self._method is None:
+            return extract_path(self._path)
+        return self._path
+
+    @property
+    def method(self):
+        if self._method is not None:
+            return self._method
+        parts = self._path.split(None, 1)
+        if len(parts) < 2:
+            return None
+        method = _METHODS.get(parts[0])
+        if method is None:
+            method = parts[0]
+            if len(_METHODS) < 64:
+                _METHODS[method] = method
+        return method
+
+    @property
+    def protocol(self):
+        if self._protocol is not None:
+            return self._protocol
+        parts = self._path.split()
+        return parts[2] if len(parts) >= 3 else None
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __eq__(self, other):
+        if not isinstance(other, LogRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in FIELDS + ('timestamp', 'hour'))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.ip!r}, {self.time!r}, {self.request!r}, {self.status!r})"
+
+class TimedLogRecord(LogRecord):
+    """
+    LogRecord of a format with $request_time / $upstream_response_time / $upstream_addr.
+    """
+    __slots__ = ('request_time', 'upstream_time', 'upstream')
+
+    def __init__(self, ip, time, request, status, bytes, referer, user_agent, timestamp, hour,
+                 request_time, upstream_time, upstream, strings=None):
+        LogRecord.__init__(self, ip, time, request, status, bytes, referer, user_agent, timestamp, hour, strings)
+        self.request_time = request_time
+        self.upstream_time = upstream_time
+        self.upstream = upstream
+
+def record_datetime(record):
+    """
+    Builds the timezone-aware datetime for a parsed record on demand.
+    Returns None if the record has no valid timestamp.
+    """
+    if not record.timestamp:
+        return None
+    time_str = record.time
+    try:
+        tz = _get_tz(time_str[21:26])
+    except ValueError:
+        return datetime.datetime.strptime(time_str, '%d/%b/%Y:%H:%M:%S %z')
+    return datetime.datetime.fromtimestamp(record.timestamp, tz)
+
+def _make_record(log_format, groups, time, timestamp, hour, intern, strings):
+    """
+    Builds the record for the match groups (str) of a format other than COMBINED_FORMAT.
+    `time` is the time_key() of the $time_local group.
+    """
+    values = [None if i is None else groups[i] for i in log_format.indexes]
+    ip, _, request, status, nbytes, referer, user_agent, request_time, upstream_time, upstream = values
+    ip = intern(ip)
+    referer = intern(referer) if referer is not None else '-'
+    user_agent = intern(user_agent) if user_agent is not None else '-'
+    nbytes = int(nbytes) if nbytes is not None else 0
+    if not log_format.timed:
+        return LogRecord(ip, time, request, int(status), nbytes, referer, user_agent, timestamp, hour, strings)
+    return TimedLogRecord(
+        ip, time, request, int(status), nbytes, referer, user_agent, timestamp, hour,
+        float(request_time) if request_time and request_time != '-' else None,
+        parse_upstream_time(upstream_time) if upstream_time else None,
+        intern(upstream) if upstream else '-', strings
+    )
+
+def parse_log_line(line, log_format=None):
+    """
+    Parses a single line of Nginx access log (in the active format by default).
+    Returns a LogRecord, or None if the line does not match.
+    """
+    log_format = log_format or _active_format
+    match = log_format.pattern.match(line)
+    if not match:
+        return None
+    if log_format is not COMBINED_FORMAT:
+        groups = match.groups()
+        time_str = groups[log_format.indexes[1]]
+        timestamp, hour = parse_timestamp(time_str)
+        return _make_record(log_format, groups, time_key(time_str, timestamp), timestamp, hour,
+                            lambda value: value, None)
+    ip, time_str, request, status, nbytes, referer, user_agent = match.groups()
+    timestamp, hour = parse_timestamp(time_str)
+    return LogRecord(ip, time_key(time_str, timestamp), request, int(status), int(nbytes), referer, user_agent,
+                     timestamp, hour)
+
+def parse_lines(lines, strings=None, log_format=None):
+    """
+    Parses an iterable of lines and yields a LogRecord for each one that matches.
+    IPs, user agents, referers, methods, paths and protocols repeat a lot, so records share
+    one str object per distinct value, kept in `strings`, instead of each keeping its own copy.
+    """
+    if strings is None:
+        strings = {}
+    log_format = log_format or _active_format
+    if log_format is not COMBINED_FORMAT:
+        yield from _parse_formatted(lines, strings, log_format)
+        return
+    last_time = None
+    for line in lines:
+        match = LOG_PATTERN.match(line)
+        if not match:
+            continue
+        if len(strings) >= INTERN_TABLE_SIZE:
+            strings.clear()
+        ip, time_str, request, status, nbytes, referer, user_agent = match.groups()
+        if time_str != last_time:
+            last_time = time_str
+            timestamp, hour = parse_timestamp(time_str)
+            time = time_key(time_str, timestamp)
+        yield LogRecord(
+            strings.setdefault(ip, ip), time, request, int(status), int(nbytes),
+            strings.setdefault(referer, referer), strings.setdefault(user_agent, user_agent),
+            timestamp, hour, strings
+        )
+
+def _parse_formatted(lines, strings, log_format):
+    """
+    parse_lines() for formats other than COMBINED_FORMAT.
+    """
+    last_time = None
+    time_index = log_format.indexes[1]
+    for line in lines:
+        match = log_format.pattern.match(line)
+        if not match:
+            continue
+        if len(strings) >= INTERN_TABLE_SIZE:
+            strings.clear()
+        groups = match.groups()
+        if groups[time_index] != last_time:
+            last_time = groups[time_index]
+            timestamp, hour = parse_timestamp(last_time)
+            time = time_key(last_time, timestamp)
+        yield _make_record(log_format, groups, time, timestamp, hour, lambda value: strings.setdefault(value, value),
+                           strings)
+
+def parse_block(block, strings=None, log_format=None):
+    """
+    Yields a LogRecord for every matching line of a bytes block (in the active format by default).
+    Only the captured fields are decoded; invalid UTF-8 (common in scanner URLs) is kept
+    with surrogateescape instead of aborting the analysis.
+    `strings` maps raw bytes to their decoded str and can be shared between blocks, so each
+    distinct IP, referer and user agent is decoded once and shared by all its records.
+    """
+    if strings is None:
+        strings = {}
+    log_format = log_format or _active_format
+    if log_format is not COMBINED_FORMAT:
+        yield from _parse_block_formatted(block, strings, log_format)
+        return
+    last_time = None
+    for match in LOG_PATTERN_BYTES.finditer(block):
+        if len(strings) >= INTERN_TABLE_SIZE:
+            strings.clear()
+        ip, time_bytes, request, status, nbytes, referer, user_agent = match.groups()
+        if time_bytes != last_time:
+            last_time = time_bytes
+            time_str = time_bytes.decode('utf-8', 'surrogateescape')
+            timestamp, hour = parse_timestamp(time_str)
+            time = time_key(time_str, timestamp)
+        ip_str = strings.get(ip)
+        if ip_str is None:
+            ip_str = strings[ip] = ip.decode('ascii')
+        referer_str = strings.get(referer)
+        if referer_str is None:
+            referer_str = strings[referer] = referer.decode('utf-8', 'surrogateescape')
+        user_agent_str = strings.get(user_agent)
+        if user_agent_str is None:
+            user_agent_str = strings[user_agent] = user_agent.decode('utf-8', 'surrogateescape')
+        yield LogRecord(
+            ip_str, time, request.decode('utf-8', 'surrogateescape'), int(status), int(nbytes),
+            referer_str, user_agent_str, timestamp, hour, strings
+        )
+
+def _parse_block_formatted(block, strings, log_format):
+    """
+    parse_block() for formats other than COMBINED_FORMAT.
+    """
+    def decode(value):
+        text = strings.get(value)
+        if text is None:
+            text = strings[value] = value.decode('utf-8', 'surrogateescape')
+        return text
+
+    last_time = None
+    time_index = log_format.indexes[1]
+    # ip, referer, user_agent and upstream repeat and are shared through `strings`
+    shared = {log_format.indexes[i] for i in (0, 5, 6, 9)} - {None}
+    for match in log_format.pattern_bytes.finditer(block):
+        if len(strings) >= INTERN_TABLE_SIZE:
+            strings.clear()
+        groups = list(match.groups())
+        if groups[time_index] != last_time:
+            last_time = groups[time_index]
+            time_str = last_time.decode('utf-8', 'surrogateescape')
+            timestamp, hour = parse_timestamp(time_str)
+            time = time_key(time_str, timestamp)
+        for i, value in enumerate(groups):
+            if i == time_index:
+                groups[i] = time_str
+            elif value is not None:
+                groups[i] = decode(value) if i in shared else value.decode('utf-8', 'surrogateescape')
+        yield _make_record(log_format, groups, time, timestamp, hour, lambda value: value, strings)
 
 def extract_path(request_str):
     """
@@ -0,0 +1,300 @@
+import io
+import os
+import gzip
+import hashlib
+import metrics
+from log_parser import parse_block
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSED_EXTENSIONS = ('.gz', '.zst')
+
+# Bytes read per block by iter_blocks()
+BLOCK_SIZE = 1024 * 1024
+
+def iter_lines_from(path, offset=0):
+    """
+    Yields (line, end_offset) for every complete line of the file starting at byte `offset`.
+    A trailing line without a newline is not yielded, because nginx may still be writing it;
+    the caller resumes from the last end_offset on the next call.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        pos = offset
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            pos += len(raw)
+            yield raw.decode('utf-8', 'replace'), pos
+
+def read_head(path, size=256):
+    """
+    Returns the first `size` bytes of the file, used as a cheap fingerprint to detect
+    copytruncate-style rotation (same inode, new content).
+    """
+    with open(path, 'rb') as f:
+        return f.read(size)
+
+def head_fingerprint(path, size=256):
+    """
+    Compact form of read_head() for clients that keep a position in the file:
+    "<n>:<hash of the first n bytes>", n being at most `size`.
+    """
+    head = read_head(path, size)
+    return f"{len(head)}:{hashlib.blake2b(head, digest_size=8).hexdigest()}"
+
+def same_head(path, fingerprint):
+    """
+    Whether the file still starts with the bytes a head_fingerprint() was taken of.
+    """
+    length, _, _ = fingerprint.partition(':')
+    if not length.isdigit():
+        return False
+    return head_fingerprint(path, int(length)) == fingerprint
+
+def file_identity(path):
+    """
+    Returns (inode, device, size) of the file.
+    """
+    st = os.stat(path)
+    return st.st_ino, st.st_dev, st.st_size
+
+def complete_lines_end(path, size=None):
+    """
+    Returns the byte offset just past the last newline in the first `size` bytes of the file
+    (0 if there is none), i.e. where a reader should stop to avoid a half-written line.
+    """
+    if size is None:
+        size = os.path.getsize(path)
+    block = 64 * 1024
+    with open(path, 'rb') as f:
+        pos = size
+        while pos > 0:
+            read_from = max(0, pos - block)
+            f.seek(read_from)
+            chunk = f.read(pos - read_from)
+            idx = chunk.rfind(b'\n')
+            if idx != -1:
+                return read_from + idx + 1
+            pos = read_from
+    return 0
+
+def last_lines_start(path, count, end, floor=0):
+    """
+    Returns the byte offset where the last `count` lines before `end` (a line start, see
+    complete_lines_end) begin, reading backwards from `end`. Lines starting before `floor`
+    are left out, so at most end - floor bytes are read; with fewer lines the result is the
+    first line start at or after `floor` (`end` if there is none).
+    """
+    block = 64 * 1024
+    newlines = 0
+    # A newline at floor - 1 makes floor a line start, so that byte is read too
+    low = max(0, floor - 1)
+    first = end
+    with open(path, 'rb') as f:
+        pos = end
+        while pos > low:
+            read_from = max(low, pos - block)
+            f.seek(read_from)
+            chunk = f.read(pos - read_from)
+            idx = len(chunk)
+            while True:
+                idx = chunk.rfind(b'\n', 0, idx)
+                if idx == -1:
+                    break
+                newlines += 1
+                # The first newline found ends the last line
+                if newlines == count + 1:
+                    return read_from + idx + 1
+                first = read_from + idx + 1
+            pos = read_from
+    return 0 if floor <= 0 else first
+
+def line_boundary(f, offset, limit):
+    """
+    Start of the first line at or after `offset` (at most `limit`) of an open file.
+    """
+    if offset <= 0:
+        return 0
+    if offset >= limit:
+        return limit
+    f.seek(offset - 1)
+    # Finish the line that straddles the offset; a newline at offset - 1 means offset starts a line
+    f.readline()
+    return min(f.tell(), limit)
+
+def split_ranges(path, parts, end=None):
+    """
+    Splits the first `end` bytes of the file into at most `parts` newline-aligned
+    (start, end) byte ranges, in file order.
+    """
+    if end is None:
+        end = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            target = end * i // parts
+            if target <= bounds[-1]:
+                continue
+            f.seek(target - 1)
+            # Finish the line that straddles the target so the next range starts on a fresh line
+            f.readline()
+            pos = min(f.tell(), end)
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    if bounds[-1] < end:
+        bounds.append(end)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+def is_compressed(path):
+    return path.lower().endswith(COMPRESSED_EXTENSIONS)
+
+def open_log(path):
+    """
+    Opens a log for binary reading, decompressing .gz / .zst files on the fly.
+    """
+    lower = path.lower()
+    if lower.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if lower.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError("Reading .zst logs requires the 'zstandard' package")
+        raw = open(path, 'rb')
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True))
+    return open(path, 'rb')
+
+def iter_blocks(path, start=0, end=None):
+    """
+    Yields the bytes of the range [start, end) of a plain log in blocks of about BLOCK_SIZE
+    that end on a newline, so no line is split between two blocks.
+    A compressed log is decompressed as it is read and yielded the same way to its end;
+    `end` doesn't apply, and `start` is an offset in the decompressed data: what comes before
+    it, and the rest of the line it falls in, is decompressed but skipped.
+    """
+    compressed = is_compressed(path)
+    with open_log(path) as f:
+        remaining = None
+        if not compressed:
+            f.seek(start)
+            if end is not None:
+                remaining = end - start
+        blocks = _aligned_blocks(f, remaining)
+        if compressed and start > 0:
+            blocks = _skip_to_line(blocks, start)
+        yield from blocks
+
+def _aligned_blocks(f, remaining=None):
+    # Blocks of about BLOCK_SIZE read from `f` (at most `remaining` bytes), cut after their last newline
+    rest = b''
+    while remaining is None or remaining > 0:
+        data = f.read(BLOCK_SIZE if remaining is None else min(BLOCK_SIZE, remaining))
+        if not data:
+            break
+        if remaining is not None:
+            remaining -= len(data)
+        cut = data.rfind(b'\n') + 1
+        if cut == 0:
+            rest += data
+            continue
+        block = data if cut == len(data) else data[:cut]
+        yield rest + block if rest else block
+        rest = data[cut:]
+    if rest:
+        yield rest
+
+def _skip_to_line(blocks, start):
+    # The blocks from the first line that begins at or after byte `start` of their data
+    for block in blocks:
+        if start >= len(block):
+            start -= len(block)
+            continue
+        if start > 0 and block[start - 1] != 0x0A:
+            start = block.find(b'\n', start) + 1 or len(block)
+        if start < len(block):
+            yield block[start:] if start else block
+        start = 0
+
+def decompressed_size(path):
+    """
+    Size of the data in a compressed log (read through to count it).
+    """
+    size = 0
+    with open_log(path) as f:
+        while True:
+            data = f.read(BLOCK_SIZE)
+            if not data:
+                return size
+            size += len(data)
+
+def tail_ranges(history, nbytes, sizes=None):
+    """
+    Splits about the last `nbytes` bytes of a sequence of logs into (path, start, end) ranges
+    for iter_records(), starting on a line boundary. `history` is a list of (path, end)
+    pairs in log order (`end` None for the whole file; compressed logs are always whole and
+    count their decompressed size, cached in the `sizes` dict if given).
+    Returns (ranges in log order, whether they cover the whole history).
+    """
+    if sizes is None:
+        sizes = {}
+    ranges = []
+    remaining = nbytes
+    for path, end in reversed(history):
+        if remaining <= 0:
+            return ranges[::-1], False
+        if is_compressed(path):
+            size = sizes.get(path)
+            if size is None:
+                size = sizes[path] = decompressed_size(path)
+            start, end = max(0, size - remaining), None
+        else:
+            if end is None:
+                end = os.path.getsize(path)
+            size = end
+            with open(path, 'rb') as f:
+                start = line_boundary(f, end - remaining, end)
+        ranges.append((path, start, end))
+        remaining -= size
+        if start > 0:
+            return ranges[::-1], False
+    return ranges[::-1], True
+
+def iter_records(path, start=0, end=None, progress=None):
+    """
+    Yields the parsed records of the byte range [start, end) of a log (the whole log by default).
+    Lines are matched on the raw bytes and never decoded as a whole.
+    `progress` (see jobs.Job) is advanced after each block; a compressed log only
+    counts its bytes on disk once it has been read completely.
+    Reading and parsing are timed per block when an analysis is being measured (see metrics.py).
+    """
+    strings = {}
+    compressed = progress is not None and is_compressed(path)
+    recorder = metrics.current()
+    blocks = iter_blocks(path, start, end)
+    if recorder is not None:
+        blocks = recorder.iterate('read', blocks)
+    for block in blocks:
+        if recorder is None:
+            yield from parse_block(block, strings)
+        else:
+            records = recorder.call('parse', list, parse_block(block, strings))
+            recorder.count_block(block, len(records))
+            yield from records
+        if progress is not None:
+            progress.advance(0 if compressed else len(block), block.count(b'\n'))
+    if compressed:
+        progress.advance(os.path.getsize(path))
+
+def read_last_line(path):
+    """
+    Returns the last complete line of a plain log (decoded), or None if there is none.
+    """
+    end = complete_lines_end(path)
+    if end == 0:
+        return None
+    start = complete_lines_end(path, end - 1)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start).decode('utf-8', 'replace')
@@ -0,0 +1,76 @@
+import os
+import glob
+from log_parser import parse_log_line
+from log_reader import open_log, is_compressed, read_last_line
+
+# Nginx logs a request when it finishes but stamps it with its start time, so lines near
+# the edges of a file can be slightly out of order. File ranges are widened by this much.
+TIME_SLACK_SECONDS = 300
+
+def expand_sources(spec):
+    """
+    Turns a path, a glob pattern ("access.log*") or a list of either into existing file paths.
+    """
+    patterns = [spec] if isinstance(spec, str) else list(spec or [])
+    paths = []
+    for pattern in patterns:
+        if not pattern:
+            continue
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if os.path.isfile(path) and path not in paths:
+                paths.append(path)
+    return paths
+
+def first_timestamp(path, max_lines=100):
+    """
+    Returns the epoch timestamp of the first parseable line, or None.
+    """
+    with open_log(path) as f:
+        for _ in range(max_lines):
+            raw = f.readline()
+            if not raw:
+                break
+            record = parse_log_line(raw.decode('utf-8', 'replace'))
+            if record and record.timestamp:
+                return record.timestamp
+    return None
+
+def last_timestamp(path):
+    """
+    Returns the epoch timestamp of the last line of a plain log, or None.
+    Compressed logs would have to be decompressed completely, so they return None.
+    """
+    if is_compressed(path):
+        return None
+    line = read_last_line(path)
+    record = parse_log_line(line) if line else None
+    return record.timestamp if record and record.timestamp else None
+
+def plan_sources(paths, start_ts=None, end_ts=None):
+    """
+    Orders log files oldest first (by their first timestamp, mtime as tie-breaker) and
+    drops the ones whose time range lies completely outside [start_ts, end_ts].
+    A compressed file's range ends where the next file starts, since its last line
+    can't be read without decompressing it.
+    """
+    entries = []
+    for path in paths:
+        first = first_timestamp(path)
+        entries.append((first if first is not None else float('inf'), os.path.getmtime(path), path))
+    entries.sort()
+
+    planned = []
+    for i, (first, _, path) in enumerate(entries):
+        if start_ts is None and end_ts is None:
+            planned.append(path)
+            continue
+        last = last_timestamp(path)
+        if last is None and i + 1 < len(entries) and entries[i + 1][0] != float('inf'):
+            last = entries[i + 1][0]
+        if end_ts is not None and first != float('inf') and first - TIME_SLACK_SECONDS > end_ts:
+            continue
+        if start_ts is not None and last is not None and last + TIME_SLACK_SECONDS < start_ts:
+            continue
+        planned.append(path)
+    return planned
@@ -0,0 +1,237 @@
+import sys
+import gzip
+import random
+import argparse
+import datetime
+from itertools import accumulate
+
+# Browsers people use, with a version slot so there are many distinct strings
+BROWSER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.0.0 Safari/537.36 Edg/{v}.0.0.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.{m} Safari/605.1.15',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_{m} like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.{m} Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.0.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:{v}.0) Gecko/20100101 Firefox/{v}.0',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:{v}.0) Gecko/20100101 Firefox/{v}.0'
+]
+
+# Well-behaved crawlers and monitoring (counted as bots, not threats)
+BOT_AGENTS = [
+    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+    'Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)',
+    'Mozilla/5.0 (compatible; AhrefsBot/7.0; +http://ahrefs.com/robot/)',
+    'Mozilla/5.0 (compatible; SemrushBot/7~bl; +http://www.semrush.com/bot.html)',
+    'Mozilla/5.0 (compatible; YandexBot/3.0; +http://yandex.com/bots)',
+    'facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)'
+]
+
+# Requests matching each SecurityAnalyzer signature, with the status a server would answer
+ATTACK_REQUESTS = [
+    ("GET /products?id=1%27%20OR%20%271%27=%271 HTTP/1.1", 200),
+    ("GET /products?id=1' OR '1'='1 HTTP/1.1", 500),
+    ("GET /search?q=1 UNION SELECT username,password FROM users HTTP/1.1", 500),
+    ("GET /item?id=1 AND sleep(5) HTTP/1.1", 200),
+    ("GET /?id=1 and 1=1 union select table_name from information_schema.tables HTTP/1.1", 500),
+    ("GET /search?q=<script>alert(1)</script> HTTP/1.1", 200),
+    ("GET /profile?name=<img src=x onerror=alert(document.cookie)> HTTP/1.1", 200),
+    ("GET /redirect?to=javascript:alert(1) HTTP/1.1", 302),
+    ("GET /download?file=../../../../etc/passwd HTTP/1.1", 403),
+    ("GET /static/..\\..\\..\\windows\\win.ini HTTP/1.1", 400),
+    ("GET /.env HTTP/1.1", 404),
+    ("GET /.git/config HTTP/1.1", 404),
+    ("GET /wp-config.php.bak HTTP/1.1", 404),
+    ("GET /.aws/credentials HTTP/1.1", 404),
+    ("GET /.htaccess HTTP/1.1", 403),
+    ("POST /wp-login.php HTTP/1.1", 200),
+    ("POST /api/login HTTP/1.1", 401)
+]
+
+# Tools attacks are sent with (matching the Scanner/Bot signature)
+SCANNER_AGENTS = [
+    'sqlmap/1.7.11#stable (https://sqlmap.org)',
+    'Mozilla/5.00 (Nikto/2.5.0) (Evasions:None) (Test:000001)',
+    'python-requests/2.31.0',
+    'curl/8.4.0',
+    'Wget/1.21.4',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+]
+
+PATH_PREFIXES = ['/', '/products/', '/blog/', '/api/v1/items/', '/category/', '/static/js/', '/static/css/', '/images/']
+STATUSES = [(200, 80), (304, 8), (301, 3), (404, 6), (500, 1), (502, 1), (403, 1)]
+REFERERS = ['-', '-', '-', 'https://www.google.com/', 'https://example.com/', 'https://example.com/blog/', 'https://t.co/abc']
+
+# Lines that don't match the combined format, or only partially
+MALFORMED_LINES = [
+    '',
+    '-',
+    'GET / HTTP/1.1',
+    '\\x16\\x03\\x01\\x02\\x00\\x01\\x00\\x01\\xfc\\x03\\x03',
+    '2026/01/21 04:12:33 [error] 1234#1234: *5678 upstream timed out (110: Connection timed out)'
+]
+
+def zipf_weights(n, s):
+    """
+    Cumulative weights of a Zipf distribution over n ranks with exponent s.
+    """
+    return list(accumulate(1.0 / rank ** s for rank in range(1, n + 1)))
+
+class LogGenerator:
+    """
+    Seeded generator of realistic nginx combined-format lines. The same seed and
+    arguments always give the same log.
+    IPs and paths are Zipf-distributed, `bot_fraction` of requests come from crawlers,
+    `attack_fraction` match a SecurityAnalyzer signature and `malformed_fraction` don't
+    parse. Timestamps advance over `days` days from `start`, a bit out of order like a
+    real access log. With `timed`, lines are in the 'timed' LOG_FORMAT (request time,
+    upstream response time and upstream address appended).
+    """
+    def __init__(self, seed=0, ips=20000, paths=5000, zipf_exponent=1.1, bot_fraction=0.15,
+                 attack_fraction=0.01, malformed_fraction=0.001, days=3, start=None, timed=False):
+        self.random = random.Random(seed)
+        self.timed = timed
+        self.bot_fraction = bot_fraction
+        self.attack_fraction = attack_fraction
+        self.malformed_fraction = malformed_fraction
+        self.days = days
+        if start is None:
+            start = datetime.datetime(2026, 1, 20, tzinfo=datetime.timezone(datetime.timedelta(hours=9)))
+        self.start = start
+
+        rnd = self.random
+        self.ips = [self.random_ip() for _ in range(ips)]
+        self.paths = [self.random_path() for _ in range(paths)]
+        self.ip_weights = zipf_weights(ips, zipf_exponent)
+        self.path_weights = zipf_weights(paths, zipf_exponent)
+        self.browsers = [
+            template.format(v=rnd.randint(110, 131), m=rnd.randint(0, 6))
+            for template in BROWSER_AGENTS for _ in range(20)
+        ]
+        self.browser_weights = zipf_weights(len(self.browsers), 1.0)
+        self.status_codes = [code for code, _ in STATUSES]
+        self.status_weights = list(accumulate(weight for _, weight in STATUSES))
+
+    def random_ip(self):
+        rnd = self.random
+        # IPv4 only: the combined LOG_PATTERN doesn't match IPv6 clients
+        return f"{rnd.randint(1, 223)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(1, 254)}"
+
+    def random_path(self):
+        rnd = self.random
+        prefix = rnd.choice(PATH_PREFIXES)
+        if prefix.startswith('/static/'):
+            return f"{prefix}{rnd.randint(1, 500)}.{'js' if 'js' in prefix else 'css'}"
+        if prefix == '/images/':
+            return f"{prefix}{rnd.randint(1, 5000)}.jpg"
+        path = prefix if prefix == '/' and rnd.random() < 0.1 else f"{prefix}{rnd.randint(1, 100000)}"
+        if rnd.random() < 0.2:
+            path += f"?page={rnd.randint(1, 20)}&sort={rnd.choice(['new', 'popular', 'price'])}"
+        return path
+
+    def lines(self, count, chunk_size=10000):
+        """
+        Yields `count` log lines (without newlines).
+        """
+        rnd = self.random
+        span = self.days * 86400
+        base = self.start.timestamp()
+        tz = self.start.tzinfo
+        last_second = None
+        time_str = None
+        produced = 0
+        while produced < count:
+            n = min(chunk_size, count - produced)
+            # Sampled a chunk at a time: random.choices() is much cheaper per item with k > 1
+            ips = rnd.choices(self.ips, cum_weights=self.ip_weights, k=n)
+            paths = rnd.choices(self.paths, cum_weights=self.path_weights, k=n)
+            browsers = rnd.choices(self.browsers, cum_weights=self.browser_weights, k=n)
+            statuses = rnd.choices(self.status_codes, cum_weights=self.status_weights, k=n)
+            for i in range(n):
+                line_no = produced + i
+                # Up to 2 seconds out of order, never before the start
+                second = int(base + line_no * span / count + rnd.random() * 2)
+                if second != last_second:
+                    last_second = second
+                    time_str = datetime.datetime.fromtimestamp(second, tz).strftime('%d/%b/%Y:%H:%M:%S %z')
+
+                kind = rnd.random()
+                if kind < self.malformed_fraction:
+                    yield self.malformed_line(ips[i], time_str)
+                    continue
+                kind -= self.malformed_fraction
+                if kind < self.attack_fraction:
+                    request, status = rnd.choice(ATTACK_REQUESTS)
+                    agent = rnd.choice(SCANNER_AGENTS)
+                    referer = '-'
+                elif kind < self.attack_fraction + self.bot_fraction:
+                    request = f"GET {paths[i]} HTTP/1.1"
+                    status = statuses[i]
+                    agent = rnd.choice(BOT_AGENTS)
+                    referer = '-'
+                else:
+                    method = 'POST' if rnd.random() < 0.03 else 'GET'
+                    request = f"{method} {paths[i]} HTTP/{'2.0' if rnd.random() < 0.4 else '1.1'}"
+                    status = statuses[i]
+                    agent = browsers[i]
+                    referer = rnd.choice(REFERERS)
+                size = 0 if status in (304, 301, 302) else int(rnd.expovariate(1 / 8000))
+                line = f'{ips[i]} - - [{time_str}] "{request}" {status} {size} "{referer}" "{agent}"'
+                if self.timed:
+                    line += self.timing(request)
+                yield line
+            produced += n
+
+    def timing(self, request):
+        # Static files are served by nginx itself, everything else by one of a few upstreams
+        rnd = self.random
+        if ' /static/' in request or ' /images/' in request:
+            return f" {rnd.expovariate(1 / 0.002):.3f} - -"
+        upstream_time = rnd.lognormvariate(-3, 1)
+        return f" {upstream_time + rnd.expovariate(1 / 0.001):.3f} {upstream_time:.3f} 10.0.0.{rnd.randint(1, 4)}:8080"
+
+    def malformed_line(self, ip, time_str):
+        rnd = self.random
+        if rnd.random() < 0.5:
+            # Cut short, as if the writer died mid-line
+            line = f'{ip} - - [{time_str}] "GET {rnd.choice(self.paths)} HTTP/1.1" 200 {rnd.randint(0, 9999)} "-" "Mozilla/5.0'
+            return line[:rnd.randint(1, len(line) - 1)]
+        return rnd.choice(MALFORMED_LINES)
+
+    def write(self, path, count):
+        """
+        Writes `count` lines to `path` (gzip-compressed if it ends in .gz).
+        """
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'wt', encoding='utf-8', newline='\n') as f:
+            batch = []
+            for line in self.lines(count):
+                batch.append(line)
+                if len(batch) >= 10000:
+                    f.write('\n'.join(batch) + '\n')
+                    batch = []
+            if batch:
+                f.write('\n'.join(batch) + '\n')
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic nginx access log generator")
+    parser.add_argument("output", help="File to write (.gz to compress), '-' for stdout")
+    parser.add_argument("--lines", type=int, default=100000, help="Number of lines (default: 100000)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--days", type=int, default=3, help="Days the timestamps span (default: 3)")
+    parser.add_argument("--attack-fraction", type=float, default=0.01, help="Share of attack requests (default: 0.01)")
+    parser.add_argument("--bot-fraction", type=float, default=0.15, help="Share of crawler requests (default: 0.15)")
+    parser.add_argument("--malformed-fraction", type=float, default=0.001, help="Share of unparsable lines (default: 0.001)")
+    parser.add_argument("--timed", action="store_true", help="Append timing fields (LOG_FORMAT=timed)")
+    args = parser.parse_args()
+
+    generator = LogGenerator(seed=args.seed, days=args.days, attack_fraction=args.attack_fraction,
+                             bot_fraction=args.bot_fraction, malformed_fraction=args.malformed_fraction,
+                             timed=args.timed)
+    if args.output == '-':
+        for line in generator.lines(args.lines):
+            sys.stdout.write(line + '\n')
+    else:
+        generator.write(args.output, args.lines)
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,56 @@
 import argparse
-import sys
+import re
 import os
-from log_parser import parse_log_line
-from analyzer import LogAnalyzer
-from display import display_report
+import sys
+from log_parser import set_log_format
+from parallel import analyze_files
+from log_sources import expand_sources, plan_sources
+from display import display_report, display_profile
+import metrics
 
 def main():
     parser = argparse.ArgumentParser(description="Nginx Access Log Analyzer")
-    parser.add_argument("logfile", help="Path to the nginx access log file")
+    parser.add_argument("logfile", nargs='+', help="Nginx access log files or glob patterns (.gz / .zst are decompressed)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes to analyze with (default: 1)")
+    parser.add_argument("--rules", help="JSON file with additional threat signatures")
+    parser.add_argument("--geoip", help="IP range -> country database (.csv) for a Top Countries table")
+    parser.add_argument("--log-format", help="'combined' (default), 'timed' or an nginx log_format string "
+                                             "(with $request_time for a Slowest Endpoints table)")
+    parser.add_argument("--profile", action="store_true", help="Print time per pipeline stage, lines/sec and peak memory")
     args = parser.parse_args()
 
-    if not os.path.exists(args.logfile):
-        print(f"Error: File '{args.logfile}' not found.")
-        sys.exit(1)
+    if args.log_format:
+        try:
+            set_log_format(args.log_format)
+        except (ValueError, re.error) as e:
+            print(f"Error: Invalid log format: {e}")
+            sys.exit(1)
+        # Worker processes read the format from the environment
+        os.environ['LOG_FORMAT'] = args.log_format
 
-    analyzer = LogAnalyzer()
-    
-    print(f"Analyzing {args.logfile}...")
-    
-    try:
-        with open(args.logfile, 'r', encoding='utf-8') as f:
-            for line in f:
-                if not line.strip():
-                    continue
-                record = parse_log_line(line)
-                if record:
-                    analyzer.process_record(record)
-    except Exception as e:
-        print(f"Error reading file: {e}")
+    logfiles = expand_sources(args.logfile)
+    if not logfiles:
+        print(f"Error: File '{' '.join(args.logfile)}' not found.")
         sys.exit(1)
 
-    stats = analyzer.get_statistics()
+    print(f"Analyzing {', '.join(logfiles)}...")
+
+    if args.profile:
+        metrics.install()
+
+    with metrics.measure(', '.join(logfiles)) as recorder:
+        try:
+            analyzer = analyze_files(plan_sources(logfiles), workers=args.workers, security_rules=args.rules,
+                                     geoip_database=args.geoip)
+        except Exception as e:
+            print(f"Error reading file: {e}")
+            sys.exit(1)
+
+        stats = analyzer.get_statistics()
     display_report(stats)
 
+    if recorder is not None:
+        display_profile(recorder.snapshot())
+
 if __name__ == "__main__":
     main()
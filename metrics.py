@@ -0,0 +1,313 @@
+import os
+import sys
+import time
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from jobs import JobCancelled
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Pipeline stages, timed exclusive of the stages nested in them so they add up:
+#   read        file I/O and decompression (log_reader.iter_blocks)
+#   parse       regex matching and record building (log_parser.parse_block)
+#   timestamp   time string decoding (log_parser.parse_timestamp)
+#   analyze     counter updates (LogAnalyzer.process_record)
+#   security    signature checks (SecurityAnalyzer.check_request)
+#   rates       flood / brute force windows (SecurityAnalyzer.check_rates)
+#   columnar    column building (ColumnarLog.append)
+#   statistics  aggregation (get_statistics)
+STAGES = ('read', 'parse', 'timestamp', 'analyze', 'security', 'rates', 'columnar', 'statistics')
+COUNTERS = ('bytes_read', 'lines', 'records', 'unmatched_lines')
+
+# Analyses kept for /api/metrics
+RECENT_ANALYSES = 20
+
+# Seconds between two samples of the resident set size during an analysis
+RSS_SAMPLE_SECONDS = 0.05
+
+_local = threading.local()
+_installed = False
+
+def process_peak_rss():
+    """
+    Peak resident set size over this process's whole lifetime in bytes, or None where it
+    isn't available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def current_rss():
+    """
+    Resident set size of this process right now in bytes, or None where /proc isn't available.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+class Recorder:
+    """
+    Stage times, call counts and line counters of one analysis.
+    Stage time is exclusive: time spent in a nested stage is only counted there.
+    peak_rss is the analysis's own peak, not the process's: the resident set size is sampled
+    as blocks are read, plus the process peak if that was reached during the analysis.
+    With worker processes, it is the largest of the processes' peaks.
+    """
+    def __init__(self, label=None):
+        self.label = label
+        self.stages = {}        # stage -> [calls, seconds]
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.nested = 0.0       # Time of the stages nested in the one being timed
+        self.started = time.time()
+        self.elapsed = None
+        self.process_peak = process_peak_rss()
+        self.peak_rss = current_rss()
+        self.next_rss_sample = time.monotonic() + RSS_SAMPLE_SECONDS
+        self.state = 'running'
+
+    def add(self, stage, seconds, calls=1):
+        entry = self.stages.get(stage)
+        if entry is None:
+            entry = self.stages[stage] = [0, 0.0]
+        entry[0] += calls
+        entry[1] += seconds
+
+    def call(self, stage, func, *args, **kwargs):
+        """
+        Calls func(*args, **kwargs) and counts its time under `stage`.
+        """
+        saved = self.nested
+        self.nested = 0.0
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.add(stage, elapsed - self.nested)
+            self.nested = saved + elapsed
+
+    def iterate(self, stage, iterable):
+        """
+        Yields the items of `iterable`, counting the time taken to produce each under `stage`.
+        """
+        iterator = iter(iterable)
+        while True:
+            try:
+                item = self.call(stage, next, iterator)
+            except StopIteration:
+                # The call that found the end doesn't count
+                self.stages[stage][0] -= 1
+                return
+            yield item
+
+    def count_block(self, block, records):
+        """
+        Counts a block of raw log bytes of which `records` lines were parsed.
+        """
+        lines = block.count(b'\n') + (0 if block.endswith(b'\n') else 1)
+        counters = self.counters
+        counters['bytes_read'] += len(block)
+        counters['lines'] += lines
+        counters['records'] += records
+        counters['unmatched_lines'] += lines - records
+        if time.monotonic() >= self.next_rss_sample:
+            self.sample_rss()
+
+    def sample_rss(self):
+        rss = current_rss()
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss or 0, rss)
+        self.next_rss_sample = time.monotonic() + RSS_SAMPLE_SECONDS
+
+    def merge(self, snapshot):
+        """
+        Adds the snapshot() of a recorder from a worker process.
+        """
+        for stage, entry in snapshot['stages'].items():
+            self.add(stage, entry['seconds'], entry['calls'])
+        for name in COUNTERS:
+            self.counters[name] += snapshot[name]
+        if snapshot['peak_rss'] is not None:
+            self.peak_rss = max(self.peak_rss or 0, snapshot['peak_rss'])
+
+    def finish(self, state='done'):
+        self.elapsed = time.time() - self.started
+        self.sample_rss()
+        peak = process_peak_rss()
+        if peak is not None and self.process_peak is not None and peak > self.process_peak:
+            # The process reached a new high during the analysis, so that was the analysis's peak
+            self.peak_rss = max(self.peak_rss or 0, peak)
+        self.state = state
+
+    def snapshot(self):
+        elapsed = self.elapsed if self.elapsed is not None else time.time() - self.started
+        info = {
+            'label': self.label,
+            'state': self.state,
+            'started': self.started,
+            'elapsed': round(elapsed, 4),
+            'lines_per_sec': round(self.counters['lines'] / elapsed) if elapsed > 0 else 0,
+            'peak_rss': self.peak_rss,
+            'stages': {
+                stage: {'calls': calls, 'seconds': round(seconds, 6)}
+                for stage, (calls, seconds) in sorted(self.stages.items(), key=lambda item: STAGES.index(item[0]))
+            }
+        }
+        info.update(self.counters)
+        return info
+
+class MetricsRegistry:
+    """
+    Totals over all finished analyses plus the most recent ones.
+    """
+    def __init__(self, recent=RECENT_ANALYSES):
+        self.totals = Recorder()
+        self.analyses = 0
+        self.seconds = 0.0
+        self.recent = deque(maxlen=recent)
+        self.lock = threading.Lock()
+
+    def record(self, recorder):
+        snapshot = recorder.snapshot()
+        with self.lock:
+            self.totals.merge(snapshot)
+            self.analyses += 1
+            self.seconds += recorder.elapsed
+            self.recent.append(snapshot)
+
+    def snapshot(self):
+        with self.lock:
+            totals = self.totals.snapshot()
+            return {
+                'enabled': _installed,
+                'analyses': self.analyses,
+                'analysis_seconds': round(self.seconds, 4),
+                'process_peak_rss': process_peak_rss(),
+                'stages': totals['stages'],
+                'counters': {name: totals[name] for name in COUNTERS},
+                'recent': list(self.recent)
+            }
+
+    def prometheus(self, prefix='logcockpit'):
+        """
+        The totals in the Prometheus text exposition format.
+        """
+        info = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{prefix}_{name}{labels} {value}')
+
+        metric('instrumentation_enabled', 'gauge', 'Whether pipeline instrumentation is installed.',
+               [('', int(info['enabled']))])
+        metric('analyses_total', 'counter', 'Analyses run with instrumentation.', [('', info['analyses'])])
+        metric('analysis_seconds_total', 'counter', 'Wall time of instrumented analyses.',
+               [('', info['analysis_seconds'])])
+        metric('stage_seconds_total', 'counter', 'Time spent per pipeline stage, summed over worker processes.',
+               [(f'{{stage="{stage}"}}', entry['seconds']) for stage, entry in info['stages'].items()])
+        metric('stage_calls_total', 'counter', 'Calls per pipeline stage.',
+               [(f'{{stage="{stage}"}}', entry['calls']) for stage, entry in info['stages'].items()])
+        metric('bytes_read_total', 'counter', 'Log bytes read (decompressed).', [('', info['counters']['bytes_read'])])
+        metric('lines_total', 'counter', 'Log lines read.', [('', info['counters']['lines'])])
+        metric('unmatched_lines_total', 'counter', 'Lines that did not match the log format.',
+               [('', info['counters']['unmatched_lines'])])
+        if info['recent']:
+            metric('last_analysis_lines_per_second', 'gauge', 'Throughput of the most recent analysis.',
+                   [('', info['recent'][-1]['lines_per_sec'])])
+        if info['recent'] and info['recent'][-1]['peak_rss'] is not None:
+            metric('last_analysis_peak_rss_bytes', 'gauge', 'Peak resident set size during the most recent analysis.',
+                   [('', info['recent'][-1]['peak_rss'])])
+        if info['process_peak_rss'] is not None:
+            metric('process_peak_rss_bytes', 'gauge', 'Peak resident set size of the server process since it started.',
+                   [('', info['process_peak_rss'])])
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+def current():
+    """
+    The Recorder of the analysis running in this thread, or None.
+    """
+    return getattr(_local, 'recorder', None)
+
+@contextmanager
+def recording(recorder):
+    """
+    Makes `recorder` collect the stage times of the code run in this thread.
+    """
+    saved = current()
+    _local.recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _local.recorder = saved
+
+@contextmanager
+def measure(label=None):
+    """
+    Records one analysis into `registry`. Yields its Recorder, or None (and records nothing)
+    if instrumentation isn't installed.
+    """
+    if not _installed:
+        yield None
+        return
+    recorder = Recorder(label)
+    state = 'failed'
+    try:
+        with recording(recorder):
+            yield recorder
+        state = 'done'
+    except JobCancelled:
+        state = 'cancelled'
+        raise
+    finally:
+        recorder.finish(state)
+        registry.record(recorder)
+
+def timed(stage, func):
+    """
+    Wraps func so calls made while a Recorder is active count under `stage`.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        recorder = getattr(_local, 'recorder', None)
+        if recorder is None:
+            return func(*args, **kwargs)
+        return recorder.call(stage, func, *args, **kwargs)
+    return wrapper
+
+def install():
+    """
+    Wraps the per-record pipeline functions with timers. Until this is called the pipeline
+    runs unmodified, so instrumentation costs nothing when it is off.
+    """
+    global _installed
+    if _installed:
+        return
+    import log_parser
+    import analyzer
+    import security
+    import columnar
+    log_parser.parse_timestamp = timed('timestamp', log_parser.parse_timestamp)
+    analyzer.LogAnalyzer.process_record = timed('analyze', analyzer.LogAnalyzer.process_record)
+    analyzer.LogAnalyzer.get_statistics = timed('statistics', analyzer.LogAnalyzer.get_statistics)
+    security.SecurityAnalyzer.check_request = timed('security', security.SecurityAnalyzer.check_request)
+    security.SecurityAnalyzer.check_rates = timed('rates', security.SecurityAnalyzer.check_rates)
+    columnar.ColumnarLog.append = timed('columnar', columnar.ColumnarLog.append)
+    columnar.ColumnarLog.get_statistics = timed('statistics', columnar.ColumnarLog.get_statistics)
+    _installed = True
+
+def installed():
+    return _installed
@@ -0,0 +1,245 @@
+import os
+import metrics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from analyzer import LogAnalyzer
+from jobs import JobCancelled
+from log_reader import iter_records, split_ranges, is_compressed, tail_ranges
+
+# Below this size the cost of starting worker processes outweighs the gain
+MIN_PARALLEL_BYTES = 4 * 1024 * 1024
+
+# Seconds between two checks for a cancelled job while waiting for the workers
+CANCEL_POLL_SECONDS = 0.25
+
+# Bytes of log first read back to warm up a rate detector (see warm_up_rates)
+WARM_UP_BYTES = 1024 * 1024
+# Records between two checks for cancellation during a warm-up
+WARM_UP_CHECK_RECORDS = 10000
+
+# Set in each worker process by a pool from start_pool(): tells it to stop scanning
+_cancel_event = None
+
+def _set_cancel_event(event):
+    global _cancel_event
+    _cancel_event = event
+
+def start_pool(workers):
+    """
+    Returns (ProcessPoolExecutor, cancel event) for collect(). Setting the event makes
+    the workers' LineCounter raise JobCancelled at their next block.
+    """
+    context = multiprocessing.get_context()
+    event = context.Event()
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                               initializer=_set_cancel_event, initargs=(event,))
+    return pool, event
+
+def warm_up_rates(detector, history, progress=None):
+    """
+    Brings a fresh rates.RateDetector to the state it would have after every line of
+    `history`, a list of (path, end) pairs in log order (`end` None for the whole file), so
+    rate threats near the start of a range or file are those of one sequential pass.
+    Only the end of the history is read: WARM_UP_BYTES first, then more until
+    RateDetector.warm_up() vouches for the state or the whole history has been read.
+    `progress` is only checked for cancellation.
+    """
+    sizes = {}
+    nbytes = WARM_UP_BYTES
+    while True:
+        ranges, whole = tail_ranges(history, nbytes, sizes)
+        span = []
+        records = _warm_up_records(ranges, span, progress)
+        if detector.warm_up(records) or whole:
+            return
+        detector.reset()
+        # Read back far enough to cover the history the detector needs, judging by the lines seen
+        factor = 4
+        if len(span) == 2 and span[1] > span[0]:
+            factor = min(max(2, 1.5 * detector.history_seconds() / (span[1] - span[0])), 64)
+        nbytes = int(nbytes * factor)
+
+def _warm_up_records(ranges, span, progress):
+    # Records of the ranges; `span` ends up as [first, latest timestamp] of them
+    count = 0
+    for path, start, end in ranges:
+        for record in iter_records(path, start, end):
+            ts = record.timestamp
+            if ts:
+                if not span:
+                    span.extend((ts, ts))
+                elif ts > span[1]:
+                    span[1] = ts
+            count += 1
+            if progress is not None and count % WARM_UP_CHECK_RECORDS == 0:
+                progress.advance(0)
+            yield record
+
+def analyze_records(records, history=None, progress=None, **options):
+    """
+    Feeds records to a new LogAnalyzer; its rate detector is first warmed up with the
+    logs in `history` (see warm_up_rates) if they precede the records.
+    """
+    analyzer = LogAnalyzer(**options)
+    if history:
+        warm_up_rates(analyzer.security_analyzer.rate_detector, history, progress)
+    for record in records:
+        analyzer.process_record(record)
+    return analyzer
+
+class LineCounter:
+    """
+    Progress sink for worker processes, which can't report to the parent's job as they go.
+    The line count is sent back with the result instead. Like jobs.Job, advance() raises
+    JobCancelled once the parent cancelled the pool (see start_pool).
+    """
+    def __init__(self):
+        self.lines = 0
+
+    def expect(self, nbytes):
+        pass
+
+    def advance(self, nbytes, nlines=0):
+        if _cancel_event is not None and _cancel_event.is_set():
+            raise JobCancelled()
+        self.lines += nlines
+
+def analyze_range(path, start, end, progress=None, history=None, **options):
+    """
+    Parses and analyzes the lines in one byte range of the log. Runs inside a worker process.
+    `history` lists the (path, end) logs before the file, see warm_up_rates; the bytes of
+    the file before `start` are added to it.
+    `options` are passed through to LogAnalyzer.
+    """
+    history = list(history or [])
+    if start > 0:
+        history.append((path, start))
+    return analyze_records(iter_records(path, start, end, progress), history, progress, **options)
+
+def analyze_whole(path, end=None, progress=None, history=None, **options):
+    """
+    Analyzes one file sequentially: a plain log up to byte `end`, or a whole compressed log.
+    Runs inside a worker process when several files are analyzed concurrently.
+    """
+    if is_compressed(path):
+        return analyze_records(iter_records(path, progress=progress), history, progress, **options)
+    if end is None:
+        end = os.path.getsize(path)
+    return analyze_range(path, 0, end, progress, history, **options)
+
+def counting_lines(func, *args, profile=False, **options):
+    """
+    Runs func(*args, progress=..., **options) in a worker process and returns
+    (result, lines read, metrics.Recorder snapshot or None). The snapshot is only taken
+    if `profile` is set, i.e. the submitting analysis is being measured.
+    """
+    counter = LineCounter()
+    if not profile:
+        return func(*args, progress=counter, **options), counter.lines, None
+    metrics.install()
+    recorder = metrics.Recorder()
+    with metrics.recording(recorder):
+        result = func(*args, progress=counter, **options)
+    recorder.finish()
+    return result, counter.lines, recorder.snapshot()
+
+def collect(futures, sizes, progress, cancel_event):
+    """
+    Returns the results of counting_lines() futures in order, advancing `progress` by
+    each part's size as it completes and adding the workers' metrics to this thread's.
+    While waiting, `progress` is polled for cancellation. On cancellation or failure, parts
+    that haven't started are dropped and `cancel_event` stops the running ones.
+    """
+    results = []
+    recorder = metrics.current()
+    try:
+        for future, size in zip(futures, sizes):
+            while True:
+                try:
+                    result, lines, profile = future.result(timeout=CANCEL_POLL_SECONDS)
+                    break
+                except TimeoutError:
+                    if progress is not None:
+                        # Raises JobCancelled if the job was cancelled
+                        progress.advance(0)
+            results.append(result)
+            if recorder is not None and profile is not None:
+                recorder.merge(profile)
+            if progress is not None:
+                progress.advance(size, lines)
+    except BaseException:
+        cancel_event.set()
+        for future in futures:
+            future.cancel()
+        raise
+    return results
+
+def analyze_file(path, workers=1, end=None, progress=None, history=None, **options):
+    """
+    Analyzes the first `end` bytes of a log (the whole file by default) using up to `workers` processes.
+    The file is split into newline-aligned ranges and the partial analyzers are merged
+    in file order, so the result is identical to a single sequential pass, except for the
+    latency of endpoints once there are more than latency.MAX_TRACKED_KEYS. Each range warms up
+    its rate detector with the lines before it (see warm_up_rates), so floods and brute
+    force across a range boundary are reported as a sequential pass reports them.
+    `history` lists the (path, end) logs that come before this one, e.g. older rotated files.
+    `options` are LogAnalyzer arguments (filter_bots, start_date, end_date, ...).
+    `progress` (see jobs.Job) is advanced as the file is read.
+    """
+    if is_compressed(path):
+        # A compressed stream can't be split by byte offset
+        return analyze_whole(path, progress=progress, history=history, **options)
+
+    if end is None:
+        end = os.path.getsize(path)
+
+    if workers <= 1 or end < MIN_PARALLEL_BYTES:
+        return analyze_range(path, 0, end, progress, history, **options)
+
+    ranges = split_ranges(path, workers, end)
+    profile = metrics.current() is not None
+    pool, cancel_event = start_pool(workers)
+    with pool:
+        futures = [
+            pool.submit(counting_lines, analyze_range, path, start, stop, profile=profile, history=history, **options)
+            for start, stop in ranges
+        ]
+        parts = collect(futures, [stop - start for start, stop in ranges], progress, cancel_event)
+
+    analyzer = parts[0]
+    for part in parts[1:]:
+        analyzer.merge(part)
+    return analyzer
+
+def analyze_each(jobs, workers=1, progress=None, **options):
+    """
+    Analyzes several files, each as a whole, and returns their analyzers in the same order.
+    `jobs` is a list of (path, end, history) triples, `history` being the (path, end) logs
+    that come before the file (see warm_up_rates). Files run concurrently when workers > 1.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        return [analyze_whole(path, end, progress, history, **options) for path, end, history in jobs]
+
+    profile = metrics.current() is not None
+    pool, cancel_event = start_pool(min(workers, len(jobs)))
+    with pool:
+        futures = [
+            pool.submit(counting_lines, analyze_whole, path, end, profile=profile, history=history, **options)
+            for path, end, history in jobs
+        ]
+        sizes = [os.path.getsize(path) if end is None or is_compressed(path) else end for path, end, _ in jobs]
+        return collect(futures, sizes, progress, cancel_event)
+
+def analyze_files(paths, workers=1, **options):
+    """
+    Analyzes a list of log files ordered oldest first (see log_sources.plan_sources)
+    and merges them into one LogAnalyzer.
+    """
+    if len(paths) == 1:
+        return analyze_file(paths[0], workers, **options)
+
+    parts = analyze_each([(path, None, [(p, None) for p in paths[:i]]) for i, path in enumerate(paths)], workers, **options)
+    analyzer = LogAnalyzer(**options)
+    for part in parts:
+        analyzer.merge(part)
+    return analyzer
@@ -0,0 +1,226 @@
+import re
+import heapq
+
+# Default thresholds: requests per IP within flood_window seconds, and failed logins per
+# (IP, path) within auth_window seconds
+DEFAULT_RATE_LIMITS = {
+    'flood_threshold': 1000,
+    'flood_window': 10,
+    'auth_threshold': 20,
+    'auth_window': 60
+}
+
+# Login endpoints: a 401 or 403 from one of them is a failed login
+AUTH_PATH_PATTERN = re.compile(r'(?i)(wp-login\.php|xmlrpc\.php|/login|/signin|/sign-in|/auth|/session|/token)')
+AUTH_FAILURE_STATUSES = (401, 403)
+# Form logins that answer a failed attempt with the form again (200) or a redirect (302),
+# so any POST to them counts as an attempt
+FORM_LOGIN_PATTERN = re.compile(r'(?i)(wp-login\.php|xmlrpc\.php)')
+FORM_LOGIN_STATUSES = (200, 302)
+
+# Seconds lines may be logged out of order (nginx writes a line when its request ends)
+MAX_DISORDER = 5
+
+class SlidingWindowCounter:
+    """
+    Per-key event counts over the last `window` seconds of log time.
+    Each key keeps a ring of `buckets` slots, so an update is O(1) amortized and the window
+    is accurate to window/buckets seconds. Whenever the number of keys doubles, keys idle for
+    a whole window are swept out; past `max_keys`, the least recently active keys are dropped
+    down to 3/4 of it, so a key that is busy right now (e.g. a flood) keeps its count.
+    """
+    def __init__(self, window, buckets=10, max_keys=100000):
+        self.window = window
+        self.buckets = buckets
+        self.width = window / buckets
+        self.max_keys = max_keys
+        self.keys = {}          # key -> [newest bucket, total, flagged, slot counts...]
+        self.sweep_at = min(1024, max_keys)
+
+    def add(self, key, ts):
+        """
+        Counts one event for `key` at epoch `ts`. Returns the key's entry; entry[1] is the
+        number of events in the window.
+        """
+        bucket = int(ts // self.width)
+        buckets = self.buckets
+        entry = self.keys.get(key)
+        if entry is None:
+            if len(self.keys) >= self.sweep_at:
+                self.sweep(bucket)
+            entry = self.keys[key] = [bucket, 0, False] + [0] * buckets
+        else:
+            newest = entry[0]
+            if bucket > newest:
+                if bucket - newest >= buckets:
+                    entry[1] = 0
+                    entry[3:] = [0] * buckets
+                else:
+                    for expired in range(newest + 1, bucket + 1):
+                        slot = 3 + expired % buckets
+                        entry[1] -= entry[slot]
+                        entry[slot] = 0
+                entry[0] = bucket
+            elif bucket <= newest - buckets:
+                # Older than the window (lines are logged slightly out of order): count as the oldest slot
+                bucket = newest - buckets + 1
+        entry[3 + bucket % buckets] += 1
+        entry[1] += 1
+        return entry
+
+    def sweep(self, bucket):
+        """
+        Drops keys with no events in the window ending at `bucket`, then, if max_keys is
+        reached, the keys whose last event is oldest (the ones with fewer events first).
+        """
+        horizon = bucket - self.buckets
+        for key in [key for key, entry in self.keys.items() if entry[0] <= horizon]:
+            del self.keys[key]
+        if len(self.keys) >= self.max_keys:
+            excess = len(self.keys) - self.max_keys * 3 // 4
+            keys = self.keys
+            for key in heapq.nsmallest(excess, keys, key=lambda key: (keys[key][0], keys[key][1])):
+                del keys[key]
+        self.sweep_at = min(max(2 * len(self.keys), 1024), self.max_keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+class RateDetector:
+    """
+    Stateful detector for threats that no single line shows: request floods from one IP
+    ("Rate Flood") and repeated failed logins from one IP to one path ("Auth Brute Force").
+    Records must be fed in log order. A key is reported once when it crosses its threshold
+    and again only after its rate has fallen below half the threshold.
+    A detector for a later part of a log starts from warm_up() over the lines before it.
+    """
+    def __init__(self, flood_threshold=1000, flood_window=10, auth_threshold=20, auth_window=60, max_keys=100000):
+        self.flood_threshold = flood_threshold
+        self.flood_window = flood_window
+        self.auth_threshold = auth_threshold
+        self.auth_window = auth_window
+        self.max_keys = max_keys
+        self.reset()
+
+    def reset(self):
+        self.flood = SlidingWindowCounter(self.flood_window, max_keys=self.max_keys)
+        self.auth = SlidingWindowCounter(self.auth_window, max_keys=self.max_keys)
+
+    def check(self, record):
+        """
+        Counts the record and returns the threats it triggers, or None.
+        """
+        ts = record.timestamp
+        if not ts:
+            return None
+        threats = None
+
+        entry = self.flood.add(record.ip, ts)
+        if (entry[2] or entry[1] >= self.flood_threshold) and self.crossed(entry, self.flood_threshold):
+            threats = [{
+                'type': 'Rate Flood',
+                'risk': 'High',
+                'evidence': f"{entry[1]} requests in {self.flood_window}s"
+            }]
+
+        key = self.auth_key(record)
+        if key is not None:
+            entry = self.auth.add(key, ts)
+            if (entry[2] or entry[1] >= self.auth_threshold) and self.crossed(entry, self.auth_threshold):
+                threat = {
+                    'type': 'Auth Brute Force',
+                    'risk': 'High',
+                    'evidence': f"{entry[1]} login attempts on {key[1][:60]} in {self.auth_window}s"
+                }
+                threats = threats + [threat] if threats else [threat]
+        return threats
+
+    @staticmethod
+    def auth_key(record):
+        """
+        The (ip, path) a record counts for as a failed login, or None if it isn't one.
+        """
+        status = record.status
+        if status in AUTH_FAILURE_STATUSES:
+            path = record.path.split('?', 1)[0]
+            if AUTH_PATH_PATTERN.search(path):
+                return record.ip, path
+        elif status in FORM_LOGIN_STATUSES and record.method == 'POST':
+            path = record.path.split('?', 1)[0]
+            if FORM_LOGIN_PATTERN.search(path):
+                return record.ip, path
+        return None
+
+    def history_seconds(self):
+        """
+        Seconds of log a warm_up() normally needs to vouch for its state.
+        """
+        return max(2 * (counter.window + counter.width + MAX_DISORDER) for counter in (self.flood, self.auth))
+
+    def warm_up(self, records):
+        """
+        Feeds a fresh detector the records just before the part of the log it is going to
+        check (e.g. the end of the previous range or file), discarding their threats.
+        Returns True if its state is then certainly the one a detector fed the whole log
+        so far would have, so it reports the same threats from here on:
+        - window counts are exact once a window (plus disorder) of log has been fed;
+        - a key at or above its threshold is flagged either way, a key below half of it
+          with an exact count isn't; in between, the flag depends on older history;
+        - a key left in doubt doesn't matter once a window has passed since its last line,
+          as its next line starts from a count of 1, below half the threshold.
+        The state is only exact while fewer than max_keys keys are active (see SlidingWindowCounter).
+        """
+        counters = ((self.flood, self.flood_threshold), (self.auth, self.auth_threshold))
+        certain = (set(), set())
+        doubtful = (set(), set())
+        first = latest = None
+        for record in records:
+            ts = record.timestamp
+            if not ts:
+                continue
+            if first is None:
+                first = latest = ts
+            elif ts > latest:
+                latest = ts
+            self.check(record)
+            self.settle(self.flood, self.flood_threshold, record.ip, ts - first, certain[0], doubtful[0])
+            key = self.auth_key(record)
+            if key is not None:
+                self.settle(self.auth, self.auth_threshold, key, ts - first, certain[1], doubtful[1])
+
+        if first is None:
+            return False
+        for (counter, threshold), keys in zip(counters, doubtful):
+            if keys and threshold <= 2:
+                # A count of 1 doesn't clear the flag of such a low threshold
+                return False
+            # Lines after these start at least this bucket, which resets keys last seen at or before the horizon
+            horizon = int((latest - MAX_DISORDER) // counter.width) - counter.buckets
+            for key in keys:
+                entry = counter.keys.get(key)
+                if entry is not None and entry[0] > horizon:
+                    return False
+        return True
+
+    @staticmethod
+    def settle(counter, threshold, key, elapsed, certain, doubtful):
+        # Whether the flag of `key` is known for sure after warm_up() counted a line for it
+        count = counter.keys[key][1]
+        exact = elapsed >= counter.window + counter.width + MAX_DISORDER
+        if count >= threshold or (exact and (count * 2 < threshold or key in certain)):
+            certain.add(key)
+            doubtful.discard(key)
+        else:
+            certain.discard(key)
+            doubtful.add(key)
+
+    @staticmethod
+    def crossed(entry, threshold):
+        if entry[2]:
+            if entry[1] * 2 < threshold:
+                entry[2] = False
+            return False
+        if entry[1] >= threshold:
+            entry[2] = True
+            return True
+        return False
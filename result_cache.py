@@ -0,0 +1,132 @@
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response encodings, most preferred first (brotli only if the module is installed)
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# Smaller bodies aren't worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def source_fingerprint(paths):
+    """
+    (path, size, mtime, inode, device) of every file, which changes whenever one of them is
+    appended to, rewritten or rotated. Missing files are (path, None, None, None, None).
+    """
+    fingerprint = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            fingerprint.append((path, None, None, None, None))
+            continue
+        fingerprint.append((path, st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev))
+    return tuple(fingerprint)
+
+def last_modified(fingerprint):
+    """
+    Latest modification time of a source_fingerprint(), in epoch seconds (None if no file exists).
+    """
+    times = [mtime for _, _, mtime, _, _ in fingerprint if mtime is not None]
+    return max(times) / 1e9 if times else None
+
+class CachedResult:
+    """
+    One serialized analysis result: its JSON body, an ETag derived from the body and the
+    compressed variants served so far.
+    """
+    def __init__(self, key, body, last_modified):
+        self.key = key
+        self.body = body
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.last_modified = last_modified
+        self.encoded = {}           # encoding -> compressed body
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(data) for data in self.encoded.values())
+
+class ResultCache:
+    """
+    Serialized analysis results, so repeat requests for an unchanged log cost no analysis.
+    Keys include a source_fingerprint() of the files, so a change to any of them is a miss.
+    Least recently used entries are evicted beyond `max_entries` or `max_bytes`
+    (bodies plus their compressed variants).
+    """
+    def __init__(self, max_entries=64, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()    # key -> CachedResult
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, last_modified=None):
+        """
+        Stores a JSON body (bytes) and returns its CachedResult. A body larger than
+        `max_bytes` is returned without being stored.
+        """
+        entry = CachedResult(key, body, last_modified)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old.size
+            if entry.size <= self.max_bytes:
+                self.entries[key] = entry
+                self.size += entry.size
+                self.evict()
+        return entry
+
+    def encode(self, entry, encoding):
+        """
+        The body of `entry` compressed with `encoding`, compressed once and then kept with the entry.
+        """
+        data = entry.encoded.get(encoding)
+        if data is not None:
+            return data
+        data = compress(entry.body, encoding)
+        with self.lock:
+            if encoding not in entry.encoded:
+                entry.encoded[encoding] = data
+                if self.entries.get(entry.key) is entry:
+                    self.size += len(data)
+                    self.evict()
+        return data
+
+    def evict(self):
+        # Called with the lock held
+        while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            _, entry = self.entries.popitem(last=False)
+            self.size -= entry.size
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import socket
+import tempfile
+import ipaddress
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+def gethostbyaddr(ip):
+    """
+    Default resolver: the hostname of `ip`, or None if it has no PTR record.
+    """
+    try:
+        return socket.gethostbyaddr(ip)[0]
+    except (socket.herror, socket.gaierror):
+        return None
+
+class ReverseDNSCache:
+    """
+    Resolves client IPs to hostnames on a bounded thread pool.
+    Answers are kept in a TTL-based LRU, failed lookups too (for a shorter time), and the
+    cache is saved to `cache_file` so repeat views after a restart are instant.
+    `resolve` is the lookup function, ip -> hostname or None (socket.gethostbyaddr by default).
+    """
+    def __init__(self, cache_file=None, max_entries=10000, ttl=86400, negative_ttl=3600,
+                 timeout=2.0, max_workers=8, resolve=gethostbyaddr):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.resolve = resolve
+        self.entries = OrderedDict()   # ip -> (hostname or None, expires)
+        self.pending = {}              # ip -> Future, so concurrent requests share one lookup
+        self.started = {}              # ip -> time a worker started resolving it
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()   # One save() at a time, so a newer snapshot can't be overwritten by an older one
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rdns')
+        self.dirty = False
+        if cache_file:
+            self.load()
+
+    def get(self, ip):
+        """
+        Returns (found, hostname) from the cache.
+        """
+        with self.lock:
+            entry = self.entries.get(ip)
+            if entry is None:
+                return False, None
+            if entry[1] < time.time():
+                del self.entries[ip]
+                return False, None
+            self.entries.move_to_end(ip)
+            return True, entry[0]
+
+    def put(self, ip, hostname):
+        with self.lock:
+            self.entries[ip] = (hostname, time.time() + (self.ttl if hostname else self.negative_ttl))
+            self.entries.move_to_end(ip)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+
+    def submit(self, ip):
+        with self.lock:
+            future = self.pending.get(ip)
+            if future is not None:
+                return future
+            future = self.pending[ip] = self.pool.submit(self.run, ip)
+        # Added outside the lock: the callback runs right away if the lookup already finished
+        future.add_done_callback(lambda f: self.finish(ip))
+        return future
+
+    def run(self, ip):
+        self.started[ip] = time.time()
+        hostname = self.resolve(ip)
+        # Stored by the worker, even if the caller stopped waiting, so a slow answer still
+        # lands in the cache, and before the future completes, so the batch's save() has it
+        self.put(ip, hostname)
+        return hostname
+
+    def finish(self, ip):
+        with self.lock:
+            self.pending.pop(ip, None)
+            self.started.pop(ip, None)
+
+    def lookup_many(self, ips):
+        """
+        Returns {ip: hostname or None} for all `ips`, resolving cache misses concurrently.
+        A lookup still running after `timeout` seconds is reported as None but keeps going
+        in the background.
+        """
+        results = {}
+        futures = {}
+        for ip in ips:
+            if ip in results or ip in futures:
+                continue
+            try:
+                ipaddress.ip_address(ip)
+            except ValueError:
+                # gethostbyaddr would happily resolve a hostname, only accept addresses
+                results[ip] = None
+                continue
+            found, hostname = self.get(ip)
+            if found:
+                results[ip] = hostname
+            else:
+                futures[ip] = self.submit(ip)
+
+        if futures:
+            self.wait(futures)
+            for ip, future in futures.items():
+                if future.done() and future.exception() is None:
+                    results[ip] = future.result()
+                else:
+                    results[ip] = None
+            self.save()
+        return results
+
+    def wait(self, futures):
+        """
+        Waits until every lookup in {ip: future} finished or has been running for `timeout`
+        seconds. Lookups still queued behind a busy pool are given up on after
+        `timeout` times the number of rounds the pool needs for the batch.
+        """
+        deadline = time.time() + self.timeout * -(-len(futures) // self.max_workers)
+        running = {future: ip for ip, future in futures.items() if not future.done()}
+        while running:
+            now = time.time()
+            for future, ip in list(running.items()):
+                if now - self.started.get(ip, now) >= self.timeout:
+                    del running[future]
+            if not running or now >= deadline:
+                return
+            next_expiry = min([self.started[ip] + self.timeout for ip in running.values() if ip in self.started] + [deadline])
+            done, _ = wait(running, timeout=max(next_expiry - now, 0.01), return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+
+    def lookup(self, ip):
+        return self.lookup_many([ip])[ip]
+
+    def load(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        with self.lock:
+            for ip, (hostname, expires) in data.items():
+                if expires > now:
+                    self.entries[ip] = (hostname, expires)
+
+    def save(self):
+        """
+        Writes the cache to `cache_file` if it changed. Concurrent batches may call this
+        at the same time: saves are serialized and each writes its own temporary file.
+        """
+        if not self.cache_file:
+            return
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                data = {ip: list(entry) for ip, entry in self.entries.items()}
+                self.dirty = False
+            directory = os.path.dirname(self.cache_file) or '.'
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.cache_file) + '.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp_file, self.cache_file)
+            except BaseException:
+                os.unlink(tmp_file)
+                with self.lock:
+                    self.dirty = True
+                raise
@@ -0,0 +1,238 @@
+from collections import Counter
+
+RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Buckets older than this (relative to the newest line seen) are compacted to the next level
+MINUTE_RETENTION = 2 * 86400
+HOUR_RETENTION = 60 * 86400
+
+# Per-bucket top IPs/paths kept once a bucket is closed
+BUCKET_TOP_K = 10
+
+STATUS_CLASSES = ('other', '1xx', '2xx', '3xx', '4xx', '5xx')
+
+def status_class(status):
+    """
+    Index into STATUS_CLASSES for a status code.
+    """
+    return status // 100 if 100 <= status < 600 else 0
+
+def bucket_start(ts, offset, size):
+    """
+    Start (epoch seconds) of the bucket of `size` seconds containing `ts`,
+    aligned to the log's local time given its UTC offset.
+    """
+    return (int(ts) + offset) // size * size - offset
+
+def choose_resolution(span, requested=None):
+    """
+    Picks the time-series resolution for data covering `span` seconds.
+    'auto' (or None) aims for a readable chart; explicit choices are coarsened when the
+    finer buckets would already have been compacted away.
+    """
+    if requested not in RESOLUTIONS:
+        if span <= 6 * 3600:
+            requested = 'minute'
+        elif span <= 14 * 86400:
+            requested = 'hour'
+        else:
+            requested = 'day'
+    if requested == 'minute' and span > MINUTE_RETENTION:
+        requested = 'hour'
+    if requested == 'hour' and span > HOUR_RETENTION:
+        requested = 'day'
+    return requested
+
+class Bucket:
+    __slots__ = ('requests', 'bytes', 'classes', 'ips', 'paths')
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.classes = [0] * len(STATUS_CLASSES)
+        self.ips = Counter()
+        self.paths = Counter()
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.bytes += other.bytes
+        for i, count in enumerate(other.classes):
+            self.classes[i] += count
+        self.ips.update(other.ips)
+        self.paths.update(other.paths)
+
+    def trim(self, top_k):
+        if len(self.ips) > top_k:
+            self.ips = Counter(dict(self.ips.most_common(top_k)))
+        if len(self.paths) > top_k:
+            self.paths = Counter(dict(self.paths.most_common(top_k)))
+
+class RollupStore:
+    """
+    Per-minute traffic buckets, compacted to per-hour and per-day as the log advances.
+    Request counts, bytes and status classes are exact at every level; per-bucket top
+    IPs/paths are trimmed to `top_k` once a bucket closes, so range tops are approximate.
+    Buckets are keyed by (start, utc_offset) so local-time alignment survives DST changes.
+    """
+    def __init__(self, top_k=BUCKET_TOP_K):
+        self.top_k = top_k
+        self.levels = {name: {} for name in RESOLUTIONS}
+        self.open = []            # Minute buckets whose tops haven't been trimmed yet
+        self.oldest = None
+        self.newest = None
+        self.next_compaction = None
+
+    def add(self, ts, offset, status, nbytes, ip, path):
+        start = (int(ts) + offset) // 60 * 60 - offset
+        key = (start, offset)
+        minutes = self.levels['minute']
+        bucket = minutes.get(key)
+        if bucket is None:
+            bucket = minutes[key] = Bucket()
+            self.open.append(key)
+        bucket.requests += 1
+        bucket.bytes += nbytes
+        bucket.classes[status // 100 if 100 <= status < 600 else 0] += 1
+        bucket.ips[ip] += 1
+        bucket.paths[path] += 1
+
+        if self.oldest is None or ts < self.oldest:
+            self.oldest = ts
+        if self.newest is None or ts > self.newest:
+            self.newest = ts
+            if len(self.open) > 2:
+                self.close_buckets()
+            if self.next_compaction is None or ts >= self.next_compaction:
+                self.compact()
+
+    def close_buckets(self):
+        # Lines arrive slightly out of order, so a minute stays open for two more minutes
+        still_open = []
+        for key in self.open:
+            bucket = self.levels['minute'].get(key)
+            if bucket is None:
+                continue
+            if key[0] < self.newest - 120:
+                bucket.trim(self.top_k)
+            else:
+                still_open.append(key)
+        self.open = still_open
+
+    def compact(self):
+        """
+        Folds minute buckets older than MINUTE_RETENTION into hours, and hours older
+        than HOUR_RETENTION into days.
+        """
+        self.next_compaction = self.newest + 3600
+        for source, target, retention in (('minute', 'hour', MINUTE_RETENTION), ('hour', 'day', HOUR_RETENTION)):
+            size = RESOLUTIONS[target]
+            source_buckets = self.levels[source]
+            target_buckets = self.levels[target]
+            # Only buckets that ended before the cutoff, so compaction implies span > retention
+            cutoff = self.newest - retention - RESOLUTIONS[source]
+            expired = [key for key in source_buckets if key[0] <= cutoff]
+            touched = set()
+            for key in expired:
+                start, offset = key
+                target_key = (bucket_start(start, offset, size), offset)
+                target_bucket = target_buckets.get(target_key)
+                if target_bucket is None:
+                    target_bucket = target_buckets[target_key] = Bucket()
+                target_bucket.merge(source_buckets.pop(key))
+                touched.add(target_key)
+            for key in touched:
+                target_buckets[key].trim(self.top_k)
+
+    def merge(self, other):
+        """
+        Folds another store into this one (e.g. from a parallel worker).
+        """
+        for name in RESOLUTIONS:
+            buckets = self.levels[name]
+            for key, bucket in other.levels[name].items():
+                if key in buckets:
+                    buckets[key].merge(bucket)
+                else:
+                    copy = buckets[key] = Bucket()
+                    copy.merge(bucket)
+        self.open = sorted(set(self.open) | set(other.open))
+        if other.oldest is not None and (self.oldest is None or other.oldest < self.oldest):
+            self.oldest = other.oldest
+        if other.newest is not None and (self.newest is None or other.newest > self.newest):
+            self.newest = other.newest
+        if self.newest is not None:
+            self.close_buckets()
+            self.compact()
+        return self
+
+    def iter_buckets(self, start_ts=None, end_ts=None):
+        """
+        Yields (start, offset, size, bucket) for every bucket starting inside [start_ts, end_ts].
+        """
+        for name, size in RESOLUTIONS.items():
+            for (start, offset), bucket in self.levels[name].items():
+                if start_ts is not None and start < start_ts:
+                    continue
+                if end_ts is not None and start > end_ts:
+                    continue
+                yield start, offset, size, bucket
+
+    def series(self, resolution=None):
+        """
+        Request/bytes/status-class time series for the Chart.js chart.
+        """
+        if self.newest is None:
+            return build_series(choose_resolution(0, resolution), [])
+        resolution = choose_resolution(self.newest - self.oldest, resolution)
+        # Never finer than the coarsest level holding data
+        for name in RESOLUTIONS:
+            if self.levels[name] and RESOLUTIONS[name] > RESOLUTIONS[resolution]:
+                resolution = name
+        size = RESOLUTIONS[resolution]
+        points = {}
+        for start, offset, _, bucket in self.iter_buckets():
+            t = bucket_start(start, offset, size)
+            point = points.get(t)
+            if point is None:
+                point = points[t] = [0, 0, [0] * len(STATUS_CLASSES)]
+            point[0] += bucket.requests
+            point[1] += bucket.bytes
+            for i, count in enumerate(bucket.classes):
+                point[2][i] += count
+        return build_series(resolution, sorted(points.items()))
+
+    def query(self, start_ts=None, end_ts=None, resolution=None, top_n=20):
+        """
+        Summary of the buckets starting inside [start_ts, end_ts]; costs O(buckets), not O(lines).
+        Bucket edges make the range approximate to the bucket size for compacted data.
+        """
+        total = Bucket()
+        selected = RollupStore(self.top_k)
+        for start, offset, size, bucket in self.iter_buckets(start_ts, end_ts):
+            total.merge(bucket)
+            level = {60: 'minute', 3600: 'hour', 86400: 'day'}[size]
+            selected.levels[level][(start, offset)] = bucket
+            if selected.oldest is None or start < selected.oldest:
+                selected.oldest = start
+            if selected.newest is None or start > selected.newest:
+                selected.newest = start
+        return {
+            'total_requests': total.requests,
+            'total_bytes': total.bytes,
+            'status_classes': dict(zip(STATUS_CLASSES, total.classes)),
+            'top_ips': total.ips.most_common(top_n),
+            'top_paths': total.paths.most_common(top_n),
+            'time_series': selected.series(resolution)
+        }
+
+def build_series(resolution, points):
+    """
+    Turns sorted (t, [requests, bytes, classes]) pairs into column arrays.
+    """
+    return {
+        'resolution': resolution,
+        'timestamps': [t for t, _ in points],
+        'requests': [p[0] for _, p in points],
+        'bytes': [p[1] for _, p in points],
+        'status_classes': {name: [p[2][i] for _, p in points] for i, name in enumerate(STATUS_CLASSES)}
+    }
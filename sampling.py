@@ -0,0 +1,300 @@
+import math
+import time
+import random
+from bisect import bisect_right
+from analyzer import LogAnalyzer
+from security import SecurityAnalyzer
+from log_parser import parse_block
+from log_reader import complete_lines_end, is_compressed, line_boundary
+
+# Files are cut into slots of this many bytes; each sampled slot is read up to line boundaries
+SAMPLE_BLOCK_SIZE = 64 * 1024
+
+# Two-sided 95% normal quantile
+CONFIDENCE = 0.95
+Z_SCORE = 1.96
+
+# Paths and IPs whose per-block sums are kept for their intervals (see SampledAnalysis.track)
+MAX_CANDIDATES = 1000
+
+class BlockSums:
+    """
+    Running sums over the sampled blocks, which is all ratio_interval() needs: the number of
+    blocks and the sums of their sizes and squared sizes.
+    """
+    def __init__(self):
+        self.n = 0
+        self.sizes = 0
+        self.squared_sizes = 0
+
+    def add(self, size):
+        self.n += 1
+        self.sizes += size
+        self.squared_sizes += size * size
+
+def measurement_sums():
+    # [sum of x, sum of x², sum of x * block size] of one measurement x over the blocks
+    return [0, 0, 0]
+
+def add_measurement(sums, value, size):
+    sums[0] += value
+    sums[1] += value * value
+    sums[2] += value * size
+
+def ratio_interval(sums, blocks, total_size):
+    """
+    Ratio estimate of a population total from sampled blocks: `sums` are those of the blocks'
+    measurements (see measurement_sums), `blocks` the BlockSums of their byte sizes and
+    `total_size` the bytes of the whole population.
+    Returns (estimate, low, high) for a CONFIDENCE interval. The low end is never below
+    what was actually seen; a fully sampled population gives the exact total.
+    """
+    n = blocks.n
+    sampled = blocks.sizes
+    observed, squares, products = sums
+    if not sampled:
+        return 0, 0, 0
+    ratio = observed / sampled
+    estimate = ratio * total_size
+    if n < 2 or sampled >= total_size:
+        return estimate, estimate, estimate
+    # Sum of (x - ratio * size)², expanded
+    residuals = squares - 2 * ratio * products + ratio * ratio * blocks.squared_sizes
+    variance = max(residuals, 0) / (n - 1)
+    correction = 1 - sampled / total_size          # Finite population: sampled without replacement
+    error = Z_SCORE * total_size * math.sqrt(correction * variance / n) / (sampled / n)
+    return estimate, max(estimate - error, observed), estimate + error
+
+def distinct_interval(frequencies, sampled, total):
+    """
+    Estimate of the number of distinct values in `total` rows from their frequencies in
+    `sampled` random rows (GEE, Charikar et al. 2000), with the bounds the sample allows:
+    every value seen, up to each value seen once standing for total / sampled values.
+    """
+    distinct = len(frequencies)
+    if not sampled or total <= sampled:
+        return distinct, distinct, distinct
+    singletons = sum(1 for count in frequencies if count == 1)
+    scale = total / sampled
+    estimate = distinct - singletons + math.sqrt(scale) * singletons
+    return estimate, distinct, min(total, distinct - singletons + scale * singletons)
+
+def scale_statistics(stats, factor):
+    """
+    LogAnalyzer.get_statistics() of a sample with every count multiplied by `factor`.
+    The time series is dropped: sampled blocks only cover scattered stretches of time.
+    """
+    def scale(value):
+        return round(value * factor)
+
+    scaled = dict(stats)
+    scaled['total_requests'] = scale(stats['total_requests'])
+    scaled['total_bytes'] = scale(stats['total_bytes'])
+    for key in ('status_codes', 'hourly_stats', 'bot_traffic', 'device_families', 'browser_families', 'os_families'):
+        if key in stats:
+            scaled[key] = {name: scale(count) for name, count in stats[key].items()}
+    for key in ('top_paths', 'top_ips', 'top_user_agents', 'top_referers', 'top_countries'):
+        if key in stats:
+            scaled[key] = [(name, scale(count)) for name, count in stats[key]]
+    scaled['security'] = dict(
+        stats['security'],
+        total_threats=scale(stats['security']['total_threats']),
+        stats={name: scale(count) for name, count in stats['security']['stats'].items()}
+    )
+    scaled['time_series'] = None
+    return scaled
+
+class SampledAnalysis:
+    """
+    Estimates the statistics of a set of plain log files from randomly chosen blocks.
+    The files are cut into SAMPLE_BLOCK_SIZE slots, visited in random order without
+    replacement, each read from the first line starting in it to the first line starting
+    in the next slot, so the blocks partition the files: estimates get better with every
+    block and equal the exact counts once every slot has been read.
+    `options` are LogAnalyzer arguments.
+    """
+    def __init__(self, paths, block_size=SAMPLE_BLOCK_SIZE, seed=None, **options):
+        self.options = options
+        self.block_size = block_size
+        self.files = []         # (path, end, first slot)
+        slots = 0
+        for path in paths:
+            end = complete_lines_end(path)
+            self.files.append((path, end, slots))
+            slots += -(-end // block_size)
+        self.first_slots = [first for _, _, first in self.files]
+        self.total_bytes = sum(end for _, end, _ in self.files)
+        self.order = random.Random(seed).sample(range(slots), slots)
+        self.position = 0
+        # One set of compiled signatures and one user agent cache for every block
+        self.security = SecurityAnalyzer(rules_file=options.get('security_rules'))
+        self.analyzer = LogAnalyzer(**options)
+        # Running sums over the sampled blocks that the intervals are computed from: totals,
+        # every status code, and a bounded set of candidate top paths and IPs
+        self.blocks = BlockSums()
+        self.totals = [measurement_sums() for _ in range(3)]
+        self.status_codes = {}
+        self.paths = {}
+        self.ips = {}
+        self.strings = {}
+
+    @staticmethod
+    def supported(paths):
+        """
+        Compressed logs can't be read at random offsets.
+        """
+        return not any(is_compressed(path) for path in paths)
+
+    @property
+    def exhausted(self):
+        return self.position >= len(self.order)
+
+    def sample(self):
+        """
+        Reads and analyzes the next random block.
+        """
+        slot = self.order[self.position]
+        self.position += 1
+        path, end, first = self.files[bisect_right(self.first_slots, slot) - 1]
+        offset = (slot - first) * self.block_size
+        with open(path, 'rb') as f:
+            start = line_boundary(f, offset, end)
+            stop = line_boundary(f, offset + self.block_size, end)
+            f.seek(start)
+            block = f.read(stop - start)
+
+        # Blocks are far apart in time, so rate windows never carry over from the previous one
+        self.security.rate_detector.reset()
+        analyzer = LogAnalyzer(security_analyzer=self.security, **self.options)
+        for record in parse_block(block, self.strings):
+            analyzer.process_record(record)
+        size = len(block)
+        self.blocks.add(size)
+        for sums, value in zip(self.totals, (analyzer.total_requests, analyzer.total_bytes,
+                                              sum(analyzer.security_stats.values()))):
+            add_measurement(sums, value, size)
+        for code, count in analyzer.status_codes.items():
+            add_measurement(self.status_codes.setdefault(code, measurement_sums()), count, size)
+        if analyzer.sketch_capacity:
+            self.track(self.paths, analyzer.paths.most_common(), size)
+            self.track(self.ips, analyzer.ips.most_common(), size)
+        else:
+            self.track(self.paths, analyzer.paths.items(), size)
+            self.track(self.ips, analyzer.ips.items(), size)
+        self.analyzer.merge(analyzer)
+
+    @staticmethod
+    def track(candidates, counts, size):
+        """
+        Adds one block's (key, count) pairs to the sums of the candidate keys. Past
+        2 * MAX_CANDIDATES keys, those with the lowest totals are dropped down to MAX_CANDIDATES,
+        so busy keys keep their sums from their first blocks on.
+        """
+        for key, count in counts:
+            sums = candidates.get(key)
+            if sums is None:
+                sums = candidates[key] = measurement_sums()
+            add_measurement(sums, count, size)
+        if len(candidates) > 2 * MAX_CANDIDATES:
+            for key in sorted(candidates, key=lambda key: candidates[key][0])[:-MAX_CANDIDATES]:
+                del candidates[key]
+
+    def run(self, seconds, progress=None, publish=None, interval=0.25, resolution=None):
+        """
+        Samples blocks for up to `seconds` (less if every block has been read), calling
+        publish(estimate) every `interval` seconds and at the end.
+        `progress` (see jobs.Job) is checked between blocks so the job can be cancelled.
+        """
+        now = time.monotonic()
+        deadline = now + seconds
+        next_publish = now + interval
+        while not self.exhausted and time.monotonic() < deadline:
+            self.sample()
+            if progress is not None:
+                progress.advance(0)
+            if publish is not None and time.monotonic() >= next_publish:
+                publish(self.estimate(resolution))
+                next_publish = time.monotonic() + interval
+        if publish is not None:
+            publish(self.estimate(resolution))
+
+    def refine(self, stop, publish, interval=0.25, resolution=None, duty=1.0):
+        """
+        Keeps sampling blocks until the `stop` event is set or every block has been read,
+        calling publish(estimate) every `interval` seconds, e.g. while the exact analysis runs.
+        Sampling and estimating take about `duty` of the time: after each block it waits for
+        the rest, and estimates are published less often if building one takes longer.
+        """
+        next_publish = time.monotonic() + interval
+        published = True
+        while not self.exhausted and not stop.is_set():
+            began = time.monotonic()
+            self.sample()
+            published = False
+            if time.monotonic() >= next_publish:
+                estimating = time.monotonic()
+                publish(self.estimate(resolution))
+                published = True
+                now = time.monotonic()
+                next_publish = now + max(interval, (now - estimating) / duty)
+            else:
+                now = time.monotonic()
+            if duty < 1:
+                stop.wait((now - began) * (1 - duty) / duty)
+        if not published and not stop.is_set():
+            publish(self.estimate(resolution))
+
+    def estimate(self, resolution=None):
+        """
+        Estimated statistics in the shape of LogAnalyzer.get_statistics(), plus a 'preview'
+        entry with the sample size and [low, high] intervals for the main counts.
+        """
+        stats = self.analyzer.get_statistics(resolution)
+        blocks = self.blocks
+        sampled = blocks.sizes
+        factor = self.total_bytes / sampled if sampled else 0
+        estimated = scale_statistics(stats, factor)
+
+        def interval(sums):
+            _, low, high = ratio_interval(sums, blocks, self.total_bytes)
+            return [round(low), round(high)]
+
+        def candidates(sums, counts):
+            intervals = {}
+            for key, count in counts:
+                key_sums = list(sums.get(key) or measurement_sums())
+                # Blocks seen before the key became a candidate again: counted as if they were
+                # all in one block of average size, which can only widen the interval
+                missed = count - key_sums[0]
+                if missed > 0:
+                    add_measurement(key_sums, missed, sampled / blocks.n)
+                intervals[key] = interval(key_sums)
+            return intervals
+
+        analyzer = self.analyzer
+        if analyzer.sketch_capacity:
+            frequencies = [count for _, count in analyzer.ips.most_common()]
+        else:
+            frequencies = list(analyzer.ips.values())
+        unique, low, high = distinct_interval(frequencies, analyzer.total_requests, estimated['total_requests'])
+        estimated['unique_users'] = round(unique)
+
+        estimated['preview'] = {
+            'exact': self.exhausted,
+            'confidence': CONFIDENCE,
+            'blocks': blocks.n,
+            'sampled_bytes': sampled,
+            'total_bytes': self.total_bytes,
+            'fraction': round(sampled / self.total_bytes, 6) if self.total_bytes else 1.0,
+            'sampled_requests': analyzer.total_requests,
+            'intervals': {
+                'total_requests': interval(self.totals[0]),
+                'total_bytes': interval(self.totals[1]),
+                'total_threats': interval(self.totals[2]),
+                'unique_users': [round(low), round(high)],
+                'status_codes': {code: interval(self.status_codes[code]) for code in stats['status_codes']},
+                'top_paths': candidates(self.paths, stats['top_paths']),
+                'top_ips': candidates(self.ips, stats['top_ips'])
+            }
+        }
+        return estimated
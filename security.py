@@ -1,67 +1,178 @@
 import re
+import json
+from user_agents import UAClassifier, prefilter_text
+from rates import RateDetector, DEFAULT_RATE_LIMITS
 
 class SecurityAnalyzer:
-    def __init__(self):
+    def __init__(self, rules_file=None):
         # Threat Signatures
+        # 'keywords' are lowercase literals that every match must contain.
+        # They feed a single prefilter so clean lines never reach the signature regexes.
+        # 'targets' lists which fields the signature is checked against.
         self.signatures = [
             {
                 'type': 'SQL Injection',
                 'pattern': re.compile(r"(?i)(union\s+select|' OR '1'='1|benchmark\(|sleep\(\d+\)|information_schema)", re.IGNORECASE),
-                'risk': 'High'
+                'risk': 'High',
+                'keywords': ['union', "' or '1'='1", 'benchmark(', 'sleep(', 'information_schema'],
+                'targets': ['request']
             },
             {
                 'type': 'XSS (Cross-Site Scripting)',
                 'pattern': re.compile(r"(?i)(<script>|javascript:|onerror=|onload=|alert\()", re.IGNORECASE),
-                'risk': 'High'
+                'risk': 'High',
+                'keywords': ['<script>', 'javascript:', 'onerror=', 'onload=', 'alert('],
+                'targets': ['request']
             },
             {
                 'type': 'Path Traversal',
                 'pattern': re.compile(r"(?i)(\.\./\.\./|\.\.\\\.\.\\|/etc/passwd|c:\\windows\\system32)", re.IGNORECASE),
-                'risk': 'High'
+                'risk': 'High',
+                'keywords': ['../../', '..\\..\\', '/etc/passwd', 'c:\\windows\\system32'],
+                'targets': ['request']
             },
             {
                 'type': 'Scanner/Bot',
                 'pattern': re.compile(r"(?i)(Nikto|BurpSuite|Sqlmap|Nmap|OpenVAS|python-requests|curl|wget)", re.IGNORECASE),
-                'risk': 'Medium'
+                'risk': 'Medium',
+                'keywords': ['nikto', 'burpsuite', 'sqlmap', 'nmap', 'openvas', 'python-requests', 'curl', 'wget'],
+                'targets': ['request', 'user_agent']
             },
             {
                 'type': 'Sensitive File Access',
                 'pattern': re.compile(r"(?i)(\.env|\.git/|\.aws/|wp-config\.php|\.htaccess)", re.IGNORECASE),
-                'risk': 'Medium'
+                'risk': 'Medium',
+                'keywords': ['.env', '.git/', '.aws/', 'wp-config.php', '.htaccess'],
+                'targets': ['request']
             }
         ]
 
-    def check_request(self, record):
+        if rules_file:
+            self.signatures.extend(load_rules(rules_file))
+
+        self.request_signatures = [s for s in self.signatures if 'request' in s['targets']]
+        self.ua_signatures = [s for s in self.signatures if 'user_agent' in s['targets']]
+        self.request_prefilter, self.request_unfiltered = build_prefilter(self.request_signatures)
+        self.ua_prefilter, self.ua_unfiltered = build_prefilter(self.ua_signatures)
+        # User agents repeat across lines, so their signature matches are memoized per string.
+        # LogAnalyzer uses the same classifier for bot filtering.
+        self.ua_classifier = UAClassifier(self.ua_signatures, self.ua_prefilter, self.ua_unfiltered)
+
+        # Per-IP sliding windows for floods and brute force; records must arrive in log order
+        self.rate_detector = RateDetector(**load_rate_limits(rules_file))
+
+    def check_rates(self, record):
+        """
+        Feeds a record to the rate detector (see rates.RateDetector).
+        Unlike check_request this is stateful: call it for every record, in log order.
+        Returns a list of threat dictionaries or None.
+        """
+        return self.rate_detector.check(record)
+
+    def check_request(self, record, ua_info=None):
         """
         Check a single log record for threats.
+        `ua_info` is the record's UAInfo if the caller already classified the user agent.
         Returns a threat dictionary or None.
         """
         threats = []
-        path = record.get('request', '')
-        ua = record.get('user_agent', '')
-        
+        path = record.request
+        ua = record.user_agent
+
         # Check URL Path
-        for sig in self.signatures:
+        # Clean lines only run the (usually empty) list of signatures without keywords.
+        if self.request_prefilter and self.request_prefilter.search(prefilter_text(path, path.lower())):
+            signatures = self.request_signatures
+        else:
+            signatures = self.request_unfiltered
+        for sig in signatures:
             if sig['pattern'].search(path):
                 threats.append({
                     'type': sig['type'],
                     'risk': sig['risk'],
                     'evidence': path[:100]  # First 100 chars
                 })
-                continue # Don't match same sig twice
 
         # Check User Agent (specifically for Scanners)
-        # Re-using scanner pattern on UA
-        scanner_sig = next((s for s in self.signatures if s['type'] == 'Scanner/Bot'), None)
-        if scanner_sig and scanner_sig['pattern'].search(ua):
-             # Avoid duplicating if already caught in path (unlikely for UA sigs but good practice)
-             if not any(t['type'] == 'Scanner/Bot' for t in threats):
+        if ua_info is None:
+            ua_info = self.ua_classifier.classify(ua)
+        for sig in ua_info.threats:
+            # Avoid duplicating if already caught in path
+            if not any(t['type'] == sig['type'] for t in threats):
                 threats.append({
-                    'type': 'Scanner/Bot',
-                    'risk': 'Medium',
+                    'type': sig['type'],
+                    'risk': sig['risk'],
                     'evidence': ua[:50]
                 })
 
         if threats:
             return threats
         return None
+
+def build_prefilter(signatures):
+    """
+    Compiles the keywords of the given signatures into one literal alternation.
+    Returns (prefilter regex or None, signatures that have no keywords and must always run).
+    The prefilter searches user_agents.prefilter_text(); signatures with a non-ASCII keyword
+    always run, since case folding outside ASCII differs between str.lower() and re.
+    """
+    filtered, unfiltered = [], []
+    for s in signatures:
+        keywords = s.get('keywords')
+        (filtered if keywords and all(k.isascii() for k in keywords) else unfiltered).append(s)
+    keywords = sorted({k for s in filtered for k in s['keywords']}, key=len, reverse=True)
+    if not keywords:
+        return None, unfiltered
+    return re.compile('|'.join(re.escape(k) for k in keywords)), unfiltered
+
+def read_rules_file(rules_file):
+    """
+    Reads a rules file: either a list of signature rules, or an object with a "signatures"
+    list and/or "rate_limits" settings. Returns (rules, rate limits).
+    """
+    with open(rules_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return data.get('signatures', []), data.get('rate_limits', {})
+    return data, {}
+
+def load_rules(rules_file):
+    """
+    Loads custom signatures from a JSON file containing a list of rules, e.g.
+    [{"type": "Log4Shell", "pattern": "\\\\$\\\\{jndi:", "risk": "High",
+      "keywords": ["${jndi:"], "targets": ["request", "user_agent"]}]
+    'keywords' and 'targets' are optional. Rules without keywords are checked on every line.
+    The list may also be given as {"signatures": [...]} next to "rate_limits".
+    """
+    rules, _ = read_rules_file(rules_file)
+
+    signatures = []
+    for rule in rules:
+        try:
+            signatures.append({
+                'type': rule['type'],
+                'pattern': re.compile(rule['pattern'], re.IGNORECASE),
+                'risk': rule.get('risk', 'Medium'),
+                'keywords': [k.lower() for k in rule.get('keywords', [])],
+                'targets': rule.get('targets', ['request'])
+            })
+        except (KeyError, re.error) as e:
+            raise ValueError(f"Invalid security rule {rule!r}: {e}")
+    return signatures
+
+def load_rate_limits(rules_file=None):
+    """
+    Returns the rate detector thresholds: DEFAULT_RATE_LIMITS updated with the "rate_limits"
+    object of the rules file, e.g. {"rate_limits": {"flood_threshold": 300, "flood_window": 1}}.
+    """
+    limits = dict(DEFAULT_RATE_LIMITS)
+    if not rules_file:
+        return limits
+    _, overrides = read_rules_file(rules_file)
+    for name, value in overrides.items():
+        if name not in limits:
+            raise ValueError(f"Unknown rate limit setting {name!r}")
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+            raise ValueError(f"Invalid value for rate limit {name!r}: {value!r}")
+        limits[name] = value
+    return limits
@@ -0,0 +1,181 @@
+import os
+import threading
+from contextlib import ExitStack
+from collections import OrderedDict
+from analyzer import LogAnalyzer
+from log_reader import iter_records, read_head, file_identity, complete_lines_end, is_compressed
+from parallel import analyze_file, analyze_each, warm_up_rates
+
+class AnalysisSession:
+    """
+    Analyzer state for one (file, filters) combination plus the byte offset it has reached.
+    `history` are the paths of the logs read before this one (older rotated files), which
+    rate detection continues from. `options` are LogAnalyzer arguments (filter_bots, start_date, end_date, ...).
+    """
+    def __init__(self, history=(), **options):
+        self.history = tuple(history)
+        self.options = options
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.analyzer = LogAnalyzer(**self.options)
+        self.offset = 0
+        self.head = b''
+
+    def install(self, path, analyzer, end):
+        """
+        Adopts an analyzer that was computed elsewhere for the first `end` bytes of the file.
+        """
+        self.analyzer = analyzer
+        self.offset = end
+        self.head = read_head(path, min(end, 256))
+
+    def history_ends(self):
+        """
+        The history as (path, end) pairs for parallel.warm_up_rates().
+        """
+        return [(path, scan_end(path)) for path in self.history]
+
+    def pending(self, path):
+        """
+        Roughly how many bytes the next update() will read, for progress reporting.
+        """
+        size = os.path.getsize(path)
+        if size < self.offset or (is_compressed(path) and size != self.offset):
+            return size
+        return size - self.offset
+
+    def update(self, path, workers=1, progress=None):
+        """
+        Processes only the bytes appended since the last call.
+        Starts over if the file was truncated or its head changed (copytruncate rotation).
+        The initial full scan is split across `workers` processes.
+        `progress` (see jobs.Job) is advanced as bytes are read.
+        """
+        _, _, size = file_identity(path)
+        if size < self.offset:
+            self.reset()
+        elif self.offset > 0 and read_head(path, len(self.head)) != self.head:
+            self.reset()
+
+        if size == self.offset:
+            return
+
+        if is_compressed(path):
+            # Rotated archives are read whole; any change means a different file
+            self.reset()
+            self.install(path, analyze_file(path, progress=progress, history=self.history_ends(), **self.options), size)
+            return
+
+        # Stop before a trailing line nginx may still be writing; it is read on the next call
+        end = complete_lines_end(path, size)
+        if self.offset == 0 and workers > 1:
+            self.install(path, analyze_file(path, workers, end=end, progress=progress, history=self.history_ends(),
+                                            **self.options), end)
+        elif self.offset == 0 and end > 0 and self.history:
+            # Rate windows continue from the end of the previous files
+            warm_up_rates(self.analyzer.security_analyzer.rate_detector, self.history_ends(), progress)
+
+        if end > self.offset:
+            for record in iter_records(path, self.offset, end, progress):
+                self.analyzer.process_record(record)
+            self.offset = end
+
+        if len(self.head) < 256:
+            self.head = read_head(path, min(self.offset, 256))
+
+def scan_end(path):
+    """
+    Where an initial scan of the file should stop: the whole archive, or the last complete line.
+    """
+    size = os.path.getsize(path)
+    return size if is_compressed(path) else complete_lines_end(path, size)
+
+class AnalysisSessionCache:
+    """
+    LRU cache of AnalysisSession keyed by (path, inode, history, analyzer options).
+    A rotated file gets a new inode and therefore a new session; the stale one ages out.
+    The history (files read before this one, see AnalysisSession) is part of the key because
+    rate threats at the start of the file depend on it.
+    """
+    def __init__(self, max_sessions=8):
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, history=(), **options):
+        inode, device, _ = file_identity(path)
+        previous = tuple((os.path.abspath(p),) + file_identity(p)[:2] for p in history)
+        key = (os.path.abspath(path), device, inode, previous, tuple(sorted(options.items())))
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = AnalysisSession(history, **options)
+                self.sessions[key] = session
+            self.sessions.move_to_end(key)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        return key, session
+
+    def discard(self, key):
+        with self.lock:
+            self.sessions.pop(key, None)
+
+    def analyze(self, path, workers=1, resolution=None, progress=None, **options):
+        """
+        Brings the cached session for this file up to date and returns its statistics.
+        """
+        return self.view([path], lambda analyzer: analyzer.get_statistics(resolution), workers, progress, **options)
+
+    def analyze_many(self, paths, workers=1, resolution=None, progress=None, **options):
+        """
+        Brings the sessions of several log files (ordered oldest first) up to date
+        and returns the statistics of all of them merged.
+        """
+        return self.view(paths, lambda analyzer: analyzer.get_statistics(resolution), workers, progress, **options)
+
+    def view(self, paths, func, workers=1, progress=None, **options):
+        """
+        Brings the sessions of `paths` up to date and returns func(analyzer) for their
+        merged analyzer, called while the sessions are locked.
+        Files that haven't been scanned yet are analyzed concurrently when workers > 1.
+        `progress` (see jobs.Job) is told how much there is to read and advanced as it is read.
+        """
+        if len(paths) == 1:
+            key, session = self.get(paths[0], **options)
+            with session.lock:
+                try:
+                    if progress is not None:
+                        progress.expect(session.pending(paths[0]))
+                    session.update(paths[0], workers, progress)
+                except Exception:
+                    # Partially applied state can't be trusted, start fresh next time
+                    self.discard(key)
+                    raise
+                return func(session.analyzer)
+
+        entries = [self.get(path, paths[:i], **options) for i, path in enumerate(paths)]
+        with ExitStack() as stack:
+            for _, session in entries:
+                stack.enter_context(session.lock)
+            try:
+                if progress is not None:
+                    progress.expect(sum(session.pending(path) for path, (_, session) in zip(paths, entries)))
+                fresh = [(path, session) for path, (_, session) in zip(paths, entries) if session.offset == 0]
+                if workers > 1 and len(fresh) > 1:
+                    jobs = [(path, scan_end(path), session.history_ends()) for path, session in fresh]
+                    analyzers = analyze_each(jobs, workers, progress, **options)
+                    for (path, session), (_, end, _), analyzer in zip(fresh, jobs, analyzers):
+                        session.install(path, analyzer, end)
+                for path, (_, session) in zip(paths, entries):
+                    session.update(path, progress=progress)
+            except Exception:
+                for key, _ in entries:
+                    self.discard(key)
+                raise
+
+            merged = LogAnalyzer(**options)
+            for _, session in entries:
+                merged.merge(session.analyzer)
+            return func(merged)
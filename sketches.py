@@ -0,0 +1,198 @@
+import heapq
+import hashlib
+import math
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitter summary (Metwally et al.).
+    Tracks at most `capacity` keys; each reported count overestimates the true count
+    by at most the key's recorded error, and never by more than total / capacity.
+    """
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}   # key -> [count, error]
+        self.heap = []     # (count, key), one entry per tracked key; counts may be stale (too low)
+        self.total = 0
+
+    def add(self, key, count=1):
+        self.total += count
+        entry = self.counts.get(key)
+        if entry is not None:
+            entry[0] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = [count, 0]
+            heapq.heappush(self.heap, (count, key))
+            return
+        # Replace the current minimum; the newcomer inherits its count as error
+        min_count, min_key = self._pop_min()
+        del self.counts[min_key]
+        self.counts[key] = [min_count + count, min_count]
+        heapq.heappush(self.heap, (min_count + count, key))
+
+    def _pop_min(self):
+        while True:
+            count, key = heapq.heappop(self.heap)
+            current = self.counts[key][0]
+            if current == count:
+                return count, key
+            heapq.heappush(self.heap, (current, key))
+
+    def min_count(self):
+        """
+        Largest possible count of any key that is not tracked.
+        """
+        if len(self.counts) < self.capacity:
+            return 0
+        count, key = self._pop_min()
+        heapq.heappush(self.heap, (count, key))
+        return count
+
+    def most_common(self, n=None):
+        items = sorted(((key, entry[0]) for key, entry in self.counts.items()), key=lambda item: item[1], reverse=True)
+        return items[:n] if n is not None else items
+
+    def error_bound(self):
+        """
+        Maximum overestimation of any reported count.
+        """
+        return max((entry[1] for entry in self.counts.values()), default=0)
+
+    def merge(self, other):
+        """
+        Folds another summary into this one. Keys missing from a full summary may have
+        occurred up to its min_count() times, which is added to their error.
+        """
+        self_min = self.min_count()
+        other_min = other.min_count()
+        merged = {}
+        for key, (count, error) in self.counts.items():
+            other_entry = other.counts.get(key)
+            if other_entry is not None:
+                merged[key] = [count + other_entry[0], error + other_entry[1]]
+            else:
+                merged[key] = [count + other_min, error + other_min]
+        for key, (count, error) in other.counts.items():
+            if key not in merged:
+                merged[key] = [count + self_min, error + self_min]
+
+        if len(merged) > self.capacity:
+            keep = heapq.nlargest(self.capacity, merged.items(), key=lambda item: item[1][0])
+            merged = dict(keep)
+        self.counts = merged
+        self.heap = [(entry[0], key) for key, entry in merged.items()]
+        heapq.heapify(self.heap)
+        self.total += other.total
+        return self
+
+    def __len__(self):
+        return len(self.counts)
+
+class HyperLogLog:
+    """
+    HyperLogLog cardinality estimator with 2**precision one-byte registers.
+    Standard error is about 1.04 / sqrt(2**precision).
+    """
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+        self.alpha = 0.7213 / (1 + 1.079 / self.size)
+
+    def add(self, key):
+        # blake2b instead of hash() so registers from different worker processes can be merged
+        h = int.from_bytes(hashlib.blake2b(key.encode('utf-8', 'surrogateescape'), digest_size=8).digest(), 'big')
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        estimate = self.alpha * self.size * self.size / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            # Small range correction (linear counting)
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
+
+    def relative_error(self):
+        return 1.04 / math.sqrt(self.size)
+
+    def merge(self, other):
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+class QuantileSketch:
+    """
+    Streaming quantiles with bounded relative error (DDSketch, Masson et al.).
+    Positive values are counted in logarithmic buckets, so any reported quantile is within
+    `accuracy` (relative) of the true one; zero and negative values share one bucket at 0.
+    Memory grows with the value range, not the count; past `max_buckets` the lowest buckets
+    are folded together.
+    """
+    def __init__(self, accuracy=0.01, max_buckets=2048):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.buckets = {}   # index -> count
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+
+    def index(self, value):
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def value(self, index):
+        """
+        Representative value of a bucket: the one with the least relative error to any member.
+        """
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        if self.max is None or value > self.max:
+            self.max = value
+        if value <= 0:
+            self.zeros += 1
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        buckets = self.buckets
+        buckets[index] = buckets.get(index, 0) + 1
+        if len(buckets) > self.max_buckets:
+            self.collapse()
+
+    def collapse(self):
+        lowest, second = sorted(self.buckets)[:2]
+        self.buckets[second] += self.buckets.pop(lowest)
+
+    def quantile(self, q):
+        """
+        Value at rank floor(q * (count - 1)) of the sorted values, or None if empty.
+        """
+        if not self.count:
+            return None
+        rank = int(q * (self.count - 1))
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return self.value(index)
+        return self.max
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.sum += other.sum
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        while len(self.buckets) > self.max_buckets:
+            self.collapse()
+        return self
@@ -1,7 +1,19 @@
 let hourlyChartInstance = null;
 let statusChartInstance = null;
 let liveInterval = null;
-let lastFilePos = 0;
+let liveSource = null;
+let liveRefreshTimer = null;
+// ip -> country code from the server's GeoIP database (null if none is configured)
+let ipCountries = null;
+// Polling tail position: null until the first poll, which gets the last lines of the file.
+// The file's inode, device and head fingerprint go back with it so the server can tell
+// a rotated or truncated file.
+let lastFilePos = null;
+let tailFile = { inode: null, device: null, head: null };
+// Background analysis job shown in the loader
+let currentJobId = null;
+// Request body and ETag of the last silent refresh, sent back as If-None-Match
+let lastRefresh = { body: null, etag: null };
 
 // Translation Dictionary
 const translations = {
@@ -16,21 +28,31 @@ const translations = {
         journey: 'User Journey',
         safe: 'Safe',
         threatCount: 'Threats!',
-        hourly: 'Hourly Traffic',
+        hourly: 'Traffic Over Time',
         status: 'Status Codes',
         ips: 'Top Clients (IPs)',
         paths: 'Top Requests',
         uas: 'Top User Agents',
         refs: 'Top Referers',
+        countries: 'Top Countries',
+        slowest: 'Slowest Endpoints',
         analyze: 'ANALYZE',
         resolve: 'Resolve All',
         resolving: 'Resolving...',
         excludeBots: 'Exclude Bots',
         processing: 'Processing Logs...',
+        cancel: 'Cancel',
+        cancelled: 'Analysis cancelled',
+        linesPerSec: 'lines/s',
+        eta: 'ETA',
+        preview: 'Preview: estimated from {pct}% of the log, exact analysis running',
+        previewCancelled: 'Preview only: the exact analysis was cancelled',
         analyzing: 'Analyzing...',
         requests: 'Requests',
         live: 'LIVE',
         waiting: 'Waiting for new logs...',
+        skippedBytes: '… {n} bytes skipped …',
+        droppedLines: '… {n} lines dropped …',
         // Table Headers
         time: 'Time',
         ip: 'IP',
@@ -51,21 +73,31 @@ const translations = {
         journey: 'ユーザー行動履歴 (Journey)',
         safe: '安全',
         threatCount: '件の脅威！',
-        hourly: '時間帯別アクセス',
+        hourly: 'アクセス推移',
         status: 'ステータスコード',
         ips: 'クライアント (IP) Top',
         paths: 'リクエストパス Top',
         uas: 'ユーザーエージェント (UA)',
         refs: 'リファラー (流入元)',
+        countries: '国別アクセス',
+        slowest: '遅いエンドポイント',
         analyze: '解析開始',
         resolve: '一括解決 (DNS/Geo)',
         resolving: '解決中...',
         excludeBots: 'ボットを除外',
         processing: 'ログを解析中...',
+        cancel: 'キャンセル',
+        cancelled: '解析をキャンセルしました',
+        linesPerSec: '行/秒',
+        eta: '残り',
+        preview: 'プレビュー: ログの{pct}%から推定中、正確な解析を実行中',
+        previewCancelled: 'プレビューのみ: 正確な解析はキャンセルされました',
         analyzing: '解析中...',
         requests: '件数',
         live: 'ライブ',
         waiting: '新しいログを待機中...',
+        skippedBytes: '… {n} バイトを省略 …',
+        droppedLines: '… {n} 行を省略 …',
         // Table Headers
         time: '時刻',
         ip: 'IPアドレス',
@@ -135,6 +167,7 @@ function applyLanguage() {
     document.getElementById('lbl-exclude-bots').textContent = t.excludeBots;
     document.getElementById('btn-analyze').textContent = t.analyze;
     document.getElementById('msg-processing').textContent = t.processing;
+    document.getElementById('btn-cancel').textContent = t.cancel;
     document.getElementById('h-pv').textContent = t.pv;
     document.getElementById('h-uu').textContent = t.uu;
     document.getElementById('h-transfer').textContent = t.transfer;
@@ -174,6 +207,8 @@ function applyLanguage() {
     document.getElementById('t-paths').textContent = t.paths;
     document.getElementById('t-uas').textContent = t.uas;
     document.getElementById('t-refs').textContent = t.refs;
+    document.getElementById('t-countries').textContent = t.countries;
+    document.getElementById('t-slowest').textContent = t.slowest;
     document.getElementById('btn-resolve').textContent = t.resolve;
 
     if (hourlyChartInstance) {
@@ -213,6 +248,7 @@ async function startAnalysis(silent = false) {
     // Date Params
     const dateStart = document.getElementById('dateStart').value;
     const dateEnd = document.getElementById('dateEnd').value;
+    const resolution = document.getElementById('resolutionSelect').value;
 
     const dashboard = document.getElementById('dashboard');
     const loader = document.getElementById('loader');
@@ -223,32 +259,67 @@ async function startAnalysis(silent = false) {
         loader.classList.remove('hidden');
     }
 
+    const body = JSON.stringify({
+        filepath: path,
+        filter_bots: filterBots,
+        start_date: dateStart,
+        end_date: dateEnd,
+        resolution: resolution,
+        // Manual analyses of large logs show sampled estimates first
+        preview: !silent
+    });
+
     try {
-        const response = await fetch('/api/analyze', {
+        if (silent) {
+            // Refreshes wait for the result directly (joining a running identical analysis).
+            // The ETag of the last refresh lets the server answer 304 if nothing changed.
+            const headers = { 'Content-Type': 'application/json' };
+            if (lastRefresh.body === body && lastRefresh.etag) headers['If-None-Match'] = lastRefresh.etag;
+            const response = await fetch('/api/analyze', {
+                method: 'POST',
+                headers: headers,
+                body: body
+            });
+            if (response.status === 304) return;
+            const data = await response.json();
+            if (response.ok) {
+                lastRefresh = { body: body, etag: response.headers.get('ETag') };
+                updateDashboard(data);
+            } else {
+                console.error('Analysis error: ' + data.error);
+            }
+            return;
+        }
+
+        // Manual analyses run as a background job so progress can be shown and cancelled
+        document.getElementById('job-progress').textContent = '';
+        document.getElementById('preview-banner').classList.add('hidden');
+        const response = await fetch('/api/jobs', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                filepath: path,
-                filter_bots: filterBots,
-                start_date: dateStart,
-                end_date: dateEnd
-            })
+            body: body
         });
+        let job = await response.json();
+        // A cached result comes back finished, without a job to follow
+        if (response.ok && job.state !== 'done') {
+            job = await followJob(job.id);
+        }
 
-        const data = await response.json();
-
-        if (response.ok) {
-            updateDashboard(data);
-            if (!silent) {
-                loader.classList.add('hidden');
-                dashboard.classList.remove('hidden');
+        loader.classList.add('hidden');
+        const previewShown = !document.getElementById('preview-banner').classList.contains('hidden');
+        if (job.state === 'done') {
+            document.getElementById('preview-banner').classList.add('hidden');
+            updateDashboard(job.result);
+            dashboard.classList.remove('hidden');
+        } else if (job.state === 'cancelled') {
+            console.log(translations[currentLang].cancelled);
+            if (previewShown) {
+                document.getElementById('preview-text').textContent = translations[currentLang].previewCancelled;
+                document.getElementById('preview-progress').textContent = '';
             }
         } else {
-            console.error('Analysis error: ' + data.error);
-            if (!silent) {
-                alert('Error: ' + data.error);
-                loader.classList.add('hidden');
-            }
+            console.error('Analysis error: ' + job.error);
+            alert('Error: ' + job.error);
         }
     } catch (e) {
         console.error('Network or Server Error', e);
@@ -259,9 +330,90 @@ async function startAnalysis(silent = false) {
     }
 }
 
+// Streams a job's progress into the loader and resolves with its final state
+function followJob(jobId) {
+    currentJobId = jobId;
+    return new Promise((resolve) => {
+        const finish = (job) => {
+            currentJobId = null;
+            resolve(job);
+        };
+        const source = new EventSource(`/api/jobs/${jobId}/events`);
+        source.onmessage = (event) => {
+            const job = JSON.parse(event.data);
+            if (job.preview && job.state === 'running') showPreview(job.preview);
+            showJobProgress(job);
+            if (['done', 'failed', 'cancelled'].includes(job.state)) {
+                source.close();
+                finish(job);
+            }
+        };
+        source.onerror = async () => {
+            // Stream unavailable: poll the job instead
+            source.close();
+            while (true) {
+                const response = await fetch(`/api/jobs/${jobId}`);
+                const job = await response.json();
+                if (!response.ok) {
+                    finish({ state: 'failed', error: job.error });
+                    return;
+                }
+                if (job.preview && job.state === 'running') showPreview(job.preview);
+                showJobProgress(job);
+                if (['done', 'failed', 'cancelled'].includes(job.state)) {
+                    finish(job);
+                    return;
+                }
+                await new Promise(r => setTimeout(r, 1000));
+            }
+        };
+    });
+}
+
+function showJobProgress(job) {
+    const t = translations[currentLang];
+    const parts = [];
+    if (job.total_bytes > 0) parts.push(`${job.percent.toFixed(1)}%`);
+    parts.push(`${job.lines.toLocaleString()} (${job.lines_per_sec.toLocaleString()} ${t.linesPerSec})`);
+    if (job.eta !== null && job.eta !== undefined) parts.push(`${t.eta} ${Math.ceil(job.eta)}s`);
+    document.getElementById('job-progress').textContent = parts.join(' · ');
+    document.getElementById('preview-progress').textContent = parts.join(' · ');
+}
+
+// Sampled estimates arrive before the exact result: show them on the dashboard, marked as such
+function showPreview(preview) {
+    const t = translations[currentLang];
+    const pct = (preview.preview.fraction * 100).toFixed(preview.preview.fraction < 0.01 ? 2 : 1);
+    document.getElementById('preview-text').textContent = t.preview.replace('{pct}', pct);
+    document.getElementById('preview-banner').classList.remove('hidden');
+    document.getElementById('loader').classList.add('hidden');
+    document.getElementById('dashboard').classList.remove('hidden');
+    updateDashboard(preview);
+}
+
+// "≈ 1,234 ±2.1%" for an estimate with its [low, high] confidence interval
+function formatEstimate(value, interval) {
+    if (!interval) return value.toLocaleString();
+    const margin = value > 0 ? Math.max(value - interval[0], interval[1] - value) / value * 100 : 0;
+    return `≈ ${value.toLocaleString()} ±${margin.toFixed(1)}%`;
+}
+
+async function cancelAnalysis() {
+    if (!currentJobId) return;
+    try {
+        await fetch(`/api/jobs/${currentJobId}/cancel`, { method: 'POST' });
+    } catch (e) {
+        console.error('Cancel failed', e);
+    }
+}
+
 function updateDashboard(data) {
-    document.getElementById('val-pv').textContent = data.total_requests.toLocaleString();
-    document.getElementById('val-uu').textContent = data.unique_users.toLocaleString();
+    // Confidence intervals of a sampled preview (see showPreview), null for exact results
+    const intervals = data.preview ? data.preview.intervals : null;
+    document.getElementById('val-pv').textContent = intervals ? formatEstimate(data.total_requests, intervals.total_requests) : data.total_requests.toLocaleString();
+    document.getElementById('val-uu').textContent = intervals
+        ? `≈ ${data.unique_users.toLocaleString()} (${intervals.unique_users[0].toLocaleString()}–${intervals.unique_users[1].toLocaleString()})`
+        : data.unique_users.toLocaleString();
     const bytes = data.total_bytes;
     const mb = bytes / (1024 * 1024);
     const gb = bytes / (1024 * 1024 * 1024);
@@ -314,12 +466,14 @@ function updateDashboard(data) {
     const tables = ['ip', 'path', 'ua', 'ref'];
     tables.forEach(t => document.querySelector(`#${t}Table tbody`).innerHTML = '');
 
+    ipCountries = data.ip_countries || null;
     data.top_ips.forEach((item, index) => {
         const row = document.createElement('tr');
+        const flag = ipCountries && ipCountries[item[0]] ? ` ${countryFlag(ipCountries[item[0]])}` : '';
         row.innerHTML = `
             <td>#${index + 1}</td>
-            <td id="ip-cell-${index}"><span class="highlight-ip" onclick="openJourneyModal('${item[0]}')">${item[0]}</span> <button class="dns-btn" onclick="lookupOne('${item[0]}', ${index})"><i class="fa-solid fa-magnifying-glass"></i></button></td>
-            <td>${item[1].toLocaleString()}</td>
+            <td id="ip-cell-${index}"><span class="highlight-ip" onclick="openJourneyModal('${item[0]}')">${item[0]}</span> <button class="dns-btn" onclick="lookupOne('${item[0]}', ${index})"><i class="fa-solid fa-magnifying-glass"></i></button>${flag}</td>
+            <td>${intervals ? formatEstimate(item[1], intervals.top_ips[item[0]]) : item[1].toLocaleString()}</td>
             <td id="dns-res-${index}" style="color: #8b949e; font-size: 0.8rem;">-</td>
         `;
         document.querySelector('#ipTable tbody').appendChild(row);
@@ -327,7 +481,8 @@ function updateDashboard(data) {
 
     data.top_paths.forEach((item, index) => {
         const row = document.createElement('tr');
-        row.innerHTML = `<td>#${index + 1}</td><td title="${item[0]}">${item[0].length > 40 ? item[0].substring(0, 40) + '...' : item[0]}</td><td>${item[1].toLocaleString()}</td>`;
+        const count = intervals ? formatEstimate(item[1], intervals.top_paths[item[0]]) : item[1].toLocaleString();
+        row.innerHTML = `<td>#${index + 1}</td><td title="${item[0]}">${item[0].length > 40 ? item[0].substring(0, 40) + '...' : item[0]}</td><td>${count}</td>`;
         document.querySelector('#pathTable tbody').appendChild(row);
     });
 
@@ -344,6 +499,34 @@ function updateDashboard(data) {
         document.querySelector('#refTable tbody').appendChild(row);
     });
 
+    const countryCard = document.getElementById('countryCard');
+    document.querySelector('#countryTable tbody').innerHTML = '';
+    if (data.top_countries) {
+        countryCard.classList.remove('hidden');
+        data.top_countries.forEach((item, index) => {
+            const row = document.createElement('tr');
+            const label = item[0] === '-' ? '(Unknown)' : `${countryFlag(item[0])} ${item[0]}`;
+            row.innerHTML = `<td>#${index + 1}</td><td>${label}</td><td>${item[1].toLocaleString()}</td>`;
+            document.querySelector('#countryTable tbody').appendChild(row);
+        });
+    } else {
+        countryCard.classList.add('hidden');
+    }
+
+    // Response time percentiles (seconds), only for log formats with $request_time
+    const latencyCard = document.getElementById('latencyCard');
+    document.querySelector('#latencyTable tbody').innerHTML = '';
+    if (data.latency && data.latency.slowest_paths.length) {
+        latencyCard.classList.remove('hidden');
+        data.latency.slowest_paths.forEach(item => {
+            const row = document.createElement('tr');
+            row.innerHTML = `<td title="${item.path}">${item.path.length > 40 ? item.path.substring(0, 40) + '...' : item.path}</td><td>${item.count.toLocaleString()}</td><td>${item.p50.toFixed(3)}</td><td class="latency-p95">${item.p95.toFixed(3)}</td><td>${item.p99.toFixed(3)}</td>`;
+            document.querySelector('#latencyTable tbody').appendChild(row);
+        });
+    } else {
+        latencyCard.classList.add('hidden');
+    }
+
     updateCharts(data);
     if (data.security && data.security.total_threats > 0) {
         updateThreatChart(data.security);
@@ -386,25 +569,38 @@ function updateThreatChart(secData) {
 // ... updateCharts ... (keep as is)
 
 // User Journey Modal Logic
+const JOURNEY_PAGE_SIZE = 500;
+let journeyLoaded = 0;
+
 async function openJourneyModal(ip) {
     const modal = document.getElementById('journeyModal');
     const titleIp = document.getElementById('journey-ip');
     const tbody = document.querySelector('#journeyTable tbody');
-    const path = document.getElementById('logPath').value;
 
     titleIp.textContent = ip;
     tbody.innerHTML = '<tr><td colspan="4" style="text-align:center;">Loading...</td></tr>';
     modal.classList.remove('hidden');
 
+    journeyLoaded = 0;
+    await loadJourneyPage(ip, true);
+}
+
+async function loadJourneyPage(ip, first = false) {
+    const tbody = document.querySelector('#journeyTable tbody');
+    const path = document.getElementById('logPath').value;
+
     try {
         const response = await fetch('/api/ip_history', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ filepath: path, ip: ip })
+            body: JSON.stringify({ filepath: path, ip: ip, offset: journeyLoaded, limit: JOURNEY_PAGE_SIZE })
         });
         const data = await response.json();
 
-        tbody.innerHTML = '';
+        if (first) tbody.innerHTML = '';
+        const moreRow = document.getElementById('journey-more');
+        if (moreRow) moreRow.remove();
+
         if (data.history && data.history.length > 0) {
             data.history.forEach(item => {
                 const row = document.createElement('tr');
@@ -426,10 +622,20 @@ async function openJourneyModal(ip) {
                 `;
                 tbody.appendChild(row);
             });
-        } else {
+        } else if (first) {
             tbody.innerHTML = '<tr><td colspan="4" style="text-align:center;">No history found.</td></tr>';
         }
 
+        // Large histories (e.g. bots) are paged instead of returned in one body
+        journeyLoaded = data.offset + data.limit;
+        if (data.total > journeyLoaded) {
+            const row = document.createElement('tr');
+            row.id = 'journey-more';
+            row.innerHTML = `<td colspan="4" style="text-align:center;"><button class="dns-btn">${journeyLoaded.toLocaleString()} / ${data.total.toLocaleString()} - Load more</button></td>`;
+            row.querySelector('button').onclick = () => loadJourneyPage(ip);
+            tbody.appendChild(row);
+        }
+
     } catch (e) {
         tbody.innerHTML = '<tr><td colspan="4" style="text-align:center; color:red;">Error fetching history</td></tr>';
     }
@@ -447,10 +653,21 @@ window.onclick = function (event) {
     if (event.target == m2) m2.classList.add('hidden');
 }
 
+function formatBucket(ts, resolution) {
+    // Bucket starts are epoch seconds; show them in the browser's local time
+    const d = new Date(ts * 1000);
+    const pad = n => String(n).padStart(2, '0');
+    const date = `${d.getMonth() + 1}/${d.getDate()}`;
+    if (resolution === 'day') return date;
+    return `${date} ${pad(d.getHours())}:${pad(d.getMinutes())}`;
+}
+
 function updateCharts(data) {
     const t = translations[currentLang];
-    const hours = Object.keys(data.hourly_stats);
-    const hourCounts = Object.values(data.hourly_stats);
+    // Real time series when the server provides one, hour-of-day totals otherwise
+    const series = data.time_series;
+    const hours = series ? series.timestamps.map(ts => formatBucket(ts, series.resolution)) : Object.keys(data.hourly_stats);
+    const hourCounts = series ? series.requests : Object.values(data.hourly_stats);
     const isDark = currentTheme === 'dark';
     const gridColor = isDark ? 'rgba(255,255,255,0.05)' : 'rgba(0,0,0,0.05)';
     const textColor = isDark ? '#e6edf3' : '#24292f';
@@ -522,23 +739,21 @@ async function toggleLiveMonitor() {
         document.getElementById('lbl-live').classList.add('active');
         document.getElementById('live-filename').textContent = path;
 
-        // Reset pointers? No, maybe start from end of file (tail)?
-        // For now, let's just start reading from current end
         try {
-            // Initial probe to get size
-            // Actually, we can just say last_pos = 0 if we want everything, 
-            // but for "Live" we usually want only new stuff.
-            // Let's assume we want to catch up a bit or start fresh.
-            // Simplified: we will start from current EOF.
-            // We need an API call to get size? Or just send a huge number?
-            // Sending -1 to API could mean "tail from end"
-
-            // For simplicity, let's start with last_pos = 0 but maybe we should skip old content?
-            // Actually, usually users want to see *future* logs. 
-            // Let's set last_pos to a very large number, the API will reset it to EOF.
-            lastFilePos = 999999999999;
-
-            liveInterval = setInterval(pollLog, 2000); // 2s polling
+            lastFilePos = null;
+            tailFile = { inode: null, device: null, head: null };
+
+            if (window.EventSource) {
+                // Server push: the server reads the file once for every open dashboard
+                liveSource = new EventSource('/api/live?filepath=' + encodeURIComponent(path));
+                liveSource.onmessage = (event) => {
+                    const data = JSON.parse(event.data);
+                    if (data.dropped) appendTerminalNotice(translations[currentLang].droppedLines.replace('{n}', data.dropped.toLocaleString()));
+                    appendTerminalLines(data.lines);
+                };
+            } else {
+                liveInterval = setInterval(pollLog, 2000); // 2s polling
+            }
         } catch (e) { }
 
     } else {
@@ -546,6 +761,10 @@ async function toggleLiveMonitor() {
         terminal.classList.add('hidden');
         document.getElementById('lbl-live').classList.remove('active');
         if (liveInterval) clearInterval(liveInterval);
+        if (liveSource) {
+            liveSource.close();
+            liveSource = null;
+        }
     }
 }
 
@@ -555,45 +774,65 @@ async function pollLog() {
         const response = await fetch('/api/tail', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ filepath: path, last_pos: lastFilePos })
+            body: JSON.stringify({ filepath: path, last_pos: lastFilePos, inode: tailFile.inode, device: tailFile.device, head: tailFile.head })
         });
 
         if (!response.ok) return;
 
         const data = await response.json();
         lastFilePos = data.last_pos;
+        tailFile = { inode: data.inode, device: data.device, head: data.head };
 
-        if (data.new_lines && data.new_lines.length > 0) {
-            const container = document.getElementById('terminal-content');
-
-            // Remove initial waiting message if exists
-            const waitMsg = container.querySelector('.system-msg');
-            if (waitMsg) waitMsg.remove();
+        // The server only sends the newest lines of a large backlog
+        if (data.skipped) appendTerminalNotice(translations[currentLang].skippedBytes.replace('{n}', data.skipped.toLocaleString()));
+        appendTerminalLines(data.new_lines);
+    } catch (e) {
+        console.error('Polling error', e);
+    }
+}
 
-            data.new_lines.forEach(line => {
-                const div = document.createElement('div');
-                div.className = 'terminal-line';
-                // Basic syntax highlighting
-                if (line.includes(' 200 ')) div.classList.add('status-2xx');
-                else if (line.includes(' 404 ')) div.classList.add('status-4xx');
-                else if (line.includes(' 500 ')) div.classList.add('status-5xx');
-                else if (line.includes(' 502 ')) div.classList.add('status-5xx');
+function appendTerminalNotice(text) {
+    const div = document.createElement('div');
+    div.className = 'terminal-line skip-msg';
+    div.textContent = text;
+    document.getElementById('terminal-content').prepend(div);
+}
 
-                div.textContent = line;
-                container.prepend(div); // Newest top
+// {line, status, class, threats} entries from /api/live or /api/tail
+function appendTerminalLines(lines) {
+    if (!lines || lines.length === 0) return;
+    const container = document.getElementById('terminal-content');
+
+    // Remove initial waiting message if exists
+    const waitMsg = container.querySelector('.system-msg');
+    if (waitMsg) waitMsg.remove();
+
+    lines.forEach(entry => {
+        const line = entry.line;
+        const div = document.createElement('div');
+        div.className = 'terminal-line';
+        // Highlighting by the status class the server parsed ('2xx', '4xx', ...)
+        if (entry.class) div.classList.add(`status-${entry.class}`);
+
+        div.textContent = line;
+        if (entry.threats) {
+            div.classList.add('threat-line');
+            div.textContent = `[${entry.threats.join(', ')}] ${line}`;
+        }
+        container.prepend(div); // Newest top
 
-                // Limit lines
-                if (container.children.length > 100) {
-                    container.lastChild.remove();
-                }
-            });
+        // Limit lines
+        if (container.children.length > 100) {
+            container.lastChild.remove();
+        }
+    });
 
-            // New lines detected, trigger silent dashboard update
-            // Debounce or just call it? calling it every 2s is fine for local.
+    // New lines detected, trigger a silent dashboard update (at most every 2s)
+    if (!liveRefreshTimer) {
+        liveRefreshTimer = setTimeout(() => {
+            liveRefreshTimer = null;
             startAnalysis(true);
-        }
-    } catch (e) {
-        console.error('Polling error', e);
+        }, 2000);
     }
 }
 
@@ -707,20 +946,40 @@ async function lookupOne(ip, index) {
         dnsName = data.hostname;
     } catch { dnsName = '?'; }
 
-    let countryFlag = '';
+    await renderLookup(ip, index, dnsName);
+}
+
+// Regional indicator emoji for an ISO country code, rendered without any network access
+function countryFlag(code) {
+    if (!/^[A-Za-z]{2}$/.test(code)) return '';
+    return String.fromCodePoint(...code.toUpperCase().split('').map(ch => 0x1F1A5 + ch.charCodeAt(0)));
+}
+
+async function renderLookup(ip, index, dnsName) {
+    const resCell = document.getElementById(`dns-res-${index}`);
+    resCell.innerHTML = `<span style="color:#a371f7">${dnsName}</span>`;
+
+    // The server's GeoIP database already answered, don't send the IP to a third party
+    if (ipCountries) {
+        const flag = ipCountries[ip] ? countryFlag(ipCountries[ip]) + ' ' : '';
+        resCell.innerHTML = `${flag}<span style="color:#a371f7">${dnsName}</span>`;
+        return;
+    }
+
+    let flagHtml = '';
     if (!ip.startsWith('192.168.') && !ip.startsWith('127.') && !ip.startsWith('10.')) {
         try {
             const geoRes = await fetch(`https://ipapi.co/${ip}/json/`);
             if (geoRes.ok) {
                 const geoData = await geoRes.json();
                 if (geoData.country_name) {
-                    countryFlag = `<img src="https://flagcdn.com/16x12/${geoData.country.toLowerCase()}.png" style="vertical-align: middle; margin-right: 4px;">`;
+                    flagHtml = `<img src="https://flagcdn.com/16x12/${geoData.country.toLowerCase()}.png" style="vertical-align: middle; margin-right: 4px;">`;
                 }
             }
         } catch (e) { }
-    } else { countryFlag = '<i class="fa-solid fa-house"></i> '; }
+    } else { flagHtml = '<i class="fa-solid fa-house"></i> '; }
 
-    resCell.innerHTML = `${countryFlag} <span style="color:#a371f7">${dnsName}</span>`;
+    resCell.innerHTML = `${flagHtml} <span style="color:#a371f7">${dnsName}</span>`;
 }
 
 async function resolveAllDNS() {
@@ -730,6 +989,7 @@ async function resolveAllDNS() {
     document.getElementById('btn-resolve').innerHTML = `<i class="fa-solid fa-spinner fa-spin"></i> ${t.resolving}`;
     btn.disabled = true;
 
+    const pending = [];
     const rows = document.querySelectorAll('#ipTable tbody tr');
     for (let i = 0; i < rows.length; i++) {
         const ipCell = document.getElementById(`ip-cell-${i}`);
@@ -737,8 +997,31 @@ async function resolveAllDNS() {
         const ip = ipCell.childNodes[0].textContent.trim();
         const resCell = document.getElementById(`dns-res-${i}`);
         if (resCell.textContent.trim() !== '-' && !resCell.innerHTML.includes('fa-spin')) continue;
-        await lookupOne(ip, i);
-        await new Promise(r => setTimeout(r, 600));
+        resCell.innerHTML = '<i class="fa-solid fa-circle-notch fa-spin"></i>';
+        pending.push({ ip: ip, index: i });
+    }
+
+    // One request resolves every hostname on the server, concurrently and cached
+    let hostnames = {};
+    if (pending.length > 0) {
+        try {
+            const response = await fetch('/api/dns_lookup_batch', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ ips: pending.map(p => p.ip) })
+            });
+            const data = await response.json();
+            hostnames = data.results || {};
+        } catch (e) { }
+    }
+    pending.forEach(p => {
+        document.getElementById(`dns-res-${p.index}`).innerHTML = `<span style="color:#a371f7">${hostnames[p.ip] || '?'}</span>`;
+    });
+
+    // Without a local GeoIP database, flags come from a rate-limited public API, so keep those sequential
+    for (const p of pending) {
+        await renderLookup(p.ip, p.index, hostnames[p.ip] || '?');
+        if (!ipCountries) await new Promise(r => setTimeout(r, 600));
     }
     document.getElementById('btn-resolve').textContent = originalText;
     btn.disabled = false;
@@ -0,0 +1,137 @@
+import os
+
+import pytest
+
+columnar = pytest.importorskip('columnar')
+if not columnar.available():
+    pytest.skip('numpy is not installed', allow_module_level=True)
+
+import datetime
+
+import log_parser
+from analyzer import LogAnalyzer
+from jobs import JobCancelled
+from log_reader import iter_records
+from loggen import LogGenerator
+
+def build(path, cache_dir):
+    log = columnar.ColumnarLog(path, str(cache_dir))
+    log.clear_files()
+    log.refresh()
+    return log
+
+def test_flushed_append_matches_single_write(tmp_path, monkeypatch):
+    path = str(tmp_path / 'access.log')
+    LogGenerator(seed=5, attack_fraction=0.05).write(path, 3000)
+    expected = build(path, tmp_path / 'whole').get_statistics()
+
+    monkeypatch.setattr(columnar, 'FLUSH_RECORDS', 128)
+    flushed = build(path, tmp_path / 'flushed')
+    assert flushed.get_statistics() == expected
+
+    reloaded = columnar.ColumnarLog(path, str(tmp_path / 'flushed'))
+    reloaded.load()
+    assert reloaded.meta['count'] == flushed.meta['count']
+    assert reloaded.get_statistics() == expected
+
+def test_reloaded_cache_keeps_rate_windows(tmp_path):
+    rules = tmp_path / 'rules.json'
+    rules.write_text('{"rate_limits": {"flood_threshold": 30, "flood_window": 10}}')
+    lines = list(LogGenerator(seed=4, days=0.01).lines(12000))
+    path = str(tmp_path / 'access.log')
+    whole = str(tmp_path / 'whole.log')
+    with open(whole, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines[:7000]) + '\n')
+    columnar.ColumnarLog(path, str(tmp_path / 'cache'), str(rules)).refresh()
+    with open(path, 'a') as f:
+        f.write('\n'.join(lines[7000:]) + '\n')
+
+    # A restarted server loads the cache and appends the new lines
+    reloaded = columnar.ColumnarLog(path, str(tmp_path / 'cache'), str(rules))
+    reloaded.load()
+    reloaded.refresh()
+    expected = columnar.ColumnarLog(whole, str(tmp_path / 'expected'), str(rules))
+    expected.refresh()
+    assert reloaded.threats == expected.threats
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+@pytest.mark.parametrize('log_format', ['combined', 'timed'])
+@pytest.mark.parametrize('options', [
+    {},
+    {'filter_bots': True},
+    {'start_date': datetime.datetime(2026, 1, 20, 6, 0, tzinfo=JST),
+     'end_date': datetime.datetime(2026, 1, 20, 18, 0, tzinfo=JST)},
+    {'filter_bots': True, 'start_date': datetime.datetime(2026, 1, 20, 6, 0, tzinfo=JST)},
+], ids=['no-filter', 'filter-bots', 'date-range', 'bots-and-start'])
+def test_statistics_match_log_analyzer(tmp_path, monkeypatch, log_format, options):
+    monkeypatch.setattr(log_parser, '_active_format', log_parser.get_log_format(log_format))
+    rules = tmp_path / 'rules.json'
+    rules.write_text('{"rate_limits": {"flood_threshold": 30, "flood_window": 10}}')
+    path = str(tmp_path / 'access.log')
+    LogGenerator(seed=6, days=1, attack_fraction=0.05, timed=log_format == 'timed').write(path, 8000)
+
+    analyzer = LogAnalyzer(security_rules=str(rules), **options)
+    for record in iter_records(path):
+        analyzer.process_record(record)
+    log = columnar.ColumnarLog(path, str(tmp_path / 'cache'), str(rules))
+    log.refresh()
+    assert log.get_statistics(**options) == analyzer.get_statistics()
+
+class CancelAfter:
+    """
+    Progress sink that cancels the job once `nbytes` have been read.
+    """
+    def __init__(self, nbytes):
+        self.left = nbytes
+
+    def expect(self, nbytes):
+        pass
+
+    def advance(self, nbytes, nlines=0):
+        self.left -= nbytes
+        if self.left < 0:
+            raise JobCancelled()
+
+def test_cancelled_update_keeps_the_committed_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar, 'FLUSH_RECORDS', 256)
+    lines = list(LogGenerator(seed=7).lines(6000))
+    path = str(tmp_path / 'access.log')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines[:2000]) + '\n')
+    store = columnar.ColumnarCacheStore(str(tmp_path / 'cache'))
+    before = store.analyze(path)
+    committed = dict(store.get(path).meta)
+    with open(path, 'a') as f:
+        f.write('\n'.join(lines[2000:]) + '\n')
+
+    with pytest.raises(JobCancelled):
+        store.analyze(path, progress=CancelAfter(300000))
+    log = store.get(path)
+    # Back to the last committed state, not an empty cache
+    assert log.meta['end'] == committed['end'] and log.meta['count'] == committed['count']
+    assert log.get_statistics() == before
+
+    whole = str(tmp_path / 'whole.log')
+    with open(whole, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    expected = columnar.ColumnarCacheStore(str(tmp_path / 'expected')).analyze(whole)
+    assert store.analyze(path) == expected
+
+def test_cancelled_rebuild_leaves_an_empty_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar, 'FLUSH_RECORDS', 256)
+    path = str(tmp_path / 'access.log')
+    LogGenerator(seed=8).write(path, 2000)
+    store = columnar.ColumnarCacheStore(str(tmp_path / 'cache'))
+    store.analyze(path)
+    # Rotated: a new file under the same name, so the cache files are cleared for a rebuild
+    os.remove(path)
+    LogGenerator(seed=9).write(path, 6000)
+    with pytest.raises(JobCancelled):
+        store.analyze(path, progress=CancelAfter(300000))
+    log = store.get(path)
+    assert log.meta['end'] == 0 and log.meta['count'] == 0
+    assert store.analyze(path) == columnar.ColumnarCacheStore(str(tmp_path / 'expected')).analyze(path)
+
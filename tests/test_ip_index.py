@@ -0,0 +1,33 @@
+import log_parser
+from ip_index import IPIndexStore
+
+# The client IP isn't the first field of this format
+IP_SECOND = '[$time_local] $remote_addr "$request" $status $body_bytes_sent'
+
+def line(ip, path):
+    return '[01/Jan/2026:00:00:00 +0000] %s "GET %s HTTP/1.1" 200 10' % (ip, path)
+
+def test_ip_is_read_with_the_active_format(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_parser, '_active_format', log_parser.get_log_format(IP_SECOND))
+    path = str(tmp_path / 'access.log')
+    lines = [line('10.0.0.1', '/a'), line('10.0.0.2', '/b'), line('10.0.0.1', '/c'), 'not a log line']
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    store = IPIndexStore(str(tmp_path / 'index'))
+    total, found = store.read_lines(path, '10.0.0.1')
+    assert total == 2 and [raw.rstrip('\n') for raw in found] == [lines[0], lines[2]]
+    assert store.read_lines(path, '[01/Jan/2026:00:00:00')[0] == 0
+
+def test_format_change_rebuilds_the_index(tmp_path, monkeypatch):
+    path = str(tmp_path / 'access.log')
+    with open(path, 'w') as f:
+        f.write(line('10.0.0.1', '/a') + '\n' + line('10.0.0.2', '/b') + '\n')
+    index_dir = str(tmp_path / 'index')
+    monkeypatch.setattr(log_parser, '_active_format', log_parser.get_log_format('combined'))
+    assert IPIndexStore(index_dir).read_lines(path, '10.0.0.2')[0] == 0
+    monkeypatch.setattr(log_parser, '_active_format', log_parser.get_log_format(IP_SECOND))
+    # Neither the index in memory nor the one saved with the old format is used
+    store = IPIndexStore(index_dir)
+    assert store.read_lines(path, '10.0.0.2')[0] == 1
+    monkeypatch.setattr(log_parser, '_active_format', log_parser.get_log_format('combined'))
+    assert store.read_lines(path, '10.0.0.2')[0] == 0
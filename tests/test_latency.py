@@ -0,0 +1,35 @@
+from latency import KeyedSketches, OTHER_KEY
+
+def test_late_busy_key_is_reported():
+    sketches = KeyedSketches(max_keys=3, max_tracked=8)
+    for i in range(20):
+        sketches.add(f'/early/{i}', 0.1)
+    for _ in range(50):
+        sketches.add('/late', 0.5)
+    summaries = sketches.summaries()
+    assert len(summaries) == 3
+    # Its first request may have gone to OTHER_KEY, as the newest key with the lowest count
+    assert summaries['/late']['count'] >= 49
+    assert len(sketches.sketches) <= 8
+    assert sum(sketch.count for sketch in sketches.sketches.values()) == 70
+
+def parts():
+    result = []
+    for part in range(3):
+        sketches = KeyedSketches(max_keys=2, max_tracked=4)
+        for i in range(4):
+            # Key i is seen i + 1 times, '/2/0' 11 times
+            for _ in range(i + 1 + (10 if part == 2 and i == 0 else 0)):
+                sketches.add(f'/{part}/{i}', 0.1)
+        result.append(sketches)
+    return result
+
+def test_merge_keeps_the_most_requested_in_any_order():
+    for order in ((0, 1, 2), (2, 1, 0)):
+        sketches = parts()
+        merged = sketches[order[0]]
+        for i in order[1:]:
+            merged.merge(sketches[i])
+        # Ties at 4 requests are broken by key
+        assert list(merged.summaries()) in (['/0/3', '/2/0'], ['/2/0', '/0/3'])
+        assert sum(sketch.count for sketch in merged.sketches.values()) == 40
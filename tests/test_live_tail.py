@@ -0,0 +1,71 @@
+import os
+
+from live_tail import FileWatcher
+from log_reader import read_head
+from loggen import LogGenerator
+
+def test_reads_are_bounded_and_resume(tmp_path):
+    path = str(tmp_path / 'access.log')
+    lines = list(LogGenerator(seed=7).lines(250))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines[:50]) + '\n')
+    watcher = FileWatcher(path, max_lines=40, max_bytes=1024 * 1024)
+    watcher.inode, watcher.device = os.stat(path).st_ino, os.stat(path).st_dev
+    watcher.offset = os.path.getsize(path)
+
+    with open(path, 'a') as f:
+        f.write('\n'.join(lines[50:]) + '\n')
+    batches = []
+    while True:
+        batch = watcher.read_new_lines()
+        if not batch:
+            break
+        batches.append(batch)
+    assert [len(batch) for batch in batches] == [40, 40, 40, 40, 40]
+    assert [entry['line'] for batch in batches for entry in batch] == lines[50:]
+
+def test_rotation_backlog_is_spread_over_reads(tmp_path):
+    path = str(tmp_path / 'access.log')
+    lines = list(LogGenerator(seed=8).lines(300))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines[:10]) + '\n')
+    watcher = FileWatcher(path, max_lines=10000, max_bytes=4096)
+    watcher.inode, watcher.device = os.stat(path).st_ino, os.stat(path).st_dev
+    watcher.offset = os.path.getsize(path)
+
+    # Rotated: a new, larger file takes the path
+    os.rename(path, path + '.1')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    seen = []
+    while True:
+        batch = watcher.read_new_lines()
+        if not batch:
+            break
+        assert sum(len(entry['line']) + 1 for entry in batch) < 4096 + 1024
+        seen.extend(entry['line'] for entry in batch)
+    assert seen == lines
+
+def test_copytruncate_grown_past_the_offset_is_read_from_the_start(tmp_path):
+    path = str(tmp_path / 'access.log')
+    old = list(LogGenerator(seed=9).lines(20))
+    new = list(LogGenerator(seed=10).lines(200))
+    with open(path, 'w') as f:
+        f.write('\n'.join(old) + '\n')
+    watcher = FileWatcher(path)
+    watcher.inode, watcher.device = os.stat(path).st_ino, os.stat(path).st_dev
+    watcher.offset = os.path.getsize(path)
+    watcher.head = read_head(path, 256)
+
+    # Copied away and truncated in place, then written past the old offset before the next poll
+    with open(path, 'r+') as f:
+        f.truncate(0)
+        f.write('\n'.join(new) + '\n')
+    assert os.path.getsize(path) > watcher.offset
+    seen = []
+    while True:
+        batch = watcher.read_new_lines()
+        if not batch:
+            break
+        seen.extend(entry['line'] for entry in batch)
+    assert seen == new
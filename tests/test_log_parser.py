@@ -0,0 +1,74 @@
+import datetime
+import tracemalloc
+
+from log_parser import LOG_PATTERN, parse_lines
+from loggen import LogGenerator
+
+# How much less memory, and how many fewer allocations, a parsed record keeps alive than
+# the dict per line parse_log_line() used to return
+MIN_BYTES_RATIO = 3
+MIN_BLOCKS_RATIO = 3
+
+def parse_dicts(lines):
+    # The old parser: a dict with its own copy of every field, a datetime and a float per line
+    for line in lines:
+        match = LOG_PATTERN.match(line)
+        if match:
+            data = match.groupdict()
+            data['status'] = int(data['status'])
+            data['bytes'] = int(data['bytes'])
+            try:
+                dt = datetime.datetime.strptime(data['time'], '%d/%b/%Y:%H:%M:%S %z')
+                data['datetime_obj'] = dt
+                data['timestamp'] = dt.timestamp()
+            except ValueError:
+                data['datetime_obj'] = None
+                data['timestamp'] = 0
+            yield data
+
+def retained(parse, lines):
+    """
+    (bytes, allocations) per record still allocated after parsing `lines` into a list.
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        records = list(parse(lines))
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    assert len(records) > 19900
+    return (sum(stat.size_diff for stat in stats) / len(records),
+            sum(stat.count_diff for stat in stats) / len(records))
+
+def test_records_are_compact():
+    lines = list(LogGenerator(seed=21).lines(20000))
+    dict_bytes, dict_blocks = retained(parse_dicts, lines)
+    record_bytes, record_blocks = retained(parse_lines, lines)
+    assert dict_bytes / record_bytes >= MIN_BYTES_RATIO
+    assert dict_blocks / record_blocks >= MIN_BLOCKS_RATIO
+
+def test_repeated_fields_share_one_string():
+    records = list(parse_lines(LogGenerator(seed=22).lines(5000)))
+    for field in ('ip', 'user_agent', 'referer'):
+        values = [getattr(record, field) for record in records]
+        assert len({id(value) for value in values}) == len(set(values))
+
+def test_time_and_request_are_given_back_exactly():
+    lines = list(LogGenerator(seed=23, attack_fraction=0.2, malformed_fraction=0.05).lines(5000)) + [
+        '1.2.3.4 - - [1/Jan/2026:00:00:00 +0900] "GET  /a HTTP/1.1" 200 1 "-" "-"',
+        '1.2.3.4 - - [31/Feb/2026:00:00:00 +0900] "GET\t/a HTTP/1.1" 200 1 "-" "-"',
+        '1.2.3.4 - - [01/Jan/2026:00:00:60 +0900] "-" 400 1 "-" "-"',
+        '1.2.3.4 - - [01/Jan/2026:23:59:59 -0130] " GET /a HTTP/1.1" 200 1 "-" "-"',
+    ]
+    matches = [match.groupdict() for match in map(LOG_PATTERN.match, lines) if match]
+    records = list(parse_lines(lines))
+    assert len(records) == len(matches)
+    for record, fields in zip(records, matches):
+        assert record.time == fields['time']
+        assert record.request == fields['request']
+        parts = fields['request'].split()
+        assert record.path == (parts[1] if len(parts) >= 2 else fields['request'])
+        assert record.protocol == (parts[2] if len(parts) >= 3 else None)
+
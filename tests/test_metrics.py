@@ -0,0 +1,28 @@
+import pytest
+
+import metrics
+
+def test_analysis_peak_is_not_the_process_peak():
+    if metrics.current_rss() is None or metrics.process_peak_rss() is None:
+        pytest.skip('resident set size is not available')
+    # A high water mark left by something before the analysis
+    spike = bytearray(256 * 1024 * 1024)
+    spike[::4096] = b'x' * len(spike[::4096])
+    del spike
+
+    recorder = metrics.Recorder()
+    recorder.count_block(b'line\n' * 1000, 1000)
+    recorder.finish()
+    assert recorder.peak_rss is not None
+    assert recorder.peak_rss < metrics.process_peak_rss() - 128 * 1024 * 1024
+
+def test_analysis_peak_includes_its_own_growth():
+    if metrics.current_rss() is None:
+        pytest.skip('resident set size is not available')
+    recorder = metrics.Recorder()
+    start = recorder.peak_rss
+    held = bytearray(64 * 1024 * 1024)
+    held[::4096] = b'x' * len(held[::4096])
+    recorder.finish()
+    assert recorder.peak_rss >= start + 48 * 1024 * 1024
+    del held
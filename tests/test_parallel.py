@@ -0,0 +1,125 @@
+import json
+import time
+import datetime
+
+import pytest
+
+import latency
+import log_parser
+import parallel
+from analyzer import LogAnalyzer
+from jobs import JobCancelled
+from log_reader import iter_records, split_ranges
+from loggen import LogGenerator
+
+class CancelledAfter:
+    """
+    Progress sink whose advance() raises JobCancelled once `seconds` have passed.
+    """
+    def __init__(self, seconds):
+        self.deadline = time.time() + seconds
+
+    def expect(self, nbytes):
+        pass
+
+    def advance(self, nbytes, nlines=0):
+        if time.time() >= self.deadline:
+            raise JobCancelled()
+
+@pytest.fixture(scope='module')
+def large_log(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('logs') / 'access.log')
+    LogGenerator(seed=11).write(path, 40000)
+    return path
+
+def test_cancel_event_stops_worker(large_log):
+    pool, cancel_event = parallel.start_pool(1)
+    with pool:
+        cancel_event.set()
+        future = pool.submit(parallel.counting_lines, parallel.analyze_range, large_log, 0, 1024 * 1024)
+        with pytest.raises(JobCancelled):
+            future.result()
+
+def test_cancelled_parallel_scan_stops_early(large_log, monkeypatch):
+    monkeypatch.setattr(parallel, 'MIN_PARALLEL_BYTES', 0)
+    began = time.time()
+    parallel.analyze_file(large_log, workers=1)
+    sequential = time.time() - began
+
+    began = time.time()
+    with pytest.raises(JobCancelled):
+        parallel.analyze_file(large_log, workers=2, progress=CancelledAfter(0))
+    assert time.time() - began < sequential / 2
+
+RATE_RULES = {'rate_limits': {'flood_threshold': 30, 'flood_window': 10, 'auth_threshold': 4, 'auth_window': 60}}
+
+@pytest.fixture(scope='module')
+def rules(tmp_path_factory):
+    path = tmp_path_factory.mktemp('rules') / 'rules.json'
+    path.write_text(json.dumps(RATE_RULES))
+    return str(path)
+
+@pytest.fixture(scope='module')
+def dense_log(tmp_path_factory):
+    # About 17 lines a second with 5% attacks, so rate and signature threats fall in every range
+    path = str(tmp_path_factory.mktemp('logs') / 'dense.log')
+    LogGenerator(seed=12, days=0.01, attack_fraction=0.05).write(path, 15000)
+    return path
+
+def sequential(path, **options):
+    analyzer = LogAnalyzer(**options)
+    for record in iter_records(path):
+        analyzer.process_record(record)
+    return analyzer.get_statistics()
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'filter_bots': True},
+    {'start_date': datetime.datetime(2026, 1, 20, 0, 3, tzinfo=JST),
+     'end_date': datetime.datetime(2026, 1, 20, 0, 10, tzinfo=JST)},
+], ids=['no-filter', 'filter-bots', 'date-range'])
+@pytest.mark.parametrize('workers', [2, 3])
+def test_parallel_matches_sequential(dense_log, rules, monkeypatch, options, workers):
+    monkeypatch.setattr(parallel, 'MIN_PARALLEL_BYTES', 0)
+    options = dict(options, security_rules=rules)
+    expected = sequential(dense_log, **options)
+    assert expected['security']['stats'].get('Rate Flood')
+    assert parallel.analyze_file(dense_log, workers=workers, **options).get_statistics() == expected
+
+def test_line_on_range_boundary(tmp_path, rules, monkeypatch):
+    monkeypatch.setattr(parallel, 'MIN_PARALLEL_BYTES', 0)
+    lines = [line.encode() + b'\n' for line in LogGenerator(seed=13, days=0.01).lines(6000)]
+    first, second = b''.join(lines[:3000]), b''.join(lines[3000:])
+    # Pad the shorter half with an unparsable line so the halves are the same size
+    gap = abs(len(first) - len(second))
+    padding = b'x' * (gap - 1) + b'\n' if gap else b''
+    if len(first) < len(second):
+        first += padding
+    else:
+        second += padding
+    path = tmp_path / 'boundary.log'
+    path.write_bytes(first + second)
+    path = str(path)
+
+    # The split point is exactly the start of the second half's first line
+    assert split_ranges(path, 2) == [(0, len(first)), (len(first), len(first) + len(second))]
+    options = {'security_rules': rules}
+    assert parallel.analyze_file(path, workers=2, **options).get_statistics() == sequential(path, **options)
+
+def test_timed_format_matches_sequential(tmp_path, monkeypatch):
+    monkeypatch.setattr(parallel, 'MIN_PARALLEL_BYTES', 0)
+    monkeypatch.setattr(log_parser, '_active_format', log_parser.get_log_format('timed'))
+    path = str(tmp_path / 'timed.log')
+    LogGenerator(seed=14, timed=True).write(path, 20000)
+    analyzer = LogAnalyzer()
+    for record in iter_records(path):
+        analyzer.process_record(record)
+    expected = analyzer.get_statistics()
+    # More endpoints than are reported, so which ones are kept matters
+    assert len(analyzer.latency.paths.sketches) > latency.MAX_KEYS
+    assert len(expected['latency']['slowest_paths']) == 10
+    for workers in (2, 3):
+        assert parallel.analyze_file(path, workers=workers).get_statistics() == expected
+
@@ -0,0 +1,113 @@
+import json
+
+from log_parser import parse_log_line
+from log_reader import iter_records
+from loggen import LogGenerator
+from rates import RateDetector, SlidingWindowCounter
+import parallel
+import sessions
+
+# Low enough for the busiest IPs of a dense generated log to flood
+LIMITS = {'flood_threshold': 30, 'flood_window': 10, 'auth_threshold': 4, 'auth_window': 60}
+
+def dense_lines(count=20000, seed=4):
+    # About 25 lines a second
+    return list(LogGenerator(seed=seed, days=0.01).lines(count))
+
+def rate_threats(detector, records, first=0):
+    found = []
+    for i, record in enumerate(records, first):
+        for threat in detector.check(record) or []:
+            found.append((i, threat['type'], threat['evidence']))
+    return found
+
+def test_warm_up_continues_a_sequential_pass():
+    records = [r for r in map(parse_log_line, dense_lines()) if r]
+    expected = rate_threats(RateDetector(**LIMITS), records)
+    assert expected
+    trusted = 0
+    for split in range(1000, len(records), 1700):
+        for lookback in (50, 500, 5000):
+            detector = RateDetector(**LIMITS)
+            if detector.warm_up(records[max(0, split - lookback):split]):
+                trusted += 1
+                assert rate_threats(detector, records[split:], split) == [t for t in expected if t[0] >= split]
+    assert trusted
+
+def test_short_warm_up_is_not_trusted():
+    records = [r for r in map(parse_log_line, dense_lines()) if r]
+    assert not RateDetector(**LIMITS).warm_up(records[5000:5050])
+    assert not RateDetector(**LIMITS).warm_up([])
+
+def test_rate_windows_span_rotated_files(tmp_path):
+    rules = str(tmp_path / 'rules.json')
+    with open(rules, 'w') as f:
+        json.dump({'rate_limits': LIMITS}, f)
+    lines = dense_lines()
+    whole = str(tmp_path / 'whole.log')
+    paths = [str(tmp_path / 'access.log.1'), str(tmp_path / 'access.log')]
+    for path, part in ((whole, lines), (paths[0], lines[:12000]), (paths[1], lines[12000:])):
+        with open(path, 'w') as f:
+            f.write('\n'.join(part) + '\n')
+
+    detector = RateDetector(**LIMITS)
+    parallel.warm_up_rates(detector, [(paths[0], None)])
+    expected = RateDetector(**LIMITS)
+    for record in iter_records(paths[0]):
+        expected.check(record)
+    records = list(iter_records(paths[1]))
+    assert rate_threats(detector, records) == rate_threats(expected, records)
+
+    cache = sessions.AnalysisSessionCache()
+    assert cache.analyze_many(paths, security_rules=rules) == cache.analyze(whole, security_rules=rules)
+    assert parallel.analyze_files(paths, security_rules=rules).get_statistics() == \
+        parallel.analyze_files([whole], security_rules=rules).get_statistics()
+
+def login_lines(request, status, count=50, ip='203.0.113.9'):
+    return [f'{ip} - - [20/Jan/2026:00:00:{i:02d} +0900] "{request} HTTP/1.1" {status} 120 "-" "curl/8.0"'
+            for i in range(count)]
+
+def auth_threats(lines):
+    detector = RateDetector(**LIMITS)
+    return [t for t in rate_threats(detector, map(parse_log_line, lines)) if t[1] == 'Auth Brute Force']
+
+def test_successful_logins_are_not_brute_force():
+    assert not auth_threats(login_lines('POST /oauth/token', 200))
+    assert not auth_threats(login_lines('POST /api/session', 201))
+    assert not auth_threats(login_lines('POST /auth/refresh', 302))
+    # Failures outside login endpoints aren't login attempts either
+    assert not auth_threats(login_lines('GET /admin/settings', 403))
+    assert not auth_threats(login_lines('POST /api/orders', 401))
+
+def test_failed_logins_are_brute_force():
+    assert auth_threats(login_lines('POST /oauth/token', 401))
+    assert auth_threats(login_lines('GET /login?next=/', 403))
+    # WordPress answers a failed login with the form again
+    assert auth_threats(login_lines('POST /wp-login.php', 200))
+    assert not auth_threats(login_lines('GET /wp-login.php', 200))
+
+def test_active_flood_survives_key_pressure():
+    counter = SlidingWindowCounter(10, max_keys=64)
+    for step in range(2000):
+        ts = 1000 + step / 100
+        entry = counter.add('flooder', ts)
+        # Fresh keys within the window, so the sweep can't just drop idle ones
+        for i in range(3):
+            counter.add(f'visitor-{step}-{i}', ts)
+        assert len(counter) <= 64
+    assert counter.keys['flooder'] is entry
+    # Exactly the events of the last window (10 seconds, 100 a second), give or take a bucket
+    assert 900 <= entry[1] <= 1100
+
+def test_flood_is_reported_once_under_key_pressure():
+    detector = RateDetector(flood_threshold=50, flood_window=10, max_keys=64)
+    floods = 0
+    for step in range(3000):
+        ts = 1000 + step / 50
+        for ip in ['198.51.100.7'] + [f'10.{step % 250}.{step // 250}.{i}' for i in range(3)]:
+            line = f'{ip} - - [20/Jan/2026:00:00:00 +0900] "GET / HTTP/1.1" 200 1 "-" "-"'
+            record = parse_log_line(line)
+            record.timestamp = ts
+            floods += sum(1 for t in detector.check(record) or [] if t['type'] == 'Rate Flood')
+    assert floods == 1
+
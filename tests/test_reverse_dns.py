@@ -0,0 +1,116 @@
+import json
+import time
+import threading
+
+from reverse_dns import ReverseDNSCache
+
+class StubResolver:
+    """
+    Resolver answering from a dict and counting calls per IP. While `gate` is cleared,
+    lookups block until it is set.
+    """
+    def __init__(self, answers=None):
+        self.answers = answers or {}
+        self.calls = {}
+        self.gate = threading.Event()
+        self.gate.set()
+        self.lock = threading.Lock()
+
+    def __call__(self, ip):
+        with self.lock:
+            self.calls[ip] = self.calls.get(ip, 0) + 1
+        self.gate.wait(5)
+        return self.answers.get(ip)
+
+def test_answers_are_cached_until_ttl_expires():
+    resolver = StubResolver({'192.0.2.1': 'a.example'})
+    cache = ReverseDNSCache(ttl=0.2, resolve=resolver)
+    assert cache.lookup('192.0.2.1') == 'a.example'
+    assert cache.lookup('192.0.2.1') == 'a.example'
+    assert resolver.calls['192.0.2.1'] == 1
+    time.sleep(0.3)
+    assert cache.lookup('192.0.2.1') == 'a.example'
+    assert resolver.calls['192.0.2.1'] == 2
+
+def test_failed_lookups_are_cached_for_negative_ttl():
+    resolver = StubResolver()
+    cache = ReverseDNSCache(ttl=60, negative_ttl=0.2, resolve=resolver)
+    assert cache.lookup('192.0.2.2') is None
+    assert cache.lookup('192.0.2.2') is None
+    assert resolver.calls['192.0.2.2'] == 1
+    assert cache.get('192.0.2.2') == (True, None)
+    time.sleep(0.3)
+    assert cache.get('192.0.2.2') == (False, None)
+    cache.lookup('192.0.2.2')
+    assert resolver.calls['192.0.2.2'] == 2
+
+def test_slow_lookup_times_out_and_lands_in_cache_later():
+    resolver = StubResolver({'192.0.2.3': 'slow.example'})
+    resolver.gate.clear()
+    cache = ReverseDNSCache(timeout=0.1, resolve=resolver)
+    began = time.time()
+    assert cache.lookup('192.0.2.3') is None
+    assert time.time() - began < 1
+    resolver.gate.set()
+    cache.pool.shutdown(wait=True)
+    assert cache.get('192.0.2.3') == (True, 'slow.example')
+
+def test_concurrent_lookups_of_one_ip_share_a_resolution():
+    resolver = StubResolver({'192.0.2.4': 'shared.example'})
+    resolver.gate.clear()
+    cache = ReverseDNSCache(resolve=resolver)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.lookup('192.0.2.4'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    resolver.gate.set()
+    for thread in threads:
+        thread.join()
+    assert results == ['shared.example'] * 8
+    assert resolver.calls['192.0.2.4'] == 1
+
+def test_non_addresses_are_not_resolved():
+    resolver = StubResolver()
+    cache = ReverseDNSCache(resolve=resolver)
+    assert cache.lookup_many(['example.com']) == {'example.com': None}
+    assert resolver.calls == {}
+
+def test_cache_survives_a_restart(tmp_path):
+    cache_file = str(tmp_path / 'rdns.json')
+    resolver = StubResolver({'192.0.2.5': 'kept.example'})
+    cache = ReverseDNSCache(cache_file=cache_file, resolve=resolver)
+    assert cache.lookup_many(['192.0.2.5', '192.0.2.6']) == {'192.0.2.5': 'kept.example', '192.0.2.6': None}
+
+    restarted = ReverseDNSCache(cache_file=cache_file, resolve=StubResolver())
+    assert restarted.get('192.0.2.5') == (True, 'kept.example')
+    assert restarted.get('192.0.2.6') == (True, None)
+    assert restarted.resolve.calls == {}
+
+def test_expired_entries_are_not_loaded(tmp_path):
+    cache_file = tmp_path / 'rdns.json'
+    cache_file.write_text(json.dumps({'192.0.2.7': ['old.example', time.time() - 1]}))
+    cache = ReverseDNSCache(cache_file=str(cache_file), resolve=StubResolver())
+    assert cache.get('192.0.2.7') == (False, None)
+
+def test_concurrent_batches_save_safely(tmp_path):
+    cache_file = tmp_path / 'rdns.json'
+    answers = {f'192.0.2.{i}': f'host{i}.example' for i in range(1, 101)}
+    cache = ReverseDNSCache(cache_file=str(cache_file), resolve=StubResolver(answers))
+    errors = []
+
+    def batch(ips):
+        try:
+            cache.lookup_many(ips)
+        except Exception as e:
+            errors.append(e)
+
+    ips = sorted(answers)
+    threads = [threading.Thread(target=batch, args=(ips[i::10],)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert json.loads(cache_file.read_text()).keys() == answers.keys()
+    assert [p.name for p in tmp_path.iterdir()] == ['rdns.json']
@@ -0,0 +1,85 @@
+import threading
+
+from analyzer import LogAnalyzer
+from log_reader import iter_records
+from loggen import LogGenerator
+import sampling
+from sampling import SampledAnalysis, BlockSums, measurement_sums, add_measurement, ratio_interval
+import security
+
+def write_log(tmp_path, count=6000):
+    path = str(tmp_path / 'access.log')
+    with open(path, 'w') as f:
+        f.write('\n'.join(LogGenerator(seed=9).lines(count)) + '\n')
+    return path
+
+def test_refine_reaches_the_exact_totals(tmp_path):
+    path = write_log(tmp_path)
+    sampler = SampledAnalysis([path], block_size=16 * 1024, seed=1)
+    sampler.run(0)
+    assert not sampler.exhausted
+    published = []
+    sampler.refine(threading.Event(), published.append, interval=0)
+    assert sampler.exhausted
+    final = published[-1]
+    assert final['preview']['exact']
+    exact = LogAnalyzer()
+    for record in iter_records(path):
+        exact.process_record(record)
+    assert final['total_requests'] == exact.total_requests
+    assert final['total_bytes'] == exact.total_bytes
+
+def test_refine_stops_when_asked(tmp_path):
+    sampler = SampledAnalysis([write_log(tmp_path)], block_size=16 * 1024, seed=1)
+    stop = threading.Event()
+    stop.set()
+    published = []
+    sampler.refine(stop, published.append)
+    assert not published and sampler.position == 0
+
+def test_blocks_share_one_security_analyzer(tmp_path, monkeypatch):
+    sampler = SampledAnalysis([write_log(tmp_path)], block_size=16 * 1024, seed=1)
+    built = []
+    original = security.SecurityAnalyzer.__init__
+    def counting(self, *args, **kwargs):
+        built.append(self)
+        original(self, *args, **kwargs)
+    monkeypatch.setattr(security.SecurityAnalyzer, '__init__', counting)
+    sampler.sample()
+    sampler.sample()
+    assert not built
+    assert sampler.security.ua_classifier.cache
+    # The shared detector, reset for every block, isn't handed over to the merged analyzer
+    assert sampler.analyzer.security_analyzer.rate_detector is not sampler.security.rate_detector
+
+def test_ratio_interval_from_running_sums():
+    values = [120, 80, 95, 130, 60, 101]
+    sizes = [64000, 61000, 65500, 70000, 40000, 64100]
+    total = 2000000
+    blocks = BlockSums()
+    sums = measurement_sums()
+    for value, size in zip(values, sizes):
+        blocks.add(size)
+        add_measurement(sums, value, size)
+    ratio = sum(values) / sum(sizes)
+    variance = sum((value - ratio * size) ** 2 for value, size in zip(values, sizes)) / (len(sizes) - 1)
+    error = 1.96 * total * (variance * (1 - sum(sizes) / total) / len(sizes)) ** 0.5 / (sum(sizes) / len(sizes))
+    estimate, low, high = ratio_interval(sums, blocks, total)
+    assert abs(estimate - ratio * total) < 1e-6
+    assert abs(high - estimate - error) < 1e-6 and abs(estimate - low - error) < 1e-6
+
+def test_candidates_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(sampling, 'MAX_CANDIDATES', 20)
+    path = write_log(tmp_path)
+    sampler = SampledAnalysis([path], block_size=16 * 1024, seed=2)
+    while not sampler.exhausted:
+        sampler.sample()
+        assert len(sampler.ips) <= 40 and len(sampler.paths) <= 40
+    estimate = sampler.estimate()
+    # Every block read: each interval is the exact count, dropped candidates included
+    for key in ('top_ips', 'top_paths'):
+        for name, count in estimate[key]:
+            assert estimate['preview']['intervals'][key][name] == [count, count]
+    for code, count in estimate['status_codes'].items():
+        assert estimate['preview']['intervals']['status_codes'][code] == [count, count]
+
@@ -0,0 +1,32 @@
+from log_parser import parse_log_line
+from security import SecurityAnalyzer
+
+def record(request, user_agent='Mozilla/5.0'):
+    return parse_log_line(f'203.0.113.9 - - [10/Oct/2023:13:55:36 +0000] "{request}" 200 512 "-" "{user_agent}"\n')
+
+def threat_types(threats):
+    return [threat['type'] for threat in threats or []]
+
+def test_prefilter_checks_non_ascii_requests():
+    security = SecurityAnalyzer()
+    assert threat_types(security.check_request(record('GET /café/.env HTTP/1.1'))) == ['Sensitive File Access']
+    assert security.check_request(record('GET /café/menu HTTP/1.1')) is None
+
+def test_prefilter_folds_like_ignorecase():
+    # U+0130 and U+017F match "i" and "s" under re.IGNORECASE, but lower() doesn't map them to ASCII
+    security = SecurityAnalyzer()
+    threats = security.check_request(record('GET /?q=UNİON SELECT 1 HTTP/1.1'))
+    assert threat_types(threats) == ['SQL Injection']
+    threats = security.check_request(record('GET /item?id=1 union ſelect 2 HTTP/1.1'))
+    assert threat_types(threats) == ['SQL Injection']
+
+def test_prefilter_and_signatures_agree_on_generated_log():
+    from loggen import LogGenerator
+    security = SecurityAnalyzer()
+    for line in LogGenerator(seed=3, attack_fraction=0.3).lines(2000):
+        parsed = parse_log_line(line + '\n')
+        if parsed is None:
+            continue
+        expected = [sig['type'] for sig in security.request_signatures if sig['pattern'].search(parsed.request)]
+        found = [t['type'] for t in security.check_request(parsed) or [] if t['evidence'] == parsed.request[:100]]
+        assert found == expected
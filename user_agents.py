@@ -0,0 +1,129 @@
+BOT_KEYWORDS = [
+    'bot', 'crawl', 'spider', 'slurp', 'mediapartners', 'python-requests',
+    'curl', 'wget', 'ahrefs', 'semrush', 'mj12bot', 'check.9tb.org'
+]
+
+# (family, lowercase tokens), first match wins
+BROWSER_FAMILIES = [
+    ('Edge', ['edg/', 'edge/', 'edga/', 'edgios/']),
+    ('Opera', ['opr/', 'opera']),
+    ('Samsung Internet', ['samsungbrowser']),
+    ('Firefox', ['firefox/', 'fxios/']),
+    ('Chrome', ['chrome/', 'crios/']),
+    ('Safari', ['safari/']),
+    ('Internet Explorer', ['msie ', 'trident/']),
+    ('curl', ['curl']),
+    ('Wget', ['wget']),
+    ('Python', ['python-requests', 'python-urllib', 'aiohttp'])
+]
+
+OS_FAMILIES = [
+    ('Windows', ['windows']),
+    ('Android', ['android']),
+    ('iOS', ['iphone', 'ipad', 'ipod']),
+    ('macOS', ['macintosh', 'mac os x']),
+    # The platform token is "CrOS <arch>"; a bare 'cros' would also match inside 'microsoft'
+    ('ChromeOS', ['; cros ', '(cros ']),
+    ('Linux', ['linux', 'x11'])
+]
+
+# The non-ASCII characters that re.IGNORECASE matches to an ASCII letter but str.lower()
+# doesn't lower to one: dotted/dotless I, long S and the Kelvin sign
+PREFILTER_FOLDS = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u212a': 'k'})
+
+def prefilter_text(text, text_lower):
+    """
+    The form of `text` that keyword prefilters (see security.build_prefilter) search:
+    lowercase, with non-ASCII characters that IGNORECASE signatures treat as ASCII letters
+    folded to them, so a prefilter never rejects what its signatures would match.
+    """
+    if text.isascii():
+        return text_lower
+    return text.translate(PREFILTER_FOLDS).lower()
+
+def _family(ua_lower, families):
+    for name, tokens in families:
+        if any(token in ua_lower for token in tokens):
+            return name
+    return 'Other'
+
+class UAInfo:
+    """
+    Everything derived from one user agent string.
+    `threats` lists the user-agent signatures (see SecurityAnalyzer) it matches.
+    """
+    __slots__ = ('is_bot', 'threats', 'browser', 'os', 'device')
+
+    def __init__(self, is_bot, threats, browser, os, device):
+        self.is_bot = is_bot
+        self.threats = threats
+        self.browser = browser
+        self.os = os
+        self.device = device
+
+class UAClassifier:
+    """
+    Classifies user agents once per distinct string: bot status, scanner signatures
+    and browser/OS/device family. Real traffic has a few thousand distinct user agents
+    across millions of lines, so nearly every call is a dict hit.
+    """
+    def __init__(self, signatures=(), prefilter=None, unfiltered=(), bot_keywords=BOT_KEYWORDS, max_entries=50000):
+        self.signatures = signatures    # Signatures checked against the user agent
+        self.prefilter = prefilter      # Keyword prefilter over them (see security.build_prefilter)
+        self.unfiltered = unfiltered    # Signatures without keywords, always checked
+        self.bot_keywords = bot_keywords
+        self.max_entries = max_entries
+        self.cache = {}
+
+    def classify(self, ua):
+        info = self.cache.get(ua)
+        if info is None:
+            if len(self.cache) >= self.max_entries:
+                self.cache.clear()
+            info = self.cache[ua] = self._classify(ua)
+        return info
+
+    def _classify(self, ua):
+        ua_lower = ua.lower()
+        is_bot = ua_lower != '-' and any(keyword in ua_lower for keyword in self.bot_keywords)
+
+        if self.prefilter and self.prefilter.search(prefilter_text(ua, ua_lower)):
+            signatures = self.signatures
+        else:
+            signatures = self.unfiltered
+        threats = [sig for sig in signatures if sig['pattern'].search(ua)]
+
+        if ua_lower == '-' or not ua_lower:
+            device = 'Unknown'
+        elif is_bot:
+            device = 'Bot'
+        elif 'ipad' in ua_lower or 'tablet' in ua_lower or ('android' in ua_lower and 'mobile' not in ua_lower):
+            device = 'Tablet'
+        elif 'mobi' in ua_lower or 'iphone' in ua_lower or 'ipod' in ua_lower:
+            device = 'Mobile'
+        else:
+            device = 'Desktop'
+
+        return UAInfo(is_bot, threats, _family(ua_lower, BROWSER_FAMILIES), _family(ua_lower, OS_FAMILIES), device)
+
+    def breakdown(self, ua_counts):
+        """
+        Aggregates (user_agent, count) pairs into bot/human and family counts.
+        """
+        traffic = {'bots': 0, 'humans': 0}
+        devices = {}
+        browsers = {}
+        systems = {}
+        for ua, count in ua_counts:
+            info = self.classify(ua)
+            traffic['bots' if info.is_bot else 'humans'] += count
+            devices[info.device] = devices.get(info.device, 0) + count
+            browsers[info.browser] = browsers.get(info.browser, 0) + count
+            systems[info.os] = systems.get(info.os, 0) + count
+        by_count = lambda counts: dict(sorted(counts.items(), key=lambda item: item[1], reverse=True))
+        return {
+            'bot_traffic': traffic,
+            'device_families': by_count(devices),
+            'browser_families': by_count(browsers),
+            'os_families': by_count(systems)
+        }